@@ -19,6 +19,78 @@ class Settings(BaseSettings):
     highlevel_api_key: str = ""
     highlevel_base_url: str = "https://services.leadconnectorhq.com"
     highlevel_location_id: str = ""
+    # Cola de procesamiento de documentos (tabla document_jobs)
+    document_worker_embedded: bool = True  # Ejecutar un worker dentro del proceso de la API
+    document_worker_concurrency: int = 1
+    document_worker_poll_seconds: float = 2.0
+    document_job_lease_seconds: int = 120
+    document_job_max_attempts: int = 3
+    document_job_backoff_seconds: int = 30
+    document_job_requeue_interval_seconds: float = 60.0  # Barrido periódico de leases expirados
+    # Embeddings
+    embedding_model: str = "all-MiniLM-L6-v2"  # Modelo activo (ver app/lib/embeddings/registry.py)
+    embedding_shadow_models: str = ""  # Modelos en construcción con dual-write, separados por comas
+    embedding_backend: str = "sentence-transformers"  # "sentence-transformers" u "onnx"
+    embedding_onnx_model_dir: str = ""  # Vacío: descargar onnx/model.onnx de Hugging Face
+    embedding_onnx_quantize: bool = False  # Cuantización dinámica int8
+    embedding_onnx_threads: int = 0  # Threads intra-op de ONNX Runtime (0 = por defecto)
+    embedding_cache_enabled: bool = True  # Caché persistente de embeddings de chunks (tabla embedding_cache)
+    embedding_batch_size: int = 32  # Máximo de textos por batch en generate_batch
+    embedding_batch_token_budget: int = 4096  # Tokens (con padding) por batch
+    embedding_warmup_timeout_seconds: float = 0.0  # Esperar al modelo en el arranque (0 = no bloquear)
+    embedding_ready_wait_seconds: float = 2.0  # Espera máxima por turno de chat si el modelo sigue cargando
+    embedding_batcher_max_batch: int = 32  # Consultas de chat concurrentes codificadas juntas
+    embedding_batcher_max_wait_ms: float = 5.0  # Latencia máxima añadida para llenar un batch
+    # Chat
+    chat_intent_routing_enabled: bool = True  # Saltar memoria/RAG/web en turnos conversacionales
+    chat_web_similarity_threshold: float = 0.6  # Por debajo de esta similitud RAG se complementa con web
+    personalized_advice_keywords_file: str = ""  # Sustituye la lista de palabras clave de asesoría (una por línea)
+    personalized_advice_reload_seconds: float = 5.0  # Cada cuánto se comprueba si el fichero cambió
+    chat_rate_limit_enabled: bool = True
+    chat_rate_limit_per_minute: float = 20.0  # Ritmo sostenido de mensajes por usuario
+    chat_rate_limit_burst: int = 5  # Mensajes seguidos antes de aplicar el ritmo
+    chat_max_concurrent_streams: int = 2  # Respuestas en curso simultáneas por usuario
+    chat_rate_limit_backend: str = "memory"  # "memory" o "supabase" (varias réplicas)
+    sse_heartbeat_seconds: float = 10.0  # Comentario ": ping" si el stream lleva este tiempo en silencio
+    sse_disconnect_poll_seconds: float = 1.0  # Cada cuánto se comprueba si el cliente sigue conectado
+    sse_coalesce_max_chars: int = 64  # Agrupar deltas del LLM hasta este tamaño...
+    sse_coalesce_max_delay_ms: float = 30.0  # ...o como mucho este retraso
+    chat_stream_buffer_events: int = 2048  # Frames guardados por respuesta para reanudarla
+    chat_stream_resume_grace_seconds: float = 15.0  # Espera a una reconexión antes de cancelar la generación
+    chat_stream_retention_seconds: float = 60.0  # Tiempo que se puede reanudar una respuesta terminada
+    prompt_max_tokens: int = 6000  # Presupuesto total del prompt del sistema
+    prompt_tokenizer: str = "deepseek-ai/DeepSeek-V3"  # tokenizer.json en Hugging Face; vacío = len/4
+    # Control de admisión de llamadas al LLM (por proceso)
+    llm_max_inflight: int = 16
+    llm_max_queue: int = 32
+    llm_queue_timeout_seconds: float = 5.0
+    # Contabilidad de uso del LLM (precios en USD por millón de tokens, deepseek-chat)
+    llm_usage_flush_seconds: float = 30.0
+    llm_price_input_per_mtok: float = 0.28
+    llm_price_cached_input_per_mtok: float = 0.028
+    llm_price_output_per_mtok: float = 0.42
+    # Búsqueda web
+    web_search_provider: str = "duckduckgo"  # "duckduckgo" o "stub" (tests / desarrollo sin red)
+    web_search_timeout_seconds: float = 3.0
+    web_search_cache_ttl_seconds: float = 900.0
+    web_search_cache_size: int = 500
+    web_search_max_concurrency: int = 4
+    web_search_speculative: bool = True  # Lanzar la búsqueda web en paralelo con memoria y RAG
+    web_search_deadline_seconds: float = 1.5  # Desde el inicio del turno; después se responde sin web
+    # Retrieval RAG
+    rag_hybrid_enabled: bool = True  # Fusionar búsqueda vectorial y full-text (tsvector 'spanish')
+    rag_rrf_k: int = 60  # Constante de Reciprocal Rank Fusion
+    rag_lexical_match_confidence: float = 0.75  # Confianza de un chunk que contiene todos los términos
+    rag_lexical_min_terms: int = 2  # Términos de la query (sin stopwords) necesarios para esa confianza
+    rag_reranker_enabled: bool = False  # Re-ranking con cross-encoder (CPU)
+    rag_reranker_model: str = "cross-encoder/mmarco-mMiniLMv2-L12-H384-v1"  # Multilingüe
+    rag_reranker_budget_ms: float = 150.0  # Presupuesto por query; si se agota, orden original
+    rag_reranker_batch_size: int = 16
+    rag_reranker_cache_size: int = 5000
+    rag_reranker_top_k: int = 5  # Chunks que se conservan tras re-rankear
+    rag_mmr_enabled: bool = True  # Maximal Marginal Relevance sobre los candidatos
+    rag_mmr_lambda: float = 0.7  # 1.0 = solo relevancia, 0.0 = solo diversidad
+    rag_merge_adjacent_chunks: bool = True  # Unir chunks contiguos del mismo documento
 
     model_config = SettingsConfigDict(
         # Buscar .env en el directorio raíz del proyecto (dos niveles arriba desde backend/app/)
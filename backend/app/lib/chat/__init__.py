@@ -1,9 +1,14 @@
 """Módulo principal de chat con función sendMessage unificada."""
 
 from .message_handler import send_message, SendMessageResult
-
-__all__ = ["send_message", "SendMessageResult"]
-
-
-
-
+from .pipeline import ChatPipeline, ChatTurn, PipelineError, PipelineStage, get_chat_pipeline
+
+__all__ = [
+    "send_message",
+    "SendMessageResult",
+    "ChatPipeline",
+    "ChatTurn",
+    "PipelineError",
+    "PipelineStage",
+    "get_chat_pipeline",
+]
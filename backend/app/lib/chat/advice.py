@@ -0,0 +1,221 @@
+"""Detección de solicitudes de asesoría personalizada y respuesta automática con enlace de reserva.
+
+Las palabras clave se compilan una sola vez en una expresión regular con forma de trie
+(prefijos comunes factorizados), así que detectar es una sola pasada sobre el mensaje
+normalizado en lugar de un escaneo por palabra clave:
+
+- Normalización Unicode NFKD sin marcas diacríticas ni mayúsculas ("Asesoría" == "asesoria",
+  "acompañar" == "acompanar").
+- Límites de palabra: "abogado" no coincide dentro de otra palabra; se admite el plural
+  ("abogados").
+
+La lista se puede sustituir por un fichero (una palabra clave por línea, ``#`` para
+comentarios) indicado en PERSONALIZED_ADVICE_KEYWORDS_FILE. El fichero se recarga sin
+reiniciar cuando cambia, comprobándolo como mucho cada PERSONALIZED_ADVICE_RELOAD_SECONDS.
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+from typing import Dict, Iterable, List, Optional
+from loguru import logger
+
+BOOKING_LINK = "https://api.elevabuilds.com/widget/bookings/asesoria-personal-91d23aa6-9776-40cb-bf3e-8a7156ef092365i58zoyat7y"
+
+# Palabras clave para detectar solicitudes de asesoría personalizada
+PERSONALIZED_ADVICE_KEYWORDS = [
+    "asesoría personalizada",
+    "asesoria personalizada",
+    "asesor personal",
+    "asesor personalizado",
+    "asesoría individual",
+    "asesoria individual",
+    "asesor individual",
+    "asesoría privada",
+    "asesoria privada",
+    "asesor privado",
+    "consulta personalizada",
+    "consulta personal",
+    "consulta individual",
+    "evaluar mi caso",
+    "evaluar mi situación",
+    "mi caso específico",
+    "mi situación particular",
+    "análisis de mi caso",
+    "analisis de mi caso",
+    "revisar mis documentos",
+    "revisar mi documentación",
+    "ayuda con mis trámites",
+    "ayuda con mis tramites",
+    "acompañamiento",
+    "acompañar",
+    "acompañar en el proceso",
+    "estrategia migratoria",
+    "estrategias migratorias",
+    "plan personalizado",
+    "plan personal",
+    "asesoría legal",
+    "asesoria legal",
+    "abogado",
+    "abogada",
+    "asesor legal",
+    "asesor jurídico",
+    "asesor juridico",
+]
+
+
+_COMBINING_MARKS = re.compile("[\u0300-\u036f]+")
+_WORD_CHAR = re.compile(r"\w")
+
+
+def fold(text: str) -> str:
+    """Minúsculas y sin tildes ni diacríticos (descomposición NFKD)."""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return _COMBINING_MARKS.sub("", unicodedata.normalize("NFKD", text))
+
+
+def _trie_pattern(node: Dict[str, dict]) -> str:
+    """Expresión regular equivalente a un trie de caracteres ("" marca fin de palabra clave)."""
+    branches = [
+        (r"\s+" if char == " " else re.escape(char)) + _trie_pattern(child)
+        for char, child in sorted(node.items())
+        if char
+    ]
+    if not branches:
+        return ""
+    if "" in node:
+        return "(?:" + "|".join(branches) + ")?"
+    if len(branches) == 1:
+        return branches[0]
+    return "(?:" + "|".join(branches) + ")"
+
+
+class KeywordMatcher:
+    """Conjunto de palabras clave compilado en una sola expresión regular."""
+
+    def __init__(self, keywords: Iterable[str]):
+        """Compila las palabras clave.
+
+        Args:
+            keywords: Palabras o frases; se normalizan con ``fold`` y se eliminan duplicados.
+        """
+        self.keywords: List[str] = sorted({" ".join(fold(keyword).split()) for keyword in keywords} - {""})
+        self._pattern: Optional[re.Pattern] = None
+        if self.keywords:
+            trie: Dict[str, dict] = {}
+            for keyword in self.keywords:
+                node = trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                node[""] = {}
+            # Sin límite de palabra al inicio: así el motor puede saltar a las posiciones que
+            # empiezan por una letra inicial de alguna palabra clave; el inicio se valida en search
+            self._pattern = re.compile(_trie_pattern(trie) + r"(?:e?s)?\b")
+
+    def search(self, text: str) -> Optional[str]:
+        """Devuelve el texto (normalizado) de la primera palabra clave encontrada, o None."""
+        if self._pattern is None:
+            return None
+        text = fold(text)
+        position = 0
+        while True:
+            match = self._pattern.search(text, position)
+            if match is None:
+                return None
+            start = match.start()
+            if start == 0 or not _WORD_CHAR.match(text, start - 1):
+                return match.group(0)
+            position = start + 1
+
+
+class _MatcherCache:
+    """Matcher vigente, recompilado cuando cambia el fichero de palabras clave."""
+
+    def __init__(self):
+        self._matcher: Optional[KeywordMatcher] = None
+        self._source: Optional[tuple] = None  # (ruta, mtime) con la que se compiló
+        self._checked_at = 0.0
+        self._lock = threading.Lock()
+
+    def get(self) -> KeywordMatcher:
+        from ...config import get_settings
+
+        settings = get_settings()
+        now = time.monotonic()
+        if self._matcher is not None and now - self._checked_at < settings.personalized_advice_reload_seconds:
+            return self._matcher
+
+        with self._lock:
+            self._checked_at = now
+            path = settings.personalized_advice_keywords_file
+            try:
+                source = (path, os.stat(path).st_mtime) if path else (None, None)
+            except OSError as e:
+                if self._matcher is not None:
+                    return self._matcher
+                logger.warning("Cannot read advice keywords file {}: {}; using built-in keywords", path, e)
+                source = (None, None)
+            if self._matcher is not None and source == self._source:
+                return self._matcher
+
+            keywords = PERSONALIZED_ADVICE_KEYWORDS
+            if source[0]:
+                try:
+                    with open(path, encoding="utf-8") as f:
+                        keywords = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+                except OSError as e:
+                    logger.warning("Cannot read advice keywords file {}: {}", path, e)
+                    if self._matcher is not None:
+                        return self._matcher
+            self._matcher = KeywordMatcher(keywords)
+            self._source = source
+            logger.info(
+                "Personalized advice matcher compiled: {} keywords from {}",
+                len(self._matcher.keywords),
+                source[0] or "built-in list",
+            )
+            return self._matcher
+
+
+_matcher_cache = _MatcherCache()
+
+
+def get_advice_matcher() -> KeywordMatcher:
+    """Matcher de solicitudes de asesoría personalizada (recargado si cambia la configuración)."""
+    return _matcher_cache.get()
+
+
+def detect_personalized_advice_request(message: str) -> bool:
+    """Detecta si el mensaje del usuario solicita asesoría personalizada.
+    
+    Args:
+        message: Contenido del mensaje del usuario.
+        
+    Returns:
+        True si se detecta una solicitud de asesoría personalizada, False en caso contrario.
+    """
+    keyword = get_advice_matcher().search(message)
+    if keyword:
+        logger.info("Detected personalized advice request with keyword: {}", keyword)
+        return True
+    return False
+
+
+def get_personalized_advice_response() -> str:
+    """Genera la respuesta automática para solicitudes de asesoría personalizada.
+    
+    Returns:
+        Mensaje con el enlace de reserva de asesoría personalizada.
+    """
+    return (
+        "Entiendo que necesitas una asesoría más detallada y personalizada. "
+        "Para evaluar tu caso específico, analizar documentos, o recibir orientación personalizada "
+        "sobre estrategias migratorias o trámites, te recomiendo agendar una sesión individual con nuestros asesores.\n\n"
+        f"Puedes reservar tu asesoría personalizada aquí: {BOOKING_LINK}\n\n"
+        "Mientras tanto, puedo ayudarte con información general sobre universidades, programas de estudio, "
+        "requisitos de admisión y procesos académicos en España."
+    )
@@ -0,0 +1,222 @@
+"""Clasificación de intención previa a la recuperación de contexto.
+
+Decide qué fuentes de contexto necesita un turno antes de hacer I/O:
+
+- ``chitchat``: saludos, agradecimientos, despedidas ("hola", "gracias ✨").
+  No se consulta memoria, RAG ni web.
+- ``personal``: el usuario habla de sí mismo, de su día o de cómo se siente.
+  Solo memoria (semántica y episódica).
+- ``informational``: preguntas sobre trámites, estudios, visados, etc.
+  Memoria, RAG y, si hace falta, web.
+
+Primero se aplican reglas por palabras clave (sin coste). Si no deciden, un
+clasificador por centroides de embeddings compara la consulta con frases
+prototipo de cada intención. Ante la duda se elige ``informational``.
+"""
+
+import re
+import threading
+import unicodedata
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence
+
+import numpy as np
+from loguru import logger
+
+from ..embeddings import get_embedding_generator
+
+CHITCHAT = "chitchat"
+PERSONAL = "personal"
+INFORMATIONAL = "informational"
+
+# Palabras que por sí solas forman un mensaje conversacional (sin tildes salvo la ñ, en
+# minúsculas). Sin palabras funcionales ("y", "si", "que", "tu"...): con ellas preguntas
+# de seguimiento como "y si no" se tomarían por charla.
+CHITCHAT_WORDS = {
+    "hola", "holi", "holaa", "buenas", "buenos", "dias", "tardes", "noches", "hey", "hi", "hello",
+    "gracias", "muchas", "mil", "thanks", "genial", "perfecto", "vale", "ok", "okay", "okey",
+    "bien", "super", "guay", "chevere", "bacan", "jaja", "jajaja", "jeje", "xd",
+    "claro", "entendido", "acuerdo", "adios", "chao", "chau", "luego", "pronto",
+    "mañana", "vemos", "bye", "saludos", "besos",
+    "abrazo", "buen", "dia", "igualmente", "tambien", "proxima",
+}
+# Fórmulas de cortesía con palabras funcionales, aceptadas solo como frase completa
+CHITCHAT_PHRASES = (
+    "hasta luego", "hasta mañana", "hasta pronto", "hasta la proxima", "de acuerdo",
+    "nos vemos", "un abrazo", "a ti tambien",
+)
+
+# Señales de pregunta informativa
+INFORMATIONAL_WORDS = {
+    "requisito", "requisitos", "visado", "visa", "nie", "tie", "beca", "becas", "matricula",
+    "universidad", "universidades", "master", "grado", "homologacion", "titulo", "plazo",
+    "plazos", "documentos", "documentacion", "tramite", "tramites", "precio", "cuesta", "coste",
+    "empadronamiento", "seguro", "alojamiento", "solicitud", "formulario", "convocatoria",
+    "admision", "residencia", "pasaporte", "cita", "consulado", "curso", "carrera",
+}
+INTERROGATIVES = {"que", "como", "cuando", "donde", "cuanto", "cuanta", "cuantos", "cuantas", "cual", "cuales", "quien", "por"}
+
+# Primera persona y estados de ánimo: el turno trata sobre el usuario
+PERSONAL_WORDS = {
+    "me", "siento", "estoy", "cansado", "cansada", "triste", "feliz", "contento", "contenta",
+    "agobiado", "agobiada", "estresado", "estresada", "nervioso", "nerviosa", "ansiedad",
+    "hoy", "ayer", "mi", "mis", "dia", "animo", "motivacion", "dormi", "sueño",
+}
+
+# Frases prototipo para el clasificador por centroides
+PROTOTYPES: Dict[str, List[str]] = {
+    CHITCHAT: [
+        "hola", "buenos días", "¡gracias!", "muchas gracias, eres genial", "jajaja qué bueno",
+        "vale, perfecto", "hasta luego", "nos vemos mañana", "¿qué tal estás?", "ok entendido",
+    ],
+    PERSONAL: [
+        "hoy me siento muy cansada", "estoy agobiado con los exámenes", "me encanta correr por las mañanas",
+        "ayer tuve un día horrible", "estoy muy feliz porque aprobé", "no he dormido nada",
+        "quiero ser más constante con mis hábitos", "me gusta leer novelas antes de dormir",
+    ],
+    INFORMATIONAL: [
+        "¿qué requisitos necesito para el visado de estudiante?", "¿cómo saco el NIE?",
+        "¿cuánto cuesta la matrícula de un máster en Madrid?", "¿cuándo abre la convocatoria de becas?",
+        "¿qué documentos piden para homologar mi título?", "¿dónde pido cita para la TIE?",
+        "¿qué universidades ofrecen grados en inglés?", "plazos de admisión para el curso que viene",
+    ],
+}
+
+_WORD_RE = re.compile(r"[a-z0-9ñ]+")
+_CHITCHAT_PHRASE_RE = re.compile(r"\b(?:" + "|".join(map(re.escape, CHITCHAT_PHRASES)) + r")\b")
+
+
+@dataclass(frozen=True)
+class TurnIntent:
+    """Intención de un turno y fuentes de contexto que necesita."""
+    label: str
+    reason: str
+
+    @property
+    def use_memory(self) -> bool:
+        return self.label != CHITCHAT
+
+    @property
+    def use_rag(self) -> bool:
+        return self.label == INFORMATIONAL
+
+    @property
+    def use_web(self) -> bool:
+        return self.label == INFORMATIONAL
+
+    @property
+    def needs_embedding(self) -> bool:
+        return self.use_memory or self.use_rag
+
+
+# Intención usada cuando el enrutado está desactivado: todas las fuentes de contexto
+DEFAULT_INTENT = TurnIntent(INFORMATIONAL, "routing-disabled")
+
+
+def normalize(text: str) -> str:
+    """Minúsculas, sin tildes ni emojis (ñ se conserva)."""
+    text = text.lower().replace("ñ", "\x00")
+    text = unicodedata.normalize("NFKD", text)
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    return text.replace("\x00", "ñ")
+
+
+def rule_intent(text: str) -> Optional[TurnIntent]:
+    """Reglas por palabras clave. Devuelve None si no son concluyentes."""
+    normalized = normalize(text)
+    words = _WORD_RE.findall(normalized)
+    if not words:
+        # Solo emojis o signos de puntuación
+        return TurnIntent(CHITCHAT, "rule:no-words")
+
+    word_set = set(words)
+    if word_set & INFORMATIONAL_WORDS:
+        return TurnIntent(INFORMATIONAL, "rule:domain-term")
+    # Las preguntas nunca se atajan como charla ("¿y tú?", "¿y si no?")
+    if "?" in text or "¿" in text or words[0] in INTERROGATIVES:
+        return TurnIntent(INFORMATIONAL, "rule:question")
+    if len(words) <= 8 and set(_WORD_RE.findall(_CHITCHAT_PHRASE_RE.sub(" ", normalized))) <= CHITCHAT_WORDS:
+        return TurnIntent(CHITCHAT, "rule:smalltalk")
+    return None
+
+
+class IntentClassifier:
+    """Reglas + clasificador por centroides de embeddings de frases prototipo."""
+
+    def __init__(self, prototypes: Optional[Dict[str, List[str]]] = None, min_margin: float = 0.05):
+        """Inicializa el clasificador.
+
+        Args:
+            prototypes: Frases prototipo por intención.
+            min_margin: Diferencia mínima de similitud entre la mejor y la segunda intención.
+        """
+        self.prototypes = prototypes or PROTOTYPES
+        self.min_margin = min_margin
+        self._centroids: Optional[Dict[str, np.ndarray]] = None
+        self._lock = threading.Lock()
+
+    def _get_centroids(self) -> Optional[Dict[str, np.ndarray]]:
+        """Calcula los centroides una sola vez, cuando el modelo de embeddings está listo."""
+        if self._centroids is not None:
+            return self._centroids
+        generator = get_embedding_generator()
+        if not generator.is_ready:
+            return None
+        with self._lock:
+            if self._centroids is None:
+                centroids = {}
+                for label, phrases in self.prototypes.items():
+                    vectors = generator.generate_batch(phrases, use_cache=False)
+                    centroid = vectors.mean(axis=0)
+                    centroids[label] = centroid / max(np.linalg.norm(centroid), 1e-12)
+                self._centroids = centroids
+        return self._centroids
+
+    def classify(self, text: str, query_embedding: Optional[Sequence[float]] = None) -> TurnIntent:
+        """Clasifica un turno.
+
+        Args:
+            text: Mensaje del usuario.
+            query_embedding: Embedding del mensaje (si ya se calculó).
+
+        Returns:
+            Intención del turno.
+        """
+        intent = rule_intent(text)
+        if intent is not None:
+            return intent
+
+        if query_embedding is not None:
+            try:
+                centroids = self._get_centroids()
+            except Exception as e:
+                logger.warning("Intent centroids unavailable: {}", e)
+                centroids = None
+            if centroids:
+                query = np.asarray(query_embedding, dtype=np.float32)
+                query = query / max(np.linalg.norm(query), 1e-12)
+                scores = sorted(
+                    ((float(np.dot(query, centroid)), label) for label, centroid in centroids.items()),
+                    reverse=True,
+                )
+                (best_score, best_label), (second_score, _) = scores[0], scores[1]
+                if best_score - second_score >= self.min_margin:
+                    return TurnIntent(best_label, f"centroid:{best_score:.2f}")
+
+        # Sin evidencia suficiente, mejor sobrar contexto que faltar
+        if set(_WORD_RE.findall(normalize(text))) & PERSONAL_WORDS:
+            return TurnIntent(PERSONAL, "rule:first-person")
+        return TurnIntent(INFORMATIONAL, "default")
+
+
+_intent_classifier: Optional[IntentClassifier] = None
+_intent_lock = threading.Lock()
+
+
+def get_intent_classifier() -> IntentClassifier:
+    global _intent_classifier
+    if _intent_classifier is None:
+        with _intent_lock:
+            if _intent_classifier is None:
+                _intent_classifier = IntentClassifier()
+    return _intent_classifier
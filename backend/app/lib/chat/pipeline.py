@@ -0,0 +1,521 @@
+"""Pipeline único de un turno de chat.
+
+Un turno pasa por cinco etapas, cada una con su tiempo medido en ``ChatTurn.timings``:
+
+- ``context``: conversación, mensaje del usuario (encriptado), intención, memorias, RAG,
+  web, perfil e historial. Las solicitudes de asesoría personalizada se resuelven aquí con
+  una respuesta automática y se saltan las etapas que no aplican.
+- ``prompt``: prompt del sistema y mensajes para el LLM.
+- ``generate``: llamada al LLM, con streaming (eventos ``chunk``) o sin él.
+- ``persist``: mensaje del asistente (encriptado) y evento ``done``.
+- ``post_process``: memoria semántica, resumen y memoria episódica.
+
+``ChatPipeline.run`` es un generador asíncrono de eventos ``(tipo, valor)``: ``("chunk", texto)``
+para el texto visible y ``("event", dict)`` para el resto (``conversation_id``, ``done``).
+El endpoint SSE los convierte en frames y ``send_message`` los consume sin más. Las etapas
+son intercambiables: ``ChatPipeline.replace`` sustituye una por nombre.
+"""
+
+import asyncio
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterator, Dict, List, Optional, Sequence, Tuple
+from loguru import logger
+
+from ...config import get_settings
+from ..embeddings import get_embedding_batcher, get_embedding_generator
+from ..limits.admission import AdmissionRejected
+from ..memory import SemanticMemory, EpisodicMemory, ConversationMemory
+from ..model import get_llm_client, build_system_prompt, parse_structured_response
+from ..rag.retrieval import retrieve_relevant_chunks, format_chunks_for_prompt
+from ..rag.web_search import search_web_async, format_web_results_for_prompt
+from ..security.encryption import encrypt_message, decrypt_message
+from ..summaries import get_summary_generator
+from ..supabase import get_supabase_client
+from .advice import detect_personalized_advice_request, get_personalized_advice_response
+from .intent import DEFAULT_INTENT, TurnIntent, get_intent_classifier, rule_intent
+from .sse import coalesce_deltas, visible_text
+
+SUMMARY_THRESHOLD = 10  # Resumir cada 10 mensajes
+EPISODIC_THRESHOLD = 20  # Crear memoria episódica cada 20 mensajes
+MEMORY_MARKER = "---MEMORY_UPDATE---"
+OVERLOAD_MESSAGE = "Kwami está atendiendo a muchas personas ahora mismo ✨ Inténtalo de nuevo en unos segundos."
+
+TurnEvent = Tuple[str, Any]
+
+
+class PipelineError(ValueError):
+    """Error del turno con un mensaje apto para el usuario."""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.message = message
+        self.retry_after = retry_after
+
+    @property
+    def payload(self) -> Dict[str, Any]:
+        """Cuerpo del evento SSE de error."""
+        payload: Dict[str, Any] = {"error": self.message}
+        if self.retry_after is not None:
+            payload["retry_after"] = math.ceil(self.retry_after)
+        return payload
+
+
+def _has_value(value: Any) -> bool:
+    """True si una actualización de memoria del LLM trae contenido (no "null"/"none"/vacío)."""
+    return isinstance(value, str) and value.strip().lower() not in ("null", "none", "")
+
+
+@dataclass
+class ChatTurn:
+    """Estado de un turno que las etapas van completando."""
+
+    user_id: str
+    content: str
+    conversation_id: Optional[str] = None
+    stream: bool = True
+
+    # context
+    intent: Optional[TurnIntent] = None
+    canned_response: Optional[str] = None
+    user_message_id: Optional[str] = None
+    semantic_context: str = ""
+    episodic_context: str = ""
+    conversation_summary: Optional[str] = None
+    rag_context: str = ""
+    web_context: str = ""
+    user_name: Optional[str] = None
+    personality_type: Optional[str] = None
+    favorite_activity: Optional[str] = None
+    daily_goals: Optional[str] = None
+    recent_history: List[Dict[str, Any]] = field(default_factory=list)
+
+    # prompt / generate
+    messages: List[Dict[str, str]] = field(default_factory=list)
+    full_response: str = ""
+    structured: Dict[str, Any] = field(default_factory=dict)
+    assistant_content: str = ""
+
+    # persist / post_process
+    assistant_message_id: Optional[str] = None
+    memory_updated: bool = False
+    summary_updated: bool = False
+    episodic_updated: bool = False
+
+    timings: Dict[str, float] = field(default_factory=dict)
+
+
+class PipelineStage:
+    """Etapa del pipeline.
+
+    Las etapas sin eventos implementan ``process``; las que emiten eventos (p. ej. el texto
+    en streaming) sobrescriben ``run``.
+    """
+
+    name = "stage"
+
+    def applies(self, turn: ChatTurn) -> bool:
+        return True
+
+    async def process(self, turn: ChatTurn) -> None:
+        pass
+
+    async def run(self, turn: ChatTurn) -> AsyncIterator[TurnEvent]:
+        await self.process(turn)
+        return
+        yield  # Convierte run en generador asíncrono
+
+
+class ContextStage(PipelineStage):
+    """Abre la conversación, guarda el mensaje del usuario y recupera el contexto del turno."""
+
+    name = "context"
+
+    async def run(self, turn: ChatTurn) -> AsyncIterator[TurnEvent]:
+        settings = get_settings()
+        supabase = get_supabase_client()
+        started = time.monotonic()
+
+        # 1. Obtener o crear conversación
+        if not turn.conversation_id:
+            title = turn.content[:50] + "..." if len(turn.content) > 50 else turn.content
+            conv_response = supabase.table("conversations").insert({
+                "user_id": turn.user_id,
+                "title": title,
+            }).execute()
+            if not conv_response.data:
+                raise PipelineError("No se pudo crear la conversación")
+            turn.conversation_id = conv_response.data[0]["id"]
+            yield "event", {"conversation_id": turn.conversation_id}
+        else:
+            supabase.table("conversations").update({
+                "updated_at": datetime.utcnow().isoformat()
+            }).eq("id", turn.conversation_id).execute()
+
+        # 2. Insertar mensaje del usuario (encriptado)
+        user_msg_response = supabase.table("messages").insert({
+            "user_id": turn.user_id,
+            "conversation_id": turn.conversation_id,
+            "role": "user",
+            "content": encrypt_message(turn.content),
+        }).execute()
+        if not user_msg_response.data:
+            raise PipelineError("No se pudo insertar el mensaje del usuario")
+        turn.user_message_id = user_msg_response.data[0]["id"]
+
+        # 3. Asesoría personalizada: respuesta automática, sin contexto ni LLM
+        if detect_personalized_advice_request(turn.content):
+            logger.info("Personalized advice request detected, returning automatic response")
+            turn.canned_response = get_personalized_advice_response()
+            return
+
+        # 4. Decidir qué contexto necesita el turno (los saludos no necesitan recuperación)
+        intent = rule_intent(turn.content) if settings.chat_intent_routing_enabled else DEFAULT_INTENT
+
+        # Búsqueda web especulativa: arranca en cuanto se sabe que el turno puede necesitarla,
+        # en paralelo con el embedding, la memoria y el RAG. Solo se espera hasta
+        # web_search_deadline_seconds desde el inicio del turno.
+        web_task = None
+        if intent is not None and intent.use_web and settings.web_search_speculative:
+            web_task = asyncio.ensure_future(search_web_async(turn.content, max_results=5))
+
+        # Si el modelo de embeddings aún está cargando, esperar un poco antes de recurrir
+        # a la recuperación degradada (memoria por recencia, RAG solo léxico)
+        query_embedding = None
+        if intent is None or intent.needs_embedding:
+            embedding_generator = get_embedding_generator()
+            if not embedding_generator.is_ready:
+                await embedding_generator.await_ready(settings.embedding_ready_wait_seconds)
+            # Un solo embedding de la consulta por turno, agrupado con otros turnos concurrentes
+            if embedding_generator.is_ready:
+                query_embedding = await get_embedding_batcher().embed(turn.content)
+        if intent is None:
+            intent = get_intent_classifier().classify(turn.content, query_embedding)
+        turn.intent = intent
+        logger.info("Turn intent: {} ({})", intent.label, intent.reason)
+        if web_task is None and intent.use_web and settings.web_search_speculative:
+            web_task = asyncio.ensure_future(search_web_async(turn.content, max_results=5))
+
+        # 5. Memoria semántica, episódica y resumen de la conversación
+        if intent.use_memory:
+            semantic_facts = SemanticMemory(supabase).search(
+                turn.user_id, turn.content, limit=5, query_embedding=query_embedding
+            )
+            turn.semantic_context = "\n".join(f"- {fact}" for fact in semantic_facts)
+            episodic_summaries = EpisodicMemory(supabase).search(
+                turn.user_id, turn.content, limit=5, query_embedding=query_embedding
+            )
+            turn.episodic_context = "\n".join(f"- {summary}" for summary in episodic_summaries)
+        turn.conversation_summary = ConversationMemory(supabase).get(turn.conversation_id)
+
+        # 6. RAG: chunks relevantes de documentos activos
+        rag_chunks, max_similarity = [], 0.0
+        if intent.use_rag:
+            rag_chunks, max_similarity = await asyncio.to_thread(
+                retrieve_relevant_chunks,
+                turn.content,
+                supabase,
+                top_k=8,
+                max_tokens=4000,
+                query_embedding=query_embedding,
+            )
+        turn.rag_context = format_chunks_for_prompt(rag_chunks) if rag_chunks else ""
+
+        # 7. Búsqueda web si no hay chunks relevantes o la similitud es baja
+        web_results = []
+        threshold = settings.chat_web_similarity_threshold
+        needs_web = intent.use_web and (not rag_chunks or max_similarity < threshold)
+        if needs_web:
+            logger.info("Max similarity ({:.3f}) below threshold ({:.3f}), using web search", max_similarity, threshold)
+        if web_task is not None:
+            # Con RAG suficiente el resultado se ignora; la búsqueda termina en background
+            # y queda en caché
+            if needs_web:
+                remaining = settings.web_search_deadline_seconds - (time.monotonic() - started)
+                done, _ = await asyncio.wait({web_task}, timeout=max(0.0, remaining))
+                if web_task in done:
+                    web_results = web_task.result()
+                else:
+                    logger.info(
+                        "Web search still pending after {:.1f}s deadline; answering without web context",
+                        settings.web_search_deadline_seconds,
+                    )
+        elif needs_web:
+            web_results = await search_web_async(turn.content, max_results=5)
+        turn.web_context = format_web_results_for_prompt(web_results) if web_results else ""
+
+        # 8. Perfil del usuario
+        user_response = (
+            supabase.table("users")
+            .select("full_name, personality_type, favorite_activity, daily_goals")
+            .eq("id", turn.user_id)
+            .execute()
+        )
+        user_data = user_response.data[0] if user_response.data else {}
+        full_name = user_data.get("full_name") or ""
+        turn.user_name = full_name.split()[0] if full_name.strip() else None
+        turn.personality_type = user_data.get("personality_type")
+        turn.favorite_activity = user_data.get("favorite_activity")
+        turn.daily_goals = user_data.get("daily_goals")
+
+        # 9. Historial desencriptado, sin el mensaje que se acaba de insertar (va al final del prompt)
+        history_response = (
+            supabase.table("messages")
+            .select("*")
+            .eq("conversation_id", turn.conversation_id)
+            .order("created_at", desc=False)
+            .execute()
+        )
+        history = [
+            {**item, "content": decrypt_message(item["content"])}
+            for item in history_response.data or []
+            if item.get("id") != turn.user_message_id
+        ]
+        # Si hay resumen, usar solo los últimos mensajes
+        turn.recent_history = history[-5:] if turn.conversation_summary else history
+
+
+class PromptStage(PipelineStage):
+    """Construye el prompt del sistema y la lista de mensajes para el LLM."""
+
+    name = "prompt"
+
+    def applies(self, turn: ChatTurn) -> bool:
+        return turn.canned_response is None
+
+    async def process(self, turn: ChatTurn) -> None:
+        system_prompt = build_system_prompt(
+            turn.semantic_context,
+            turn.episodic_context,
+            turn.conversation_summary,
+            user_name=turn.user_name,
+            user_study_type=turn.personality_type,
+            user_career_interest=turn.favorite_activity,
+            user_nationality=turn.daily_goals,
+            rag_context=turn.rag_context,
+            web_context=turn.web_context,
+        )
+        turn.messages = [{"role": "system", "content": system_prompt}]
+        turn.messages.extend({"role": item["role"], "content": item["content"]} for item in turn.recent_history)
+        turn.messages.append({"role": "user", "content": turn.content})
+
+
+class GenerateStage(PipelineStage):
+    """Llama al LLM y extrae la respuesta visible y las actualizaciones de memoria."""
+
+    name = "generate"
+
+    async def run(self, turn: ChatTurn) -> AsyncIterator[TurnEvent]:
+        if turn.canned_response is not None:
+            turn.full_response = turn.assistant_content = turn.canned_response
+            turn.structured = {"assistant_response": turn.canned_response}
+            if turn.stream:
+                yield "chunk", turn.canned_response
+            return
+
+        last_sent_length = 0
+        try:
+            if turn.stream:
+                async for text in self._stream(turn):
+                    yield "chunk", text
+                    last_sent_length += len(text)
+            else:
+                turn.full_response = await self._complete(turn)
+        except AdmissionRejected as rejected:
+            # Sobrecarga: fallar rápido con un mensaje amable en lugar de encolar sin límite
+            logger.warning("LLM admission rejected ({}) for user {}", rejected.reason, turn.user_id)
+            raise PipelineError(OVERLOAD_MESSAGE, retry_after=rejected.retry_after)
+        except PipelineError:
+            raise
+        except Exception as e:
+            logger.exception("Error en la llamada al LLM: {}", e)
+            raise PipelineError(f"Error al obtener respuesta del modelo: {e}")
+
+        if not turn.full_response.strip():
+            logger.error("La respuesta del LLM está vacía")
+            raise PipelineError("El modelo devolvió una respuesta vacía")
+
+        turn.structured = parse_structured_response(turn.full_response)
+        turn.assistant_content = (turn.structured.get("assistant_response") or "").strip()
+        if not turn.assistant_content:
+            logger.error("No se pudo extraer contenido de la respuesta. Full response: {}", turn.full_response[:500])
+            raise PipelineError("No se pudo procesar la respuesta del modelo")
+
+        # Sin marcador de memoria, enviar lo que quede por enviar de la respuesta
+        if turn.stream and MEMORY_MARKER not in turn.full_response:
+            remaining = turn.assistant_content[last_sent_length:]
+            if remaining:
+                yield "chunk", remaining
+
+    async def _stream(self, turn: ChatTurn) -> AsyncIterator[str]:
+        settings = get_settings()
+        deltas = get_llm_client().chat_completion_stream(
+            turn.messages, user_id=turn.user_id, conversation_id=turn.conversation_id
+        )
+        last_sent_length = 0
+        # Agrupar los deltas (1-3 caracteres) en trozos por tamaño o tiempo: menos frames
+        # y menos escrituras sin retraso perceptible
+        async for chunk in coalesce_deltas(
+            deltas,
+            max_chars=settings.sse_coalesce_max_chars,
+            max_delay_seconds=settings.sse_coalesce_max_delay_ms / 1000,
+        ):
+            turn.full_response += chunk
+            # Enviar solo el texto anterior al marcador de memoria (retiene un posible
+            # comienzo del marcador partido entre trozos)
+            text_part = visible_text(turn.full_response, MEMORY_MARKER)
+            if len(text_part) > last_sent_length:
+                yield text_part[last_sent_length:]
+                last_sent_length = len(text_part)
+
+    async def _complete(self, turn: ChatTurn) -> str:
+        llm_response = await get_llm_client().chat_completion(
+            turn.messages, user_id=turn.user_id, conversation_id=turn.conversation_id
+        )
+        return (
+            llm_response.get("choices", [{}])[0]
+            .get("message", {})
+            .get("content", "")
+            .strip()
+        )
+
+
+class PersistStage(PipelineStage):
+    """Guarda la respuesta del asistente (encriptada) y anuncia el fin de la respuesta."""
+
+    name = "persist"
+
+    async def run(self, turn: ChatTurn) -> AsyncIterator[TurnEvent]:
+        supabase = get_supabase_client()
+        assistant_msg_response = supabase.table("messages").insert({
+            "user_id": turn.user_id,
+            "conversation_id": turn.conversation_id,
+            "role": "assistant",
+            "content": encrypt_message(turn.assistant_content),
+        }).execute()
+        if not assistant_msg_response.data:
+            logger.error("No se pudo insertar el mensaje del asistente")
+            raise PipelineError("Error al guardar la respuesta")
+        turn.assistant_message_id = assistant_msg_response.data[0]["id"]
+
+        # El cliente puede cerrar la respuesta ya; las memorias se actualizan después
+        yield "event", {
+            "done": True,
+            "message_id": turn.assistant_message_id,
+            "conversation_id": turn.conversation_id,
+        }
+
+
+class PostProcessStage(PipelineStage):
+    """Actualiza memoria semántica, resumen de la conversación y memoria episódica."""
+
+    name = "post_process"
+
+    def applies(self, turn: ChatTurn) -> bool:
+        return turn.canned_response is None
+
+    async def process(self, turn: ChatTurn) -> None:
+        supabase = get_supabase_client()
+        conversation_memory = ConversationMemory(supabase)
+        structured = turn.structured
+
+        memory_update = structured.get("memory_update")
+        if _has_value(memory_update):
+            turn.memory_updated = SemanticMemory(supabase).add(turn.user_id, memory_update)
+
+        message_count = conversation_memory.get_message_count(turn.conversation_id)
+
+        summary_update = structured.get("summary_update")
+        if _has_value(summary_update):
+            turn.summary_updated = conversation_memory.update(turn.conversation_id, summary_update, message_count)
+        elif message_count >= SUMMARY_THRESHOLD and message_count % SUMMARY_THRESHOLD == 0:
+            # Generar resumen automático si el LLM no lo envió y se alcanzó el umbral
+            logger.info("Auto-generating summary for conversation {}", turn.conversation_id)
+            auto_summary = await get_summary_generator().generate_summary(
+                turn.messages + [{"role": "assistant", "content": turn.assistant_content}],
+                user_id=turn.user_id,
+                conversation_id=turn.conversation_id,
+            )
+            if auto_summary:
+                turn.summary_updated = conversation_memory.update(turn.conversation_id, auto_summary, message_count)
+
+        episodic_update = structured.get("episodic_update")
+        if message_count >= EPISODIC_THRESHOLD and message_count % EPISODIC_THRESHOLD == 0 and _has_value(episodic_update):
+            turn.episodic_updated = EpisodicMemory(supabase).add(turn.user_id, episodic_update, message_count)
+            # Limpiar resumen actual después de crear memoria episódica
+            conversation_memory.update(turn.conversation_id, "", 0)
+
+
+def default_stages() -> List[PipelineStage]:
+    return [ContextStage(), PromptStage(), GenerateStage(), PersistStage(), PostProcessStage()]
+
+
+class ChatPipeline:
+    """Ejecuta las etapas de un turno en orden y mide cada una."""
+
+    def __init__(self, stages: Optional[Sequence[PipelineStage]] = None):
+        """Inicializa el pipeline.
+
+        Args:
+            stages: Etapas en orden de ejecución (por defecto las cinco estándar).
+        """
+        self.stages = list(stages) if stages is not None else default_stages()
+
+    def replace(self, stage: PipelineStage) -> "ChatPipeline":
+        """Devuelve un pipeline igual con la etapa del mismo nombre sustituida por ``stage``.
+
+        Raises:
+            KeyError: Si no hay ninguna etapa con ese nombre.
+        """
+        if not any(existing.name == stage.name for existing in self.stages):
+            raise KeyError(stage.name)
+        return ChatPipeline([stage if existing.name == stage.name else existing for existing in self.stages])
+
+    async def run(self, turn: ChatTurn) -> AsyncIterator[TurnEvent]:
+        """Ejecuta el turno.
+
+        Args:
+            turn: Turno con user_id, content, conversation_id y modo (stream).
+
+        Yields:
+            Eventos ``("chunk", texto)`` y ``("event", dict)``.
+
+        Raises:
+            PipelineError: Si una etapa falla con un error mostrable al usuario.
+        """
+        try:
+            for stage in self.stages:
+                if not stage.applies(turn):
+                    continue
+                started = time.perf_counter()
+                try:
+                    async for event in stage.run(turn):
+                        yield event
+                finally:
+                    turn.timings[stage.name] = (time.perf_counter() - started) * 1000
+        finally:
+            logger.info(
+                "Chat turn conversation={} timings: {}",
+                turn.conversation_id,
+                " ".join(f"{name}={ms:.0f}ms" for name, ms in turn.timings.items()) or "-",
+            )
+        logger.info(
+            "Message processed: conversation={}, memory={}, summary={}, episodic={}",
+            turn.conversation_id, turn.memory_updated, turn.summary_updated, turn.episodic_updated,
+        )
+
+
+_chat_pipeline: Optional[ChatPipeline] = None
+_pipeline_lock = threading.Lock()
+
+
+def get_chat_pipeline() -> ChatPipeline:
+    global _chat_pipeline
+    if _chat_pipeline is None:
+        with _pipeline_lock:
+            if _chat_pipeline is None:
+                _chat_pipeline = ChatPipeline()
+    return _chat_pipeline
@@ -0,0 +1,188 @@
+"""Utilidades para las respuestas Server-Sent Events del chat.
+
+``stream_with_heartbeat`` envuelve el generador de eventos de un turno:
+
+- Lo ejecuta en una tarea aparte y reenvía sus frames al cliente.
+- Mientras no hay frames (recuperando contexto, esperando al LLM) envía comentarios SSE
+  (``: ping``) para que proxies y balanceadores no almacenen ni corten el stream.
+- Comprueba periódicamente ``request.is_disconnected()``. Si el cliente se fue, cancela la
+  tarea. En el chat la tarea es un suscriptor de ``streams.ActiveStream``: la generación
+  sigue unos segundos por si el cliente reconecta y después se cancela, cerrando el
+  stream HTTP hacia DeepSeek y saltando el guardado y las actualizaciones de memoria.
+
+``coalesce_deltas`` agrupa los deltas del LLM (a menudo de 1-3 caracteres) en trozos por
+tamaño o por tiempo, y ``chunk_frame`` los codifica sin pasar por ``json.dumps`` de un dict.
+"""
+
+import asyncio
+import json
+import time
+from contextlib import suppress
+from json.encoder import encode_basestring_ascii
+from typing import Any, AsyncIterator, Callable, Dict, Optional
+from loguru import logger
+
+HEARTBEAT_FRAME = ": ping\n\n"
+OPEN_FRAME = ": connected\n\n"
+
+_DONE = object()
+
+
+def sse_event(data: Dict[str, Any]) -> str:
+    """Frame SSE ``data:`` con el payload en JSON."""
+    return f"data: {json.dumps(data)}\n\n"
+
+
+def chunk_frame(text: str) -> str:
+    """Frame ``{"chunk": text}``, idéntico a ``sse_event({"chunk": text})`` pero sin crear el dict."""
+    return 'data: {"chunk": ' + encode_basestring_ascii(text) + "}\n\n"
+
+
+def visible_text(text: str, marker: str) -> str:
+    """Parte de la respuesta que se puede mostrar: lo anterior a ``marker``.
+
+    Si el texto termina con un prefijo del marcador (p. ej. "---MEM"), ese final se
+    retiene hasta saber si el marcador se completa.
+    """
+    position = text.find(marker)
+    if position >= 0:
+        return text[:position]
+    for size in range(min(len(marker) - 1, len(text)), 0, -1):
+        if text.endswith(marker[:size]):
+            return text[:-size]
+    return text
+
+
+async def coalesce_deltas(
+    deltas: AsyncIterator[str],
+    max_chars: int = 64,
+    max_delay_seconds: float = 0.03,
+) -> AsyncIterator[str]:
+    """Agrupa deltas de texto y los emite al llegar a max_chars o max_delay_seconds.
+
+    El plazo cuenta desde el primer delta pendiente, así que ningún texto espera más de
+    max_delay_seconds aunque el LLM haga una pausa. La lectura del upstream se hace en
+    una tarea para no cancelarla al vencer el plazo.
+
+    Args:
+        deltas: Deltas de texto del LLM.
+        max_chars: Tamaño a partir del cual se emite sin esperar.
+        max_delay_seconds: Retraso máximo añadido a un delta.
+
+    Yields:
+        Trozos de texto concatenados.
+    """
+    iterator = deltas.__aiter__()
+    pending = []
+    pending_chars = 0
+    first_at = 0.0
+    next_delta: Optional[asyncio.Future] = None
+    try:
+        while True:
+            if next_delta is None:
+                next_delta = asyncio.ensure_future(iterator.__anext__())
+            timeout = max(0.0, first_at + max_delay_seconds - time.monotonic()) if pending else None
+            done, _ = await asyncio.wait({next_delta}, timeout=timeout)
+            if not done:
+                yield "".join(pending)
+                pending, pending_chars = [], 0
+                continue
+
+            future, next_delta = next_delta, None
+            try:
+                delta = future.result()
+            except StopAsyncIteration:
+                break
+            if not delta:
+                continue
+            if not pending:
+                first_at = time.monotonic()
+            pending.append(delta)
+            pending_chars += len(delta)
+            if pending_chars >= max_chars:
+                yield "".join(pending)
+                pending, pending_chars = [], 0
+        if pending:
+            yield "".join(pending)
+    finally:
+        if next_delta is not None and not next_delta.done():
+            next_delta.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await next_delta
+        # Cerrar el upstream (y su conexión HTTP) si se deja de consumir a medias
+        if hasattr(iterator, "aclose"):
+            with suppress(Exception):
+                await iterator.aclose()
+
+
+async def stream_with_heartbeat(
+    request,
+    events: AsyncIterator[str],
+    heartbeat_seconds: float = 10.0,
+    disconnect_poll_seconds: float = 1.0,
+    on_close: Optional[Callable[[], None]] = None,
+    max_buffered: int = 64,
+) -> AsyncIterator[str]:
+    """Reenvía los frames de ``events`` con heartbeats y detección de desconexión.
+
+    Args:
+        request: Request de Starlette/FastAPI del stream.
+        events: Generador de frames SSE ya formateados.
+        heartbeat_seconds: Silencio máximo antes de enviar un comentario ``: ping``.
+        disconnect_poll_seconds: Cada cuánto se comprueba si el cliente sigue conectado.
+        on_close: Callback al terminar el stream por cualquier motivo.
+        max_buffered: Frames pendientes de enviar antes de frenar al productor.
+
+    Yields:
+        Frames SSE.
+    """
+    queue: asyncio.Queue = asyncio.Queue(maxsize=max_buffered)
+
+    async def produce() -> None:
+        try:
+            async for frame in events:
+                await queue.put(frame)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await queue.put(e)
+            return
+        await queue.put(_DONE)
+
+    producer = asyncio.create_task(produce())
+    poll = max(0.05, min(disconnect_poll_seconds, heartbeat_seconds))
+    last_sent = last_check = time.monotonic()
+    try:
+        # Primer byte inmediato: fuerza el envío de las cabeceras a través de proxies
+        yield OPEN_FRAME
+        while True:
+            try:
+                item = await asyncio.wait_for(queue.get(), timeout=poll)
+            except asyncio.TimeoutError:
+                item = None
+
+            now = time.monotonic()
+            if now - last_check >= poll:
+                last_check = now
+                if await request.is_disconnected():
+                    logger.info("SSE client disconnected; cancelling turn")
+                    break
+
+            if item is None:
+                if now - last_sent >= heartbeat_seconds:
+                    yield HEARTBEAT_FRAME
+                    last_sent = now
+                continue
+            if item is _DONE:
+                break
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            last_sent = now
+    finally:
+        if not producer.done():
+            producer.cancel()
+            with suppress(asyncio.CancelledError, Exception):
+                await producer
+        if on_close is not None:
+            on_close()
@@ -0,0 +1,195 @@
+"""Streams de chat reanudables (SSE con ``Last-Event-ID``).
+
+La generación de una respuesta ya no depende de la conexión que la pidió:
+
+- ``ActiveStream.start`` ejecuta el generador del turno en una tarea propia y guarda cada
+  frame con un id consecutivo (``id: N``) en un buffer circular acotado.
+- Cada conexión es un suscriptor que reproduce los frames posteriores a un id y sigue
+  en directo. Si el cliente se corta, puede reconectar a ``GET /chat/streams/{stream_id}``
+  con ``Last-Event-ID`` y recibir lo que se perdió sin una nueva llamada al LLM.
+- Si no queda ningún suscriptor durante CHAT_STREAM_RESUME_GRACE_SECONDS, la generación
+  se cancela (se corta el stream hacia DeepSeek y se saltan las escrituras pendientes).
+- Los streams terminados se conservan CHAT_STREAM_RETENTION_SECONDS para reconexiones
+  tardías.
+
+El registro vive en memoria del proceso: la reconexión debe llegar a la misma réplica.
+"""
+
+import asyncio
+import threading
+import uuid
+from collections import deque
+from typing import AsyncIterator, Callable, Deque, Dict, List, Optional, Tuple
+from loguru import logger
+
+from .sse import sse_event
+
+
+class ActiveStream:
+    """Respuesta en curso con su buffer de frames numerados."""
+
+    def __init__(self, stream_id: str, user_id: str, max_events: int, grace_seconds: float):
+        self.stream_id = stream_id
+        self.user_id = user_id
+        self.grace_seconds = grace_seconds
+        self.finished = False
+        self._events: Deque[Tuple[int, str]] = deque(maxlen=max_events)
+        self._next_id = 1
+        self._changed = asyncio.Event()
+        self._subscribers = 0
+        self._task: Optional[asyncio.Task] = None
+        self._grace_handle: Optional[asyncio.TimerHandle] = None
+        self._on_finish: List[Callable[[], None]] = []
+
+    @property
+    def last_event_id(self) -> int:
+        return self._next_id - 1
+
+    def start(self, events: AsyncIterator[str], on_finish: Optional[Callable[[], None]] = None) -> None:
+        """Lanza la generación en background.
+
+        Args:
+            events: Generador de frames SSE del turno.
+            on_finish: Callback al terminar la generación (completa, con error o cancelada).
+        """
+        if on_finish is not None:
+            self._on_finish.append(on_finish)
+        self._task = asyncio.create_task(self._run(events))
+
+    async def _run(self, events: AsyncIterator[str]) -> None:
+        try:
+            async for frame in events:
+                self.publish(frame)
+        except asyncio.CancelledError:
+            logger.info("Chat stream {} cancelled (no client reconnected)", self.stream_id)
+        except Exception as e:
+            logger.error("Chat stream {} failed: {}", self.stream_id, e)
+            self.publish(sse_event({"error": str(e)}))
+        finally:
+            self.finished = True
+            self._notify()
+            for callback in self._on_finish:
+                try:
+                    callback()
+                except Exception as e:
+                    logger.warning("Chat stream {} finish callback failed: {}", self.stream_id, e)
+
+    def publish(self, frame: str) -> None:
+        """Numera y guarda un frame ``data:`` y despierta a los suscriptores."""
+        self._events.append((self._next_id, f"id: {self._next_id}\n{frame}"))
+        self._next_id += 1
+        self._notify()
+
+    def _notify(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    def cancel(self) -> None:
+        if self._task is not None and not self._task.done():
+            self._task.cancel()
+
+    async def subscribe(self, after_id: int = 0) -> AsyncIterator[str]:
+        """Reproduce los frames con id > after_id y continúa en directo hasta el final.
+
+        Yields:
+            Frames SSE con su línea ``id:``.
+        """
+        self._subscribers += 1
+        if self._grace_handle is not None:
+            self._grace_handle.cancel()
+            self._grace_handle = None
+        try:
+            cursor = after_id
+            while True:
+                changed = self._changed
+                # El índice se recalcula en cada frame: el buffer puede rotar mientras se envía
+                while cursor < self.last_event_id:
+                    index = cursor + 1 - self._events[0][0]
+                    if index < 0:
+                        # Lo pedido ya salió del buffer circular
+                        yield sse_event({"error": "No se puede reanudar la respuesta", "resume": False})
+                        return
+                    event_id, frame = self._events[index]
+                    yield frame
+                    cursor = event_id
+                if self.finished:
+                    return
+                await changed.wait()
+        finally:
+            self._subscribers -= 1
+            if self._subscribers == 0 and not self.finished:
+                loop = asyncio.get_running_loop()
+                self._grace_handle = loop.call_later(self.grace_seconds, self._cancel_if_orphaned)
+
+    def _cancel_if_orphaned(self) -> None:
+        self._grace_handle = None
+        if self._subscribers == 0 and not self.finished:
+            logger.info("Chat stream {} has no client after {}s; cancelling", self.stream_id, self.grace_seconds)
+            self.cancel()
+
+
+class StreamRegistry:
+    """Streams activos y recientes de este proceso."""
+
+    def __init__(self, max_events: int = 2048, grace_seconds: float = 15.0, retention_seconds: float = 60.0):
+        """Inicializa el registro.
+
+        Args:
+            max_events: Frames guardados por stream.
+            grace_seconds: Espera a una reconexión antes de cancelar una generación sin clientes.
+            retention_seconds: Tiempo que se conserva un stream terminado.
+        """
+        self.max_events = max_events
+        self.grace_seconds = grace_seconds
+        self.retention_seconds = retention_seconds
+        self._streams: Dict[str, ActiveStream] = {}
+
+    def start(
+        self,
+        user_id: str,
+        events: AsyncIterator[str],
+        on_finish: Optional[Callable[[], None]] = None,
+    ) -> ActiveStream:
+        """Registra un stream nuevo y lanza su generación.
+
+        El primer frame publicado es ``{"stream_id": ...}`` para que el cliente pueda reanudar.
+        """
+        stream = ActiveStream(uuid.uuid4().hex, user_id, self.max_events, self.grace_seconds)
+        self._streams[stream.stream_id] = stream
+        stream.publish(sse_event({"stream_id": stream.stream_id}))
+
+        def finished() -> None:
+            if on_finish is not None:
+                on_finish()
+            asyncio.get_running_loop().call_later(
+                self.retention_seconds, self._streams.pop, stream.stream_id, None
+            )
+
+        stream.start(events, on_finish=finished)
+        return stream
+
+    def get(self, stream_id: str) -> Optional[ActiveStream]:
+        return self._streams.get(stream_id)
+
+    def __len__(self) -> int:
+        return len(self._streams)
+
+
+_stream_registry: Optional[StreamRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_stream_registry() -> StreamRegistry:
+    global _stream_registry
+    if _stream_registry is None:
+        with _registry_lock:
+            if _stream_registry is None:
+                from ...config import get_settings
+
+                settings = get_settings()
+                _stream_registry = StreamRegistry(
+                    max_events=settings.chat_stream_buffer_events,
+                    grace_seconds=settings.chat_stream_resume_grace_seconds,
+                    retention_seconds=settings.chat_stream_retention_seconds,
+                )
+    return _stream_registry
@@ -1,9 +1,12 @@
 """Módulo de embeddings para búsqueda semántica."""
 
-from .generator import EmbeddingGenerator, get_embedding_generator
-
-__all__ = ["EmbeddingGenerator", "get_embedding_generator"]
-
-
-
-
+from .generator import DEFAULT_EMBEDDING_MODEL, EmbeddingGenerator, get_embedding_generator
+from .batcher import EmbeddingBatcher, get_embedding_batcher
+
+__all__ = [
+    "DEFAULT_EMBEDDING_MODEL",
+    "EmbeddingGenerator",
+    "get_embedding_generator",
+    "EmbeddingBatcher",
+    "get_embedding_batcher",
+]
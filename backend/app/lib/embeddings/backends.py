@@ -0,0 +1,213 @@
+"""Backends de inferencia para EmbeddingGenerator.
+
+- ``sentence-transformers``: PyTorch en CPU (por defecto).
+- ``onnx``: ONNX Runtime + ``tokenizers``, sin PyTorch. Opcionalmente cuantizado a int8
+  dinámico. Requiere el extra ``onnx`` (``pip install -e ".[onnx]"``).
+
+Todos los backends devuelven embeddings float32 normalizados (L2) con mean pooling,
+equivalentes a ``SentenceTransformer.encode(..., normalize_embeddings=True)``.
+"""
+
+import os
+from pathlib import Path
+from typing import Any, List
+
+import numpy as np
+from loguru import logger
+
+
+class EmbeddingBackend:
+    """Interfaz común de los backends de embeddings."""
+
+    name = "base"
+
+    def __init__(self, model_name: str):
+        self.model_name = model_name
+        self.max_seq_length = 256
+
+    @property
+    def model_id(self) -> str:
+        """Identificador de los vectores producidos (clave de la caché de embeddings)."""
+        return self.model_name
+
+    def load(self) -> int:
+        """Carga el modelo. Devuelve la dimensión de los embeddings."""
+        raise NotImplementedError
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        """Codifica textos. Devuelve una matriz float32 (len(texts), dim) normalizada."""
+        raise NotImplementedError
+
+
+class SentenceTransformerBackend(EmbeddingBackend):
+    """Backend PyTorch vía sentence-transformers."""
+
+    name = "sentence-transformers"
+
+    def __init__(self, model_name: str):
+        super().__init__(model_name)
+        self._model: Any = None
+
+    def load(self) -> int:
+        import warnings
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")
+            from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(self.model_name, device="cpu")
+        self.max_seq_length = int(getattr(self._model, "max_seq_length", 0) or 512)
+        return self._model.get_sentence_embedding_dimension()
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        embeddings = self._model.encode(
+            texts,
+            batch_size=batch_size,
+            normalize_embeddings=True,
+            convert_to_numpy=True,
+            show_progress_bar=False,
+        )
+        return embeddings.astype(np.float32, copy=False)
+
+
+class OnnxBackend(EmbeddingBackend):
+    """Backend ONNX Runtime con tokenización vía ``tokenizers``.
+
+    Si no se indica ``model_dir``, descarga ``onnx/model.onnx`` y ``tokenizer.json`` del
+    repositorio ``sentence-transformers/<modelo>`` en Hugging Face. Para otros modelos,
+    exportar con ``optimum-cli export onnx --model <modelo> <dir>`` y apuntar ``model_dir``.
+    """
+
+    name = "onnx"
+
+    def __init__(
+        self,
+        model_name: str,
+        model_dir: str = "",
+        quantize: bool = False,
+        num_threads: int = 0,
+        max_seq_length: int = 256,
+    ):
+        super().__init__(model_name)
+        self.model_dir = model_dir
+        self.quantize = quantize
+        self.num_threads = num_threads
+        self.max_seq_length = max_seq_length
+        self._session: Any = None
+        self._tokenizer: Any = None
+        self._input_names: List[str] = []
+
+    @property
+    def model_id(self) -> str:
+        # La cuantización int8 cambia los vectores (dentro de tolerancia): no mezclar en caché
+        return f"{self.model_name}#int8" if self.quantize else self.model_name
+
+    def _resolve_files(self) -> tuple[Path, Path]:
+        if self.model_dir:
+            base = Path(self.model_dir)
+            model_path = base / "model.onnx"
+            if not model_path.exists():
+                model_path = base / "onnx" / "model.onnx"
+            return model_path, base / "tokenizer.json"
+
+        from huggingface_hub import hf_hub_download
+
+        repo_id = self.model_name if "/" in self.model_name else f"sentence-transformers/{self.model_name}"
+        model_path = Path(hf_hub_download(repo_id=repo_id, filename="onnx/model.onnx"))
+        tokenizer_path = Path(hf_hub_download(repo_id=repo_id, filename="tokenizer.json"))
+        return model_path, tokenizer_path
+
+    def _quantized_path(self, model_path: Path) -> Path:
+        """Cuantiza dinámicamente a int8 (una sola vez; el resultado se guarda junto al modelo)."""
+        quantized = model_path.with_name(model_path.stem + "_int8_dynamic.onnx")
+        if quantized.exists():
+            return quantized
+
+        from onnxruntime.quantization import QuantType, quantize_dynamic
+
+        target = quantized
+        if not os.access(model_path.parent, os.W_OK):
+            cache_dir = Path.home() / ".cache" / "estudia-seguro" / "onnx"
+            cache_dir.mkdir(parents=True, exist_ok=True)
+            target = cache_dir / f"{self.model_name.replace('/', '__')}_int8_dynamic.onnx"
+            if target.exists():
+                return target
+
+        logger.info("Quantizing ONNX embedding model to int8: {}", target)
+        quantize_dynamic(str(model_path), str(target), weight_type=QuantType.QInt8)
+        return target
+
+    def load(self) -> int:
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+
+        model_path, tokenizer_path = self._resolve_files()
+        if self.quantize:
+            model_path = self._quantized_path(model_path)
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if self.num_threads > 0:
+            options.intra_op_num_threads = self.num_threads
+        self._session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        self._input_names = [i.name for i in self._session.get_inputs()]
+
+        tokenizer = Tokenizer.from_file(str(tokenizer_path))
+        tokenizer.enable_truncation(max_length=self.max_seq_length)
+        padding = tokenizer.padding or {}
+        tokenizer.enable_padding(
+            pad_id=padding.get("pad_id", 0), pad_token=padding.get("pad_token", "[PAD]")
+        )
+        self._tokenizer = tokenizer
+
+        return int(self.encode(["dimension"], batch_size=1).shape[1])
+
+    def encode(self, texts: List[str], batch_size: int) -> np.ndarray:
+        outputs: List[np.ndarray] = []
+        for start in range(0, len(texts), max(1, batch_size)):
+            encodings = self._tokenizer.encode_batch(texts[start : start + batch_size])
+            input_ids = np.array([e.ids for e in encodings], dtype=np.int64)
+            attention_mask = np.array([e.attention_mask for e in encodings], dtype=np.int64)
+            feeds = {"input_ids": input_ids, "attention_mask": attention_mask}
+            if "token_type_ids" in self._input_names:
+                feeds["token_type_ids"] = np.zeros_like(input_ids)
+
+            token_embeddings = self._session.run(None, feeds)[0]
+
+            # Mean pooling sobre tokens reales + normalización L2
+            mask = attention_mask[:, :, None].astype(np.float32)
+            summed = (token_embeddings * mask).sum(axis=1)
+            counts = np.clip(mask.sum(axis=1), 1e-9, None)
+            pooled = summed / counts
+            norms = np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+            outputs.append((pooled / norms).astype(np.float32, copy=False))
+        return np.concatenate(outputs, axis=0)
+
+
+def create_backend(
+    backend: str,
+    model_name: str,
+    onnx_model_dir: str = "",
+    onnx_quantize: bool = False,
+    onnx_num_threads: int = 0,
+) -> EmbeddingBackend:
+    """Crea el backend configurado.
+
+    Args:
+        backend: 'sentence-transformers' u 'onnx'.
+        model_name: Nombre del modelo de embeddings.
+        onnx_model_dir: Directorio con model.onnx y tokenizer.json (opcional).
+        onnx_quantize: Aplicar cuantización dinámica int8.
+        onnx_num_threads: Threads intra-op de ONNX Runtime (0 = por defecto).
+    """
+    if backend == OnnxBackend.name:
+        return OnnxBackend(
+            model_name,
+            model_dir=onnx_model_dir,
+            quantize=onnx_quantize,
+            num_threads=onnx_num_threads,
+        )
+    if backend != SentenceTransformerBackend.name:
+        logger.warning("Unknown embedding backend '{}', using sentence-transformers", backend)
+    return SentenceTransformerBackend(model_name)
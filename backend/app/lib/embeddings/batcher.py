@@ -0,0 +1,129 @@
+"""Micro-batching de embeddings de consultas para turnos de chat concurrentes.
+
+Cada turno de chat necesita el embedding de un solo texto corto. Bajo carga, en lugar
+de ejecutar muchos forward passes pequeños en serie, las consultas se acumulan durante
+unos milisegundos (o hasta ``max_batch`` textos) y se codifican en un único batch.
+"""
+
+import asyncio
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from loguru import logger
+
+from .generator import EmbeddingGenerator, get_embedding_generator
+
+
+@dataclass
+class _PendingQuery:
+    text: str
+    future: asyncio.Future
+    enqueued_at: float = field(default_factory=time.perf_counter)
+
+
+class EmbeddingBatcher:
+    """Agrupa consultas concurrentes y las codifica con ``generate_batch``."""
+
+    def __init__(
+        self,
+        generator: EmbeddingGenerator,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+    ):
+        """Inicializa el batcher.
+
+        Args:
+            generator: Generador de embeddings subyacente.
+            max_batch: Máximo de textos por batch.
+            max_wait_ms: Tiempo máximo que una consulta espera a que se llene el batch.
+        """
+        self.generator = generator
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _ensure_started(self) -> asyncio.Queue:
+        """Crea la cola y la tarea consumidora en el event loop actual."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop or self._task is None or self._task.done():
+            self._loop = loop
+            self._queue = asyncio.Queue()
+            self._task = loop.create_task(self._run())
+        return self._queue
+
+    async def embed(self, text: str) -> List[float]:
+        """Devuelve el embedding de un texto (ceros si el modelo no está listo)."""
+        if not text or not text.strip() or not self.generator.is_ready:
+            return [0.0] * self.generator.dimension
+
+        queue = self._ensure_started()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put(_PendingQuery(text, future))
+        return await future
+
+    async def _collect(self) -> List[_PendingQuery]:
+        """Espera la primera consulta y acumula más hasta llenar el batch o agotar la espera."""
+        queue = self._queue
+        batch = [await queue.get()]
+        deadline = batch[0].enqueued_at + self.max_wait
+        while len(batch) < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                # Recoger lo que ya esté en cola sin esperar más
+                while len(batch) < self.max_batch and not queue.empty():
+                    batch.append(queue.get_nowait())
+                break
+            try:
+                batch.append(await asyncio.wait_for(queue.get(), timeout=remaining))
+            except asyncio.TimeoutError:
+                break
+        return batch
+
+    async def _run(self) -> None:
+        while True:
+            batch = await self._collect()
+            pending = [item for item in batch if not item.future.done()]
+            if not pending:
+                continue
+            try:
+                # Las consultas no pasan por la caché persistente (solo chunks)
+                embeddings = await asyncio.to_thread(
+                    self.generator.generate_batch, [item.text for item in pending], False
+                )
+            except Exception as e:
+                logger.error("Error in embedding micro-batch: {}", e)
+                for item in pending:
+                    if not item.future.done():
+                        item.future.set_exception(e)
+                continue
+
+            if len(pending) > 1:
+                waited_ms = (time.perf_counter() - pending[0].enqueued_at) * 1000
+                logger.debug("Embedded micro-batch of {} queries ({:.1f} ms)", len(pending), waited_ms)
+            for item, embedding in zip(pending, embeddings):
+                if not item.future.done():
+                    item.future.set_result(embedding.tolist())
+
+
+_embedding_batcher: Optional[EmbeddingBatcher] = None
+_batcher_lock = threading.Lock()
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    global _embedding_batcher
+    if _embedding_batcher is None:
+        with _batcher_lock:
+            if _embedding_batcher is None:
+                from ...config import get_settings
+
+                settings = get_settings()
+                _embedding_batcher = EmbeddingBatcher(
+                    get_embedding_generator(),
+                    max_batch=settings.embedding_batcher_max_batch,
+                    max_wait_ms=settings.embedding_batcher_max_wait_ms,
+                )
+    return _embedding_batcher
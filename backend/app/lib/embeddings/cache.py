@@ -0,0 +1,78 @@
+"""Caché persistente de embeddings por (modelo, sha256 del texto)."""
+
+import hashlib
+from typing import Dict, Iterable, List, Sequence
+from loguru import logger
+from supabase import Client
+
+
+def hash_text(text: str) -> str:
+    """SHA-256 hexadecimal del texto (clave de la caché)."""
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class EmbeddingCache:
+    """Caché de embeddings respaldada por la tabla embedding_cache."""
+
+    # Las claves viajan en la URL de PostgREST (in.(...)); limitar el tamaño de cada consulta
+    FETCH_BATCH_SIZE = 100
+    WRITE_BATCH_SIZE = 200
+
+    def __init__(self, supabase: Client, table: str = "embedding_cache"):
+        """Inicializa la caché.
+
+        Args:
+            supabase: Cliente de Supabase.
+            table: Nombre de la tabla de caché.
+        """
+        self.supabase = supabase
+        self.table = table
+
+    def get_many(self, model_name: str, hashes: Iterable[str]) -> Dict[str, List[float]]:
+        """Obtiene los embeddings cacheados para un conjunto de hashes.
+
+        Args:
+            model_name: Nombre del modelo de embeddings.
+            hashes: Hashes de los textos.
+
+        Returns:
+            Diccionario hash -> embedding con los aciertos.
+        """
+        unique_hashes = list(dict.fromkeys(hashes))
+        found: Dict[str, List[float]] = {}
+        for i in range(0, len(unique_hashes), self.FETCH_BATCH_SIZE):
+            batch = unique_hashes[i : i + self.FETCH_BATCH_SIZE]
+            response = (
+                self.supabase.table(self.table)
+                .select("content_hash, embedding")
+                .eq("model_name", model_name)
+                .in_("content_hash", batch)
+                .execute()
+            )
+            for row in response.data or []:
+                found[row["content_hash"]] = row["embedding"]
+        return found
+
+    def put_many(self, model_name: str, embeddings: Dict[str, Sequence[float]]) -> None:
+        """Guarda embeddings nuevos (ignora los que ya existen).
+
+        Args:
+            model_name: Nombre del modelo de embeddings.
+            embeddings: Diccionario hash -> embedding (lista o array de NumPy).
+        """
+        rows = [
+            {
+                "model_name": model_name,
+                "content_hash": content_hash,
+                "embedding": embedding.tolist() if hasattr(embedding, "tolist") else list(embedding),
+            }
+            for content_hash, embedding in embeddings.items()
+        ]
+        for i in range(0, len(rows), self.WRITE_BATCH_SIZE):
+            self.supabase.table(self.table).upsert(
+                rows[i : i + self.WRITE_BATCH_SIZE],
+                on_conflict="model_name,content_hash",
+                ignore_duplicates=True,
+            ).execute()
+        if rows:
+            logger.debug("Stored {} embeddings in cache for model {}", len(rows), model_name)
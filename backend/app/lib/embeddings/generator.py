@@ -1,32 +1,59 @@
-"""Generador de embeddings usando sentence-transformers."""
+"""Generador de embeddings con backend intercambiable (sentence-transformers u ONNX)."""
 
+import asyncio
 import os
 import threading
 import time
-from typing import List, Optional, Union, Any
+from typing import Dict, List, Optional, Union, Any
+import numpy as np
 from loguru import logger
 
+from .backends import EmbeddingBackend, SentenceTransformerBackend, create_backend
+from .cache import EmbeddingCache, hash_text
+from .registry import KNOWN_MODELS
+
 # Deshabilitar compilación y JIT de PyTorch
 os.environ["TORCH_COMPILE_DISABLE"] = "1"
 os.environ["TORCHDYNAMO_DISABLE"] = "1"
 os.environ["PYTORCH_JIT"] = "0"
 os.environ["TOKENIZERS_PARALLELISM"] = "false"
 
-# Singleton thread-safe
-_embedding_generator: Optional['EmbeddingGenerator'] = None
+DEFAULT_EMBEDDING_MODEL = "all-MiniLM-L6-v2"
+
+# Un generador por modelo (thread-safe)
+_embedding_generators: Dict[str, 'EmbeddingGenerator'] = {}
 _embedding_lock = threading.Lock()
 
 class EmbeddingGenerator:
-    """Generador de embeddings usando sentence-transformers con fallback y carga asíncrona."""
+    """Generador de embeddings con fallback y carga asíncrona del backend."""
 
-    def __init__(self, model_name: str = "all-MiniLM-L6-v2"):
+    def __init__(
+        self,
+        model_name: str = DEFAULT_EMBEDDING_MODEL,
+        batch_size: int = 32,
+        batch_token_budget: int = 4096,
+        backend: Optional[EmbeddingBackend] = None,
+    ):
         self.model_name = model_name
+        self.backend = backend or SentenceTransformerBackend(model_name)
+        # Tamaño máximo de cada batch y presupuesto aproximado de tokens por batch:
+        # batches pequeños y homogéneos mantienen las activaciones dentro de la caché de CPU
+        self.batch_size = max(1, batch_size)
+        self.batch_token_budget = max(1, batch_token_budget)
         self._model: Any = None 
-        self._dimension: int = 384 # Dimensión por defecto para MiniLM-L6-v2
+        # Dimensión registrada del modelo (la real se confirma al cargar)
+        spec = KNOWN_MODELS.get(model_name)
+        self._expected_dimension: int = spec.dimension if spec else 384
+        self._dimension: int = self._expected_dimension
         self._lock = threading.Lock()
         self._is_fallback = True  # Iniciar en modo fallback
         self._loading = False
         self._load_thread: Optional[threading.Thread] = None
+        # Se activa cuando termina la carga (con éxito o con error)
+        self._load_finished = threading.Event()
+        self._load_error: Optional[str] = None
+        self._cache: Optional[EmbeddingCache] = None
+        self._cache_initialized = False
         logger.info("EmbeddingGenerator initialized (starting in FALLBACK mode, loading model in background)")
         
         # Iniciar carga en background inmediatamente
@@ -45,18 +72,23 @@ class EmbeddingGenerator:
     def _load_model_background(self):
         """Carga el modelo en un thread separado sin bloquear."""
         try:
-            logger.info("Background: Loading embedding model: {} (this may take a few minutes on first run)", self.model_name)
+            logger.info(
+                "Background: Loading embedding model: {} with backend {} (this may take a few minutes on first run)",
+                self.model_name,
+                self.backend.name,
+            )
             start_time = time.time()
             
-            # Intentar aplicar parches básicos antes de importar
-            import warnings
-            with warnings.catch_warnings():
-                warnings.simplefilter("ignore")
-                from sentence_transformers import SentenceTransformer
-                
             # Cargar modelo con timeout implícito (si se bloquea, el thread morirá)
-            self._model = SentenceTransformer(self.model_name, device="cpu")
-            self._dimension = self._model.get_sentence_embedding_dimension()
+            self._dimension = self.backend.load()
+            if self.model_name in KNOWN_MODELS and self._dimension != self._expected_dimension:
+                # Los vectores se guardan con la dimensión registrada: no mezclar tamaños
+                raise ValueError(
+                    f"Dimensión {self._dimension} distinta de la registrada ({self._expected_dimension})"
+                )
+            self._model = self.backend
+            # Warm-up: la primera inferencia inicializa kernels y buffers
+            self.backend.encode(["warm-up"], batch_size=1)
             
             elapsed = time.time() - start_time
             logger.info("Background: Embedding model loaded successfully in {:.2f} seconds. Dimension: {}", elapsed, self._dimension)
@@ -73,25 +105,82 @@ class EmbeddingGenerator:
                 self._model = "FALLBACK"
                 self._is_fallback = True
                 self._loading = False
-                self._dimension = 384
+                self._load_error = str(e)
+                self._dimension = self._expected_dimension
+        finally:
+            self._load_finished.set()
+
+    @property
+    def is_ready(self) -> bool:
+        """True si el modelo está cargado y genera embeddings reales."""
+        return self._load_finished.is_set() and not self._is_fallback
+
+    @property
+    def status(self) -> str:
+        """Estado de la carga: 'loading', 'ready' o 'failed'."""
+        if not self._load_finished.is_set():
+            return "loading"
+        return "failed" if self._is_fallback else "ready"
+
+    def readiness(self) -> Dict[str, Any]:
+        """Información de readiness para el endpoint /ready."""
+        info: Dict[str, Any] = {
+            "status": self.status,
+            "model": self.model_id,
+            "backend": self.backend.name,
+            "dimension": self._dimension,
+        }
+        if self._load_error:
+            info["error"] = self._load_error
+        return info
+
+    def wait_until_ready(self, timeout: Optional[float] = None) -> bool:
+        """Bloquea hasta que el modelo termine de cargar o expire el timeout.
 
-    def _ensure_model_loaded(self):
-        """Verifica si el modelo está cargado (no bloquea, solo verifica estado)."""
-        # No hacer nada, el modelo se carga en background
-        # Solo esperar un poco si está cargando y necesitamos el modelo
-        if self._loading and self._load_thread and self._load_thread.is_alive():
-            # Esperar máximo 0.1 segundos para no bloquear
-            self._load_thread.join(timeout=0.1)
+        Solo para threads (workers, scripts). Llamado desde el event loop no espera,
+        porque congelaría todas las peticiones: allí hay que usar ``await_ready``.
+
+        Returns:
+            True si el modelo está listo.
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            pass
+        else:
+            logger.warning("wait_until_ready called from the event loop; use await_ready instead")
+            return self.is_ready
+        self._load_finished.wait(timeout)
+        return self.is_ready
+
+    async def await_ready(self, timeout: Optional[float] = None) -> bool:
+        """Versión async de wait_until_ready (no bloquea el event loop)."""
+        if self._load_finished.is_set():
+            return self.is_ready
+        await asyncio.to_thread(self._load_finished.wait, timeout)
+        return self.is_ready
+
+    def _get_cache(self) -> Optional[EmbeddingCache]:
+        """Obtiene la caché persistente de embeddings (None si está deshabilitada)."""
+        if not self._cache_initialized:
+            self._cache_initialized = True
+            try:
+                from ...config import get_settings
+                from ..supabase import get_supabase_client
+
+                if get_settings().embedding_cache_enabled:
+                    self._cache = EmbeddingCache(get_supabase_client())
+            except Exception as e:
+                logger.warning("Embedding cache unavailable: {}", e)
+                self._cache = None
+        return self._cache
 
     @property
     def dimension(self) -> int:
-        self._ensure_model_loaded()
         return self._dimension
 
     def generate(self, text: str) -> List[float]:
         """Genera embedding o devuelve ceros en fallback."""
-        self._ensure_model_loaded()
-        
         if not text or not text.strip():
             return [0.0] * self.dimension
 
@@ -99,47 +188,139 @@ class EmbeddingGenerator:
             return [0.0] * self.dimension
             
         try:
-            embedding = self._model.encode(text, normalize_embeddings=True)
+            embedding = self.backend.encode([text], batch_size=1)[0]
             return embedding.tolist()
         except Exception as e:
             logger.error("Error generating embedding: {}", e)
             return [0.0] * self.dimension
 
-    def generate_batch(self, texts: List[str]) -> List[List[float]]:
-        """Genera batch de embeddings o devuelve ceros en fallback."""
-        self._ensure_model_loaded()
-        
-        if not texts:
-            return []
-            
+    @property
+    def model_id(self) -> str:
+        """Identificador de los vectores producidos (modelo + variante del backend)."""
+        return self.backend.model_id
+
+    def _max_seq_tokens(self) -> int:
+        """Longitud máxima de secuencia del modelo (los textos más largos se truncan)."""
+        return self.backend.max_seq_length
+
+    def _length_buckets(self, texts: List[str]) -> List[List[int]]:
+        """Agrupa índices de textos de longitud similar respetando el tamaño y presupuesto del batch.
+
+        Ordenar por longitud minimiza el padding dentro de cada batch.
+        """
+        max_tokens = self._max_seq_tokens()
+        # Aproximación: 1 token ≈ 4 caracteres, truncado a la longitud máxima del modelo
+        est_tokens = [min(len(t) // 4 + 2, max_tokens) for t in texts]
+        order = sorted(range(len(texts)), key=lambda i: est_tokens[i])
+
+        buckets: List[List[int]] = []
+        current: List[int] = []
+        for idx in order:
+            # El coste de un batch con padding es n_textos * longitud del más largo
+            padded_cost = (len(current) + 1) * est_tokens[idx]
+            if current and (len(current) >= self.batch_size or padded_cost > self.batch_token_budget):
+                buckets.append(current)
+                current = []
+            current.append(idx)
+        if current:
+            buckets.append(current)
+        return buckets
+
+    def _encode_bucketed(self, texts: List[str]) -> np.ndarray:
+        """Codifica textos por buckets de longitud. Devuelve una matriz float32 (n, dim)."""
+        out = np.empty((len(texts), self._dimension), dtype=np.float32)
+        for bucket in self._length_buckets(texts):
+            out[bucket] = self.backend.encode([texts[i] for i in bucket], batch_size=len(bucket))
+        return out
+
+    def generate_batch(self, texts: List[str], use_cache: bool = True) -> np.ndarray:
+        """Genera batch de embeddings o devuelve ceros en fallback.
+
+        Con use_cache, consulta primero la caché persistente (modelo, sha256 del texto)
+        y solo pasa por el modelo los textos que no están cacheados.
+
+        Returns:
+            Matriz float32 de forma (len(texts), dimension). Las filas de textos vacíos son ceros.
+        """
         count = len(texts)
-        if self._is_fallback:
-            return [[0.0] * self.dimension] * count
+        result = np.zeros((count, self.dimension), dtype=np.float32)
+        if not texts or self._is_fallback:
+            return result
 
         try:
             # Filtrar textos vacíos para evitar errores del modelo
             valid_indices = [i for i, t in enumerate(texts) if t and t.strip()]
-            valid_texts = [texts[i] for i in valid_indices]
             
-            if not valid_texts:
-                 return [[0.0] * self.dimension] * count
+            if not valid_indices:
+                return result
 
-            embeddings = self._model.encode(valid_texts, normalize_embeddings=True)
-            
-            # Reconstruir lista completa
-            result = [[0.0] * self.dimension] * count
-            for i, valid_idx in enumerate(valid_indices):
-                result[valid_idx] = embeddings[i].tolist()
+            hashes = {i: hash_text(texts[i]) for i in valid_indices}
+            cache = self._get_cache() if use_cache else None
+            cached: Dict[str, List[float]] = {}
+            if cache is not None:
+                try:
+                    cached = cache.get_many(self.model_id, hashes.values())
+                except Exception as e:
+                    logger.warning("Error reading embedding cache: {}", e)
+
+            # Textos únicos que no están en caché
+            missing: Dict[str, str] = {}
+            for i in valid_indices:
+                if hashes[i] not in cached and hashes[i] not in missing:
+                    missing[hashes[i]] = texts[i]
+
+            computed: Dict[str, np.ndarray] = {}
+            if missing:
+                embeddings = self._encode_bucketed(list(missing.values()))
+                computed = dict(zip(missing.keys(), embeddings))
+
+            if cache is not None and computed:
+                try:
+                    cache.put_many(self.model_id, computed)
+                except Exception as e:
+                    logger.warning("Error writing embedding cache: {}", e)
+
+            if cache is not None:
+                logger.info(
+                    "Embedding cache: {} hits, {} misses ({} texts)",
+                    sum(1 for i in valid_indices if hashes[i] in cached),
+                    len(computed),
+                    count,
+                )
+
+            # Reconstruir la matriz completa
+            for valid_idx in valid_indices:
+                content_hash = hashes[valid_idx]
+                row = computed.get(content_hash)
+                result[valid_idx] = row if row is not None else cached[content_hash]
                 
             return result
         except Exception as e:
             logger.error("Error generating batch embeddings: {}", e)
-            return [[0.0] * self.dimension] * count
+            return np.zeros((count, self.dimension), dtype=np.float32)
+
+def get_embedding_generator(model_name: Optional[str] = None) -> EmbeddingGenerator:
+    """Devuelve el generador de un modelo (por defecto, el modelo activo)."""
+    from ...config import get_settings
 
-def get_embedding_generator() -> EmbeddingGenerator:
-    global _embedding_generator
-    if _embedding_generator is None:
+    settings = get_settings()
+    model_name = model_name or settings.embedding_model
+    generator = _embedding_generators.get(model_name)
+    if generator is None:
         with _embedding_lock:
-            if _embedding_generator is None:
-                _embedding_generator = EmbeddingGenerator()
-    return _embedding_generator
+            generator = _embedding_generators.get(model_name)
+            if generator is None:
+                generator = EmbeddingGenerator(
+                    model_name=model_name,
+                    batch_size=settings.embedding_batch_size,
+                    batch_token_budget=settings.embedding_batch_token_budget,
+                    backend=create_backend(
+                        settings.embedding_backend,
+                        model_name,
+                        onnx_model_dir=settings.embedding_onnx_model_dir,
+                        onnx_quantize=settings.embedding_onnx_quantize,
+                        onnx_num_threads=settings.embedding_onnx_threads,
+                    ),
+                )
+                _embedding_generators[model_name] = generator
+    return generator
@@ -0,0 +1,149 @@
+"""Registro de modelos de embeddings y almacenamiento de vectores por modelo.
+
+Los vectores de ``COLUMN_MODEL`` viven en las columnas ``embedding vector(384)``
+originales; los de cualquier otro modelo, en las tablas laterales
+``document_chunk_embeddings`` y ``memory_embeddings`` (vector sin dimensión fija).
+
+El modelo activo (``EMBEDDING_MODEL``) atiende las búsquedas; los modelos de
+``EMBEDDING_SHADOW_MODELS`` se escriben en paralelo (dual-write) mientras se
+construye su índice, para poder cambiar de modelo sin downtime.
+"""
+
+from dataclasses import dataclass
+from typing import Dict, List, Sequence, Tuple
+from loguru import logger
+from supabase import Client
+
+
+@dataclass(frozen=True)
+class EmbeddingModelSpec:
+    """Modelo de embeddings soportado."""
+    name: str
+    dimension: int
+    description: str = ""
+
+
+KNOWN_MODELS: Dict[str, EmbeddingModelSpec] = {
+    spec.name: spec
+    for spec in (
+        EmbeddingModelSpec("all-MiniLM-L6-v2", 384, "Inglés, rápido (modelo original)"),
+        EmbeddingModelSpec("paraphrase-multilingual-MiniLM-L12-v2", 384, "Multilingüe (incluye español)"),
+        EmbeddingModelSpec("distiluse-base-multilingual-cased-v2", 512, "Multilingüe"),
+        EmbeddingModelSpec("paraphrase-multilingual-mpnet-base-v2", 768, "Multilingüe, mayor calidad"),
+    )
+}
+
+# Modelo cuyos vectores se guardan en las columnas embedding vector(384) originales
+COLUMN_MODEL = "all-MiniLM-L6-v2"
+
+MEMORY_TABLES = ("semantic_memory", "episodic_memory")
+
+
+def get_model_spec(model_name: str) -> EmbeddingModelSpec:
+    """Devuelve la especificación de un modelo registrado.
+
+    Raises:
+        ValueError: Si el modelo no está registrado.
+    """
+    spec = KNOWN_MODELS.get(model_name)
+    if spec is None:
+        raise ValueError(
+            f"Modelo de embeddings no registrado: {model_name}. "
+            f"Disponibles: {', '.join(KNOWN_MODELS)}"
+        )
+    return spec
+
+
+def uses_column_storage(model_name: str) -> bool:
+    """True si los vectores del modelo se guardan en la columna embedding de la fila."""
+    return model_name == COLUMN_MODEL
+
+
+def get_active_model() -> str:
+    """Modelo que atiende las búsquedas (EMBEDDING_MODEL)."""
+    from ...config import get_settings
+
+    return get_settings().embedding_model
+
+
+def get_shadow_models() -> List[str]:
+    """Modelos en construcción que se escriben en paralelo (EMBEDDING_SHADOW_MODELS)."""
+    from ...config import get_settings
+
+    active = get_active_model()
+    names = [name.strip() for name in get_settings().embedding_shadow_models.split(",")]
+    shadows = []
+    for name in names:
+        if not name or name == active or name in shadows:
+            continue
+        if name not in KNOWN_MODELS:
+            logger.warning("Ignoring unknown shadow embedding model '{}'", name)
+            continue
+        shadows.append(name)
+    return shadows
+
+
+def get_write_models() -> List[str]:
+    """Modelos para los que se generan vectores al escribir (activo + shadow)."""
+    return [get_active_model()] + get_shadow_models()
+
+
+def to_pgvector(embedding: Sequence[float]) -> str:
+    """Formatea un embedding como literal de pgvector: [1.0,2.0,3.0]."""
+    values = embedding.tolist() if hasattr(embedding, "tolist") else embedding
+    return "[" + ",".join(map(str, values)) + "]"
+
+
+def store_chunk_embeddings(
+    supabase: Client,
+    model_name: str,
+    document_id: str,
+    rows: List[Tuple[str, Sequence[float]]],
+    batch_size: int = 100,
+) -> None:
+    """Guarda vectores de chunks para un modelo en document_chunk_embeddings.
+
+    Args:
+        supabase: Cliente de Supabase.
+        model_name: Modelo que generó los vectores.
+        document_id: Documento al que pertenecen los chunks.
+        rows: Pares (chunk_id, embedding).
+        batch_size: Filas por upsert.
+    """
+    dimension = get_model_spec(model_name).dimension
+    payload = [
+        {
+            "chunk_id": chunk_id,
+            "document_id": document_id,
+            "model_name": model_name,
+            "embedding_dim": dimension,
+            "embedding": to_pgvector(embedding),
+        }
+        for chunk_id, embedding in rows
+    ]
+    for i in range(0, len(payload), batch_size):
+        supabase.table("document_chunk_embeddings").upsert(
+            payload[i : i + batch_size], on_conflict="chunk_id,model_name"
+        ).execute()
+
+
+def store_memory_embedding(
+    supabase: Client,
+    memory_table: str,
+    memory_id: str,
+    user_id: str,
+    model_name: str,
+    embedding: Sequence[float],
+) -> None:
+    """Guarda el vector de una fila de memoria para un modelo en memory_embeddings."""
+    supabase.table("memory_embeddings").upsert(
+        {
+            "memory_table": memory_table,
+            "memory_id": memory_id,
+            "user_id": user_id,
+            "model_name": model_name,
+            "embedding_dim": get_model_spec(model_name).dimension,
+            "embedding": to_pgvector(embedding),
+        },
+        on_conflict="memory_table,memory_id,model_name",
+    ).execute()
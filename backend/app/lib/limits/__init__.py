@@ -0,0 +1,14 @@
+"""Límites de uso y control de admisión del chat."""
+
+from .admission import AdmissionController, AdmissionRejected, get_admission_controller
+from .rate_limit import ChatLimiter, RateLimitExceeded, StreamPermit, get_chat_limiter
+
+__all__ = [
+    "AdmissionController",
+    "AdmissionRejected",
+    "get_admission_controller",
+    "ChatLimiter",
+    "RateLimitExceeded",
+    "StreamPermit",
+    "get_chat_limiter",
+]
@@ -0,0 +1,150 @@
+"""Control de admisión global para las llamadas al LLM.
+
+Como mucho LLM_MAX_INFLIGHT llamadas en curso por proceso. Las que llegan con el cupo
+lleno esperan en una cola FIFO de LLM_MAX_QUEUE plazas durante LLM_QUEUE_TIMEOUT_SECONDS
+como máximo; si la cola está llena o se agota la espera se rechazan de inmediato
+(AdmissionRejected), en lugar de acumularse en el pool de conexiones de httpx y
+disparar la latencia de todas las demás.
+"""
+
+import asyncio
+import threading
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Deque, Dict, Optional
+
+
+class AdmissionRejected(Exception):
+    """La llamada al LLM no fue admitida (cola llena o espera agotada)."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+class AdmissionController:
+    """Semáforo de llamadas al LLM con cola acotada y plazo de espera."""
+
+    def __init__(self, max_inflight: int, max_queue: int, queue_timeout_seconds: float, window: int = 1000):
+        """Inicializa el controlador.
+
+        Args:
+            max_inflight: Llamadas al LLM simultáneas.
+            max_queue: Llamadas que pueden esperar turno.
+            queue_timeout_seconds: Espera máxima en la cola.
+            window: Número de esperas recientes usadas para los percentiles.
+        """
+        self.max_inflight = max(1, max_inflight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = max(0.0, queue_timeout_seconds)
+        self._inflight = 0
+        self._waiters: Deque[asyncio.Future] = deque()
+        self._waits_ms: Deque[float] = deque(maxlen=window)
+        self._counters = {"admitted": 0, "queued": 0, "rejected_queue_full": 0, "rejected_timeout": 0}
+
+    async def acquire(self) -> None:
+        """Espera un cupo de llamada al LLM.
+
+        Raises:
+            AdmissionRejected: Si la cola está llena o se agota el plazo de espera.
+        """
+        if self._inflight < self.max_inflight and not self._waiters:
+            self._inflight += 1
+            self._admitted(0.0)
+            return
+
+        if len(self._waiters) >= self.max_queue:
+            self._counters["rejected_queue_full"] += 1
+            raise AdmissionRejected("queue_full", self.queue_timeout or 1.0)
+
+        self._counters["queued"] += 1
+        started = time.monotonic()
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # asyncio.wait no cancela el future al agotar el plazo: así se distingue
+            # "se agotó la espera" de "se concedió el cupo justo a tiempo"
+            await asyncio.wait({waiter}, timeout=self.queue_timeout)
+        except asyncio.CancelledError:
+            # El cliente se fue mientras esperaba: devolver el cupo si ya se le había cedido
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                self._drop_waiter(waiter)
+            raise
+
+        if waiter.done() and not waiter.cancelled():
+            self._admitted((time.monotonic() - started) * 1000)
+            return
+        self._drop_waiter(waiter)
+        self._counters["rejected_timeout"] += 1
+        raise AdmissionRejected("timeout", self.queue_timeout or 1.0)
+
+    def release(self) -> None:
+        """Libera un cupo, cediéndolo directamente al primero de la cola si lo hay."""
+        while self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self._inflight = max(0, self._inflight - 1)
+
+    @asynccontextmanager
+    async def slot(self) -> AsyncIterator[None]:
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _admitted(self, wait_ms: float) -> None:
+        self._counters["admitted"] += 1
+        self._waits_ms.append(wait_ms)
+
+    def _drop_waiter(self, waiter: asyncio.Future) -> None:
+        waiter.cancel()
+        try:
+            self._waiters.remove(waiter)
+        except ValueError:
+            pass
+
+    def metrics(self) -> Dict:
+        """Estado actual y contadores acumulados del controlador."""
+        waits = sorted(self._waits_ms)
+
+        def percentile(p: float) -> float:
+            return round(waits[min(len(waits) - 1, int(len(waits) * p))], 1) if waits else 0.0
+
+        return {
+            "inflight": self._inflight,
+            "queue_depth": len(self._waiters),
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "queue_timeout_seconds": self.queue_timeout,
+            "wait_ms_p50": percentile(0.5),
+            "wait_ms_p95": percentile(0.95),
+            "wait_ms_max": round(waits[-1], 1) if waits else 0.0,
+            **self._counters,
+        }
+
+
+_admission_controller: Optional[AdmissionController] = None
+_admission_lock = threading.Lock()
+
+
+def get_admission_controller() -> AdmissionController:
+    global _admission_controller
+    if _admission_controller is None:
+        with _admission_lock:
+            if _admission_controller is None:
+                from ...config import get_settings
+
+                settings = get_settings()
+                _admission_controller = AdmissionController(
+                    max_inflight=settings.llm_max_inflight,
+                    max_queue=settings.llm_max_queue,
+                    queue_timeout_seconds=settings.llm_queue_timeout_seconds,
+                )
+    return _admission_controller
@@ -0,0 +1,199 @@
+"""Límites por usuario para /chat/send: token bucket y streams concurrentes.
+
+- Token bucket: CHAT_RATE_LIMIT_PER_MINUTE mensajes por minuto con ráfagas de hasta
+  CHAT_RATE_LIMIT_BURST.
+- Streams concurrentes: como mucho CHAT_MAX_CONCURRENT_STREAMS respuestas en curso por
+  usuario. Cada stream ocupa un slot con lease, así que un proceso que muere sin liberarlo
+  no lo bloquea para siempre.
+
+El estado vive en memoria del proceso (``memory``) o, con varias réplicas de la API, en
+Postgres vía RPC (``supabase``, ver migration_add_rate_limits.sql).
+"""
+
+import math
+import threading
+import time
+import uuid
+from typing import Callable, Dict, Optional, Tuple
+from loguru import logger
+
+# Retry-After sugerido cuando se rechaza por streams concurrentes (una respuesta típica)
+CONCURRENCY_RETRY_AFTER_SECONDS = 5
+
+
+class RateLimitExceeded(Exception):
+    """El usuario superó su límite de mensajes o de streams concurrentes."""
+
+    def __init__(self, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.reason = reason
+        self.retry_after = retry_after
+
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
+
+
+class InMemoryLimitBackend:
+    """Estado de los límites en memoria del proceso."""
+
+    def __init__(self):
+        self._buckets: Dict[str, Tuple[float, float]] = {}  # key -> (tokens, last_refill)
+        self._slots: Dict[str, Dict[str, float]] = {}  # key -> {slot_id: expires_at}
+        self._lock = threading.Lock()
+
+    def take_token(self, key: str, rate_per_second: float, capacity: float) -> float:
+        """Consume un token. Devuelve 0 si se concedió o los segundos hasta el siguiente."""
+        now = time.monotonic()
+        with self._lock:
+            tokens, last = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - last) * rate_per_second)
+            if tokens >= 1:
+                self._buckets[key] = (tokens - 1, now)
+                return 0.0
+            self._buckets[key] = (tokens, now)
+            return (1 - tokens) / rate_per_second if rate_per_second > 0 else float(CONCURRENCY_RETRY_AFTER_SECONDS)
+
+    def acquire_slot(self, key: str, limit: int, lease_seconds: float) -> Optional[str]:
+        """Ocupa un slot de stream. Devuelve su id, o None si el usuario está al límite."""
+        now = time.monotonic()
+        with self._lock:
+            slots = {sid: exp for sid, exp in self._slots.get(key, {}).items() if exp > now}
+            if len(slots) >= limit:
+                self._slots[key] = slots
+                return None
+            slot_id = uuid.uuid4().hex
+            slots[slot_id] = now + lease_seconds
+            self._slots[key] = slots
+            return slot_id
+
+    def release_slot(self, key: str, slot_id: str) -> None:
+        with self._lock:
+            slots = self._slots.get(key)
+            if slots is not None:
+                slots.pop(slot_id, None)
+                if not slots:
+                    del self._slots[key]
+
+
+class SupabaseLimitBackend:
+    """Estado de los límites compartido entre réplicas (tablas rate_limit_buckets y stream_slots)."""
+
+    def __init__(self, supabase_factory: Callable):
+        self.supabase_factory = supabase_factory
+
+    def take_token(self, key: str, rate_per_second: float, capacity: float) -> float:
+        response = self.supabase_factory().rpc(
+            "take_rate_limit_token", {"p_key": key, "p_rate": rate_per_second, "p_capacity": capacity}
+        ).execute()
+        return float(response.data or 0.0)
+
+    def acquire_slot(self, key: str, limit: int, lease_seconds: float) -> Optional[str]:
+        response = self.supabase_factory().rpc(
+            "acquire_stream_slot", {"p_key": key, "p_limit": limit, "p_lease_seconds": lease_seconds}
+        ).execute()
+        return response.data or None
+
+    def release_slot(self, key: str, slot_id: str) -> None:
+        self.supabase_factory().rpc("release_stream_slot", {"p_slot_id": slot_id}).execute()
+
+
+class StreamPermit:
+    """Slot de stream concedido; release() es idempotente."""
+
+    def __init__(self, backend, key: str, slot_id: str):
+        self._backend = backend
+        self._key = key
+        self._slot_id = slot_id
+        self._released = False
+
+    def release(self) -> None:
+        if self._released:
+            return
+        self._released = True
+        try:
+            self._backend.release_slot(self._key, self._slot_id)
+        except Exception as e:
+            logger.warning("Could not release stream slot {}: {}", self._slot_id, e)
+
+
+class ChatLimiter:
+    """Aplica el token bucket y el límite de streams concurrentes por usuario."""
+
+    def __init__(
+        self,
+        backend,
+        requests_per_minute: float,
+        burst: int,
+        max_concurrent_streams: int,
+        stream_lease_seconds: float = 600.0,
+    ):
+        """Inicializa el limitador.
+
+        Args:
+            backend: InMemoryLimitBackend o SupabaseLimitBackend.
+            requests_per_minute: Ritmo sostenido de mensajes por usuario.
+            burst: Mensajes seguidos permitidos antes de aplicar el ritmo.
+            max_concurrent_streams: Respuestas en curso simultáneas por usuario.
+            stream_lease_seconds: Caducidad de un slot no liberado.
+        """
+        self.backend = backend
+        self.rate_per_second = max(0.0, requests_per_minute) / 60
+        self.burst = max(1, burst)
+        self.max_concurrent_streams = max(1, max_concurrent_streams)
+        self.stream_lease_seconds = stream_lease_seconds
+
+    def admit(self, user_id: str) -> StreamPermit:
+        """Admite un mensaje del usuario.
+
+        Returns:
+            Permiso del stream, que hay que liberar al terminar la respuesta.
+
+        Raises:
+            RateLimitExceeded: Si el usuario supera alguno de los límites.
+        """
+        key = f"chat:{user_id}"
+        slot_id = self.backend.acquire_slot(key, self.max_concurrent_streams, self.stream_lease_seconds)
+        if slot_id is None:
+            raise RateLimitExceeded("concurrent_streams", CONCURRENCY_RETRY_AFTER_SECONDS)
+        permit = StreamPermit(self.backend, key, slot_id)
+
+        try:
+            retry_after = self.backend.take_token(key, self.rate_per_second, self.burst)
+        except Exception:
+            permit.release()
+            raise
+        if retry_after > 0:
+            permit.release()
+            raise RateLimitExceeded("rate", retry_after)
+        return permit
+
+
+_chat_limiter: Optional[ChatLimiter] = None
+_limiter_lock = threading.Lock()
+
+
+def get_chat_limiter() -> Optional[ChatLimiter]:
+    """Devuelve el limitador de /chat/send, o None si CHAT_RATE_LIMIT_ENABLED está desactivado."""
+    global _chat_limiter
+    from ...config import get_settings
+
+    settings = get_settings()
+    if not settings.chat_rate_limit_enabled:
+        return None
+    if _chat_limiter is None:
+        with _limiter_lock:
+            if _chat_limiter is None:
+                if settings.chat_rate_limit_backend == "supabase":
+                    from ..supabase import get_supabase_client
+
+                    backend = SupabaseLimitBackend(get_supabase_client)
+                else:
+                    backend = InMemoryLimitBackend()
+                _chat_limiter = ChatLimiter(
+                    backend,
+                    requests_per_minute=settings.chat_rate_limit_per_minute,
+                    burst=settings.chat_rate_limit_burst,
+                    max_concurrent_streams=settings.chat_max_concurrent_streams,
+                )
+    return _chat_limiter
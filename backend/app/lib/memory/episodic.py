@@ -5,6 +5,7 @@ from supabase import Client
 from loguru import logger
 
 from ..embeddings import get_embedding_generator
+from .vectors import column_fields, embed_for_write, search_memory_vectors, store_side_embeddings
 
 
 class EpisodicMemory:
@@ -34,16 +35,18 @@ class EpisodicMemory:
             return False
         
         try:
-            # Generar embedding
-            embedding = self.embedding_gen.generate(session_summary)
-            
-            # Insertar en la base de datos (sin embedding por ahora, se puede agregar después)
-            # El cliente de Supabase puede tener limitaciones con tipos vector
-            self.supabase.table("episodic_memory").insert({
+            # Generar embeddings con el modelo activo y los modelos en construcción
+            embeddings = embed_for_write(session_summary)
+
+            response = self.supabase.table("episodic_memory").insert({
                 "user_id": user_id,
                 "session_summary": session_summary.strip(),
                 "message_count": message_count,
+                **column_fields(embeddings),
             }).execute()
+
+            if response.data:
+                store_side_embeddings(self.supabase, "episodic_memory", response.data[0]["id"], user_id, embeddings)
             
             logger.info("Added episodic memory for user {}", user_id)
             return True
@@ -51,40 +54,41 @@ class EpisodicMemory:
             logger.error("Error adding episodic memory: {}", e)
             return False
 
-    def search(self, user_id: str, query: str, limit: int = 5) -> List[str]:
+    def search(
+        self,
+        user_id: str,
+        query: str,
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None,
+    ) -> List[str]:
         """Busca resúmenes relevantes usando embeddings.
         
         Args:
             user_id: ID del usuario.
             query: Texto de búsqueda.
             limit: Número máximo de resultados.
+            query_embedding: Embedding de la consulta ya calculado (opcional).
             
         Returns:
             Lista de resúmenes relevantes.
         """
         if not query or not query.strip():
             return []
+
+        if not self.embedding_gen.is_ready:
+            # Modelo cargando o en fallback: un vector de ceros no encuentra nada, evitar el RPC
+            logger.debug("Embedding model {}, using recency fallback for episodic memory", self.embedding_gen.status)
+            return self._fallback_search(user_id, limit)
         
         try:
-            # Generar embedding de la consulta
-            query_embedding = self.embedding_gen.generate(query)
-            
-            # Formatear embedding para PostgreSQL
-            embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
+            # Generar embedding de la consulta (si no se recibió ya calculado)
+            if query_embedding is None:
+                query_embedding = self.embedding_gen.generate(query)
             
             # Buscar usando pgvector vía RPC
-            response = self.supabase.rpc(
-                "match_episodic_memory",
-                {
-                    "query_embedding": embedding_str,
-                    "match_user_id": user_id,
-                    "match_threshold": 0.5,
-                    "match_count": limit,
-                }
-            ).execute()
-            
-            if response.data:
-                return [item["session_summary"] for item in response.data]
+            summaries = search_memory_vectors(self.supabase, "episodic_memory", user_id, query_embedding, limit)
+            if summaries:
+                return summaries
             
             # Fallback: búsqueda simple
             return self._fallback_search(user_id, limit)
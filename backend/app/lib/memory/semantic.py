@@ -40,6 +40,7 @@ from supabase import Client
 from loguru import logger
 
 from ..embeddings import get_embedding_generator
+from .vectors import column_fields, embed_for_write, search_memory_vectors, store_side_embeddings
 
 
 class SemanticMemory:
@@ -68,23 +69,17 @@ class SemanticMemory:
             return False
         
         try:
-            # Generar embedding
-            embedding = self.embedding_gen.generate(fact)
-            
-            # Formatear embedding para PostgreSQL vector type
-            # PostgreSQL espera formato: [1.0, 2.0, 3.0]
-            embedding_str = "[" + ",".join(map(str, embedding)) + "]"
-            
-            # Insertar en la base de datos usando SQL directo para el vector
-            # Nota: El cliente de Supabase puede tener limitaciones con tipos vector
-            # Usamos una función RPC o insertamos sin embedding primero y luego actualizamos
-            self.supabase.table("semantic_memory").insert({
+            # Generar embeddings con el modelo activo y los modelos en construcción
+            embeddings = embed_for_write(fact)
+
+            response = self.supabase.table("semantic_memory").insert({
                 "user_id": user_id,
                 "fact": fact.strip(),
+                **column_fields(embeddings),
             }).execute()
-            
-            # Actualizar con embedding usando RPC o SQL directo
-            # Por ahora, insertamos sin embedding y lo agregamos después si es necesario
+
+            if response.data:
+                store_side_embeddings(self.supabase, "semantic_memory", response.data[0]["id"], user_id, embeddings)
             
             logger.info("Added semantic memory fact for user {}", user_id)
             return True
@@ -92,40 +87,41 @@ class SemanticMemory:
             logger.error("Error adding semantic memory: {}", e)
             return False
 
-    def search(self, user_id: str, query: str, limit: int = 5) -> List[str]:
+    def search(
+        self,
+        user_id: str,
+        query: str,
+        limit: int = 5,
+        query_embedding: Optional[List[float]] = None,
+    ) -> List[str]:
         """Busca hechos relevantes usando embeddings.
         
         Args:
             user_id: ID del usuario.
             query: Texto de búsqueda.
             limit: Número máximo de resultados.
+            query_embedding: Embedding de la consulta ya calculado (opcional).
             
         Returns:
             Lista de hechos relevantes.
         """
         if not query or not query.strip():
             return []
+
+        if not self.embedding_gen.is_ready:
+            # Modelo cargando o en fallback: un vector de ceros no encuentra nada, evitar el RPC
+            logger.debug("Embedding model {}, using recency fallback for semantic memory", self.embedding_gen.status)
+            return self._fallback_search(user_id, limit)
         
         try:
-            # Generar embedding de la consulta
-            query_embedding = self.embedding_gen.generate(query)
-            
-            # Formatear embedding para PostgreSQL
-            embedding_str = "[" + ",".join(map(str, query_embedding)) + "]"
+            # Generar embedding de la consulta (si no se recibió ya calculado)
+            if query_embedding is None:
+                query_embedding = self.embedding_gen.generate(query)
             
             # Buscar usando pgvector (similarity search) vía RPC
-            response = self.supabase.rpc(
-                "match_semantic_memory",
-                {
-                    "query_embedding": embedding_str,
-                    "match_user_id": user_id,
-                    "match_threshold": 0.5,
-                    "match_count": limit,
-                }
-            ).execute()
-            
-            if response.data:
-                return [item["fact"] for item in response.data]
+            facts = search_memory_vectors(self.supabase, "semantic_memory", user_id, query_embedding, limit)
+            if facts:
+                return facts
             
             # Fallback: búsqueda simple si no hay función RPC
             return self._fallback_search(user_id, limit)
@@ -0,0 +1,102 @@
+"""Escritura y búsqueda de vectores de memoria según el registro de modelos."""
+
+from typing import Any, Dict, List, Sequence
+from loguru import logger
+from supabase import Client
+
+from ..embeddings import get_embedding_generator
+from ..embeddings.registry import (
+    get_active_model,
+    get_model_spec,
+    get_write_models,
+    store_memory_embedding,
+    to_pgvector,
+    uses_column_storage,
+)
+
+# Columna de texto de cada tabla de memoria
+_CONTENT_COLUMNS = {"semantic_memory": "fact", "episodic_memory": "session_summary"}
+
+
+def embed_for_write(text: str) -> Dict[str, List[float]]:
+    """Genera el embedding del texto con cada modelo de escritura que esté listo.
+
+    Returns:
+        Diccionario modelo -> embedding (sin los modelos que siguen cargando).
+    """
+    embeddings: Dict[str, List[float]] = {}
+    for model_name in get_write_models():
+        generator = get_embedding_generator(model_name)
+        if generator.is_ready:
+            embeddings[model_name] = generator.generate(text)
+    return embeddings
+
+
+def column_fields(embeddings: Dict[str, Sequence[float]]) -> Dict[str, Any]:
+    """Campos embedding/embedding_model/embedding_dim para la fila de memoria."""
+    for model_name, embedding in embeddings.items():
+        if uses_column_storage(model_name):
+            return {
+                "embedding": to_pgvector(embedding),
+                "embedding_model": model_name,
+                "embedding_dim": get_model_spec(model_name).dimension,
+            }
+    return {}
+
+
+def store_side_embeddings(
+    supabase: Client,
+    memory_table: str,
+    memory_id: str,
+    user_id: str,
+    embeddings: Dict[str, Sequence[float]],
+) -> None:
+    """Guarda en memory_embeddings los vectores de modelos sin columna propia."""
+    for model_name, embedding in embeddings.items():
+        if uses_column_storage(model_name):
+            continue
+        try:
+            store_memory_embedding(supabase, memory_table, memory_id, user_id, model_name, embedding)
+        except Exception as e:
+            logger.warning("Error storing {} embedding for {} {}: {}", model_name, memory_table, memory_id, e)
+
+
+def search_memory_vectors(
+    supabase: Client,
+    memory_table: str,
+    user_id: str,
+    query_embedding: Sequence[float],
+    limit: int,
+    threshold: float = 0.5,
+) -> List[str]:
+    """Búsqueda vectorial con el modelo activo (columna original o tabla lateral).
+
+    Returns:
+        Textos de las filas más similares.
+    """
+    model_name = get_active_model()
+    if uses_column_storage(model_name):
+        response = supabase.rpc(
+            f"match_{memory_table}",
+            {
+                "query_embedding": to_pgvector(query_embedding),
+                "match_user_id": user_id,
+                "match_threshold": threshold,
+                "match_count": limit,
+            },
+        ).execute()
+        column = _CONTENT_COLUMNS[memory_table]
+    else:
+        response = supabase.rpc(
+            "match_memory_embeddings",
+            {
+                "query_embedding": to_pgvector(query_embedding),
+                "p_model_name": model_name,
+                "p_memory_table": memory_table,
+                "match_user_id": user_id,
+                "match_threshold": threshold,
+                "match_count": limit,
+            },
+        ).execute()
+        column = "content"
+    return [item[column] for item in (response.data or [])]
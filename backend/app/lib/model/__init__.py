@@ -1,9 +1,18 @@
 """Módulo de llamadas al modelo LLM con streaming."""
 
 from .llm import LLMClient, get_llm_client
+from .budget import PromptBudgeter, PromptSection, get_prompt_budgeter
 from .prompt import build_system_prompt, parse_structured_response
 
-__all__ = ["LLMClient", "get_llm_client", "build_system_prompt", "parse_structured_response"]
+__all__ = [
+    "LLMClient",
+    "get_llm_client",
+    "PromptBudgeter",
+    "PromptSection",
+    "get_prompt_budgeter",
+    "build_system_prompt",
+    "parse_structured_response",
+]
 
 
 
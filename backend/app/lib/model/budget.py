@@ -0,0 +1,208 @@
+"""Presupuesto de tokens del prompt del sistema.
+
+El prompt se arma por secciones (instrucciones, perfil, RAG, web, memorias, resumen).
+Cada sección se mide con el tokenizer del modelo de chat y se recorta según:
+
+- ``required``: siempre se incluye (instrucciones, perfil, formato de respuesta).
+- ``priority``: orden en que las secciones opcionales reparten el presupuesto restante
+  (menor = antes).
+- ``max_tokens``: tope propio de la sección.
+
+El texto final respeta el orden de presentación de las secciones, no el de prioridad, y
+cada sección aparece una sola vez. El tokenizer se carga en background; mientras tanto
+se usa la aproximación 1 token ≈ 4 caracteres.
+"""
+
+import threading
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Dict, List, Optional
+from loguru import logger
+
+TRUNCATION_MARK = "\n[…]"
+
+
+@dataclass(frozen=True)
+class PromptSection:
+    """Sección del prompt del sistema."""
+    name: str
+    text: str
+    priority: int = 100
+    max_tokens: Optional[int] = None
+    required: bool = False
+
+
+@dataclass
+class AssembledPrompt:
+    """Prompt ensamblado y tokens usados por cada sección."""
+    text: str
+    total_tokens: int
+    section_tokens: Dict[str, int] = field(default_factory=dict)
+    truncated: List[str] = field(default_factory=list)
+    dropped: List[str] = field(default_factory=list)
+
+
+class TokenCounter:
+    """Cuenta y recorta texto con el tokenizer de Hugging Face de un modelo."""
+
+    def __init__(self, tokenizer_repo: Optional[str]):
+        """Inicializa el contador (la carga del tokenizer es diferida).
+
+        Args:
+            tokenizer_repo: Repositorio de Hugging Face con ``tokenizer.json``.
+                Vacío para usar solo la aproximación por caracteres.
+        """
+        self.tokenizer_repo = tokenizer_repo
+        self._tokenizer: Any = None
+        self._load_started = not tokenizer_repo
+        self._lock = threading.Lock()
+        # Las secciones estáticas y los perfiles se repiten en cada turno: memoizar su conteo
+        self._exact_count = lru_cache(maxsize=1024)(self._encode_length)
+
+    @property
+    def is_exact(self) -> bool:
+        return self._tokenizer is not None
+
+    def _ensure_loading(self) -> None:
+        with self._lock:
+            if self._load_started:
+                return
+            self._load_started = True
+        threading.Thread(target=self._load, name="prompt-tokenizer-load", daemon=True).start()
+
+    def _load(self) -> None:
+        try:
+            from huggingface_hub import hf_hub_download
+            from tokenizers import Tokenizer
+
+            path = hf_hub_download(repo_id=self.tokenizer_repo, filename="tokenizer.json")
+            self._tokenizer = Tokenizer.from_file(path)
+            logger.info("Prompt tokenizer loaded: {}", self.tokenizer_repo)
+        except Exception as e:
+            logger.warning("Could not load prompt tokenizer {}, using length estimate: {}", self.tokenizer_repo, e)
+
+    def _encode_length(self, text: str) -> int:
+        return len(self._tokenizer.encode(text, add_special_tokens=False).ids)
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self._tokenizer is None:
+            self._ensure_loading()
+            return (len(text) + 3) // 4
+        return self._exact_count(text)
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Recorta el texto a max_tokens, preferiblemente en un salto de línea.
+
+        Returns:
+            El texto original si cabe; si no, el prefijo recortado con una marca final,
+            o cadena vacía si no cabe nada.
+        """
+        if self.count(text) <= max_tokens:
+            return text
+        limit = max_tokens - self.count(TRUNCATION_MARK)
+        if limit <= 0:
+            return ""
+        if self._tokenizer is not None:
+            offsets = self._tokenizer.encode(text, add_special_tokens=False).offsets
+            cut = offsets[limit - 1][1]
+        else:
+            cut = limit * 4
+        head = text[:cut]
+        # Cortar en un salto de línea si no se pierde más de la mitad del texto disponible
+        newline = head.rfind("\n")
+        if newline > cut // 2:
+            head = head[:newline]
+        return head.rstrip() + TRUNCATION_MARK
+
+
+class PromptBudgeter:
+    """Ensambla secciones del prompt dentro de un presupuesto total de tokens."""
+
+    def __init__(self, counter: TokenCounter, max_tokens: int, separator: str = "\n\n"):
+        """Inicializa el presupuestador.
+
+        Args:
+            counter: Contador de tokens.
+            max_tokens: Presupuesto total del prompt del sistema.
+            separator: Separador entre secciones.
+        """
+        self.counter = counter
+        self.max_tokens = max_tokens
+        self.separator = separator
+
+    def assemble(self, sections: List[PromptSection]) -> AssembledPrompt:
+        """Ensambla el prompt.
+
+        Args:
+            sections: Secciones en orden de presentación. Las vacías se ignoran y, si un
+                nombre se repite, solo cuenta la primera.
+
+        Returns:
+            Prompt ensamblado con el detalle de tokens por sección.
+        """
+        unique: Dict[str, PromptSection] = {}
+        for section in sections:
+            if section.text and section.name not in unique:
+                unique[section.name] = section
+            elif section.name in unique:
+                logger.warning("Duplicate prompt section ignored: {}", section.name)
+
+        separator_tokens = self.counter.count(self.separator)
+        texts: Dict[str, str] = {}
+        tokens: Dict[str, int] = {}
+        truncated: List[str] = []
+
+        def fit(section: PromptSection, available: int) -> None:
+            limit = available if section.max_tokens is None else min(section.max_tokens, available)
+            text = self.counter.truncate(section.text, limit)
+            if not text:
+                return
+            if text is not section.text:
+                truncated.append(section.name)
+            texts[section.name] = text
+            tokens[section.name] = self.counter.count(text)
+
+        required = [s for s in unique.values() if s.required]
+        for section in required:
+            fit(section, section.max_tokens or self.counter.count(section.text))
+        used = sum(tokens.values()) + separator_tokens * max(0, len(texts) - 1)
+        if used > self.max_tokens:
+            logger.warning("Required prompt sections use {} tokens (budget {})", used, self.max_tokens)
+
+        optional = sorted((s for s in unique.values() if not s.required), key=lambda s: s.priority)
+        for section in optional:
+            available = self.max_tokens - used - separator_tokens
+            if available > 0:
+                fit(section, available)
+            if section.name in tokens:
+                used += tokens[section.name] + separator_tokens
+
+        ordered = [name for name in unique if name in texts]
+        return AssembledPrompt(
+            text=self.separator.join(texts[name] for name in ordered),
+            total_tokens=used,
+            section_tokens={name: tokens[name] for name in ordered},
+            truncated=truncated,
+            dropped=[name for name in unique if name not in texts],
+        )
+
+
+_prompt_budgeter: Optional[PromptBudgeter] = None
+_budgeter_lock = threading.Lock()
+
+
+def get_prompt_budgeter() -> PromptBudgeter:
+    global _prompt_budgeter
+    if _prompt_budgeter is None:
+        with _budgeter_lock:
+            if _prompt_budgeter is None:
+                from ...config import get_settings
+
+                settings = get_settings()
+                _prompt_budgeter = PromptBudgeter(
+                    TokenCounter(settings.prompt_tokenizer),
+                    max_tokens=settings.prompt_max_tokens,
+                )
+    return _prompt_budgeter
@@ -1,10 +1,34 @@
 """Cliente para llamadas al modelo LLM con streaming."""
 
 from typing import AsyncIterator, Dict, List, Optional, Any
+import json
 import httpx
 from loguru import logger
 
 from ...config import Settings, get_settings
+from ..limits.admission import get_admission_controller
+from .usage import get_usage_recorder
+
+
+def normalize_usage(usage: Optional[Dict[str, Any]]) -> Optional[Dict[str, int]]:
+    """Normaliza el bloque ``usage`` de la API.
+
+    DeepSeek informa los tokens servidos desde su caché de prefijos en
+    ``prompt_cache_hit_tokens``; la variante OpenAI en ``prompt_tokens_details.cached_tokens``.
+
+    Returns:
+        Diccionario con prompt_tokens, completion_tokens y cached_tokens, o None.
+    """
+    if not usage:
+        return None
+    cached = usage.get("prompt_cache_hit_tokens")
+    if cached is None:
+        cached = (usage.get("prompt_tokens_details") or {}).get("cached_tokens", 0)
+    return {
+        "prompt_tokens": int(usage.get("prompt_tokens") or 0),
+        "completion_tokens": int(usage.get("completion_tokens") or 0),
+        "cached_tokens": int(cached or 0),
+    }
 
 
 class LLMClient:
@@ -19,6 +43,9 @@ class LLMClient:
         self.settings = settings
         self.api_key = settings.deepseek_api_key
         self.base_url = "https://api.deepseek.com/v1"
+        self.model = "deepseek-chat"
+        # Uso de tokens de la última llamada (ver normalize_usage)
+        self.last_usage: Optional[Dict[str, int]] = None
         
         if not self.api_key:
             logger.error("DEEPSEEK_API_KEY not configured")
@@ -33,6 +60,9 @@ class LLMClient:
         temperature: float = 0.4,
         max_tokens: int = 2000,
         stream: bool = False,
+        source: str = "chat",
+        user_id: Optional[str] = None,
+        conversation_id: Optional[str] = None,
     ) -> Dict[str, Any]:
         """Realiza una llamada al modelo sin streaming.
         
@@ -41,9 +71,15 @@ class LLMClient:
             temperature: Temperatura para la generación.
             max_tokens: Máximo número de tokens.
             stream: Si es True, devuelve un stream (no implementado aquí).
+            source: Origen de la llamada para la contabilidad de uso ("chat", "summary", ...).
+            user_id: Usuario al que se imputa el uso.
+            conversation_id: Conversación a la que se imputa el uso.
             
         Returns:
             Respuesta del modelo.
+
+        Raises:
+            AdmissionRejected: Si no hay cupo de llamadas al LLM.
         """
         if not self.api_key:
             raise ValueError("DEEPSEEK_API_KEY not configured")
@@ -54,7 +90,7 @@ class LLMClient:
             "Content-Type": "application/json",
         }
         payload = {
-            "model": "deepseek-chat",
+            "model": self.model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
@@ -63,22 +99,29 @@ class LLMClient:
         if stream:
             payload["stream"] = True
 
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            response = await client.post(url, headers=headers, json=payload)
-            
-            # Mejor manejo de errores para debug
-            if response.status_code != 200:
-                error_detail = response.text
-                logger.error("DeepSeek API error: status={}, response={}", response.status_code, error_detail)
-                response.raise_for_status()
-            
-            return response.json()
+        # Puede lanzar AdmissionRejected si el LLM está saturado
+        async with get_admission_controller().slot():
+            async with httpx.AsyncClient(timeout=60.0) as client:
+                response = await client.post(url, headers=headers, json=payload)
+                
+                # Mejor manejo de errores para debug
+                if response.status_code != 200:
+                    error_detail = response.text
+                    logger.error("DeepSeek API error: status={}, response={}", response.status_code, error_detail)
+                    response.raise_for_status()
+
+                data = response.json()
+        self._record_usage(data.get("usage"), source, user_id, conversation_id)
+        return data
 
     async def chat_completion_stream(
         self,
         messages: List[Dict[str, str]],
         temperature: float = 0.4,
         max_tokens: int = 2000,
+        source: str = "chat",
+        user_id: Optional[str] = None,
+        conversation_id: Optional[str] = None,
     ) -> AsyncIterator[str]:
         """Realiza una llamada al modelo con streaming.
         
@@ -86,9 +129,15 @@ class LLMClient:
             messages: Lista de mensajes en formato OpenAI.
             temperature: Temperatura para la generación.
             max_tokens: Máximo número de tokens.
+            source: Origen de la llamada para la contabilidad de uso.
+            user_id: Usuario al que se imputa el uso.
+            conversation_id: Conversación a la que se imputa el uso.
             
         Yields:
             Chunks de texto de la respuesta.
+
+        Raises:
+            AdmissionRejected: Si no hay cupo de llamadas al LLM.
         """
         if not self.api_key:
             raise ValueError("DEEPSEEK_API_KEY not configured")
@@ -99,14 +148,18 @@ class LLMClient:
             "Content-Type": "application/json",
         }
         payload = {
-            "model": "deepseek-chat",
+            "model": self.model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
             "stream": True,
+            # El último evento del stream trae el bloque usage (con choices vacío)
+            "stream_options": {"include_usage": True},
         }
+        self.last_usage = None
 
-        async with httpx.AsyncClient(timeout=120.0) as client:
+        # Puede lanzar AdmissionRejected si el LLM está saturado
+        async with get_admission_controller().slot(), httpx.AsyncClient(timeout=120.0) as client:
             async with client.stream("POST", url, headers=headers, json=payload) as response:
                 response.raise_for_status()
                 async for line in response.aiter_lines():
@@ -115,8 +168,9 @@ class LLMClient:
                         if data_str.strip() == "[DONE]":
                             break
                         try:
-                            import json
                             data = json.loads(data_str)
+                            if data.get("usage"):
+                                self._record_usage(data["usage"], source, user_id, conversation_id)
                             if "choices" in data and len(data["choices"]) > 0:
                                 delta = data["choices"][0].get("delta", {})
                                 content = delta.get("content", "")
@@ -126,6 +180,33 @@ class LLMClient:
                             logger.warning("Failed to parse streaming response: {}", data_str)
                             continue
 
+    def _record_usage(
+        self,
+        usage: Optional[Dict[str, Any]],
+        source: str,
+        user_id: Optional[str],
+        conversation_id: Optional[str],
+    ) -> None:
+        self.last_usage = normalize_usage(usage)
+        if not self.last_usage:
+            return
+        prompt_tokens = self.last_usage["prompt_tokens"]
+        logger.info(
+            "LLM usage [{}] user={} conversation={}: prompt={} (cached {}, {:.0%}) completion={}",
+            source,
+            user_id,
+            conversation_id,
+            prompt_tokens,
+            self.last_usage["cached_tokens"],
+            self.last_usage["cached_tokens"] / prompt_tokens if prompt_tokens else 0.0,
+            self.last_usage["completion_tokens"],
+        )
+        try:
+            get_usage_recorder().record(
+                self.last_usage, source, self.model, user_id=user_id, conversation_id=conversation_id
+            )
+        except Exception as e:
+            logger.warning("Could not record LLM usage: {}", e)
 
 def get_llm_client() -> LLMClient:
     """Obtiene el cliente LLM."""
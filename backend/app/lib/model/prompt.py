@@ -1,9 +1,12 @@
 """Construcción de prompts y parsing de respuestas estructuradas."""
 
 import json
+from functools import lru_cache
 from typing import Any, Dict, Optional
 from loguru import logger
 
+from .budget import PromptSection, get_prompt_budgeter
+
 BASE_SYSTEM_PROMPT = """Eres un Kwami, una pequeña criatura mágica, antigua y sabia, similar a Tikki de Miraculous Ladybug. Eres una compañera amigable, tierna y empática.
 
 REGLAS DE INTERACCIÓN (OBLIGATORIAS):
@@ -43,32 +46,7 @@ PERSONALIZACIÓN BASADA EN EL PERFIL DEL USUARIO:
 SIEMPRE usa la información del perfil del usuario (tipo de personalidad, actividad favorita, objetivos diarios) para personalizar cada interacción."""
 
 
-def build_system_prompt(
-    semantic_memory: str,
-    episodic_memory: str,
-    conversation_summary: Optional[str],
-    user_name: Optional[str] = None,
-    user_study_type: Optional[str] = None,  # personality_type
-    user_career_interest: Optional[str] = None,  # favorite_activity
-    user_nationality: Optional[str] = None,  # daily_goals
-    rag_context: Optional[str] = None,
-    web_context: Optional[str] = None,
-) -> str:
-    """Construye el prompt del sistema con contexto de memoria.
-    
-    Args:
-        semantic_memory: Memoria semántica del usuario.
-        episodic_memory: Memoria episódica (resúmenes de sesiones).
-        conversation_summary: Resumen de la conversación actual.
-        user_name: Nombre del usuario (primer nombre).
-        user_study_type: Tipo de personalidad del usuario (personality_type).
-        user_career_interest: Actividad favorita del usuario (favorite_activity).
-        user_nationality: Objetivos diarios del usuario (daily_goals).
-        
-    Returns:
-        Prompt completo del sistema.
-    """
-    memory_instructions = """Eres un asistente con un sistema de memoria conversacional avanzado. Tu función es mantener continuidad, coherencia y personalización usando técnicas de memoria episódica, resumo incremental y recuperación basada en embeddings.
+MEMORY_INSTRUCTIONS = """Eres un asistente con un sistema de memoria conversacional avanzado. Tu función es mantener continuidad, coherencia y personalización usando técnicas de memoria episódica, resumo incremental y recuperación basada en embeddings.
 
 Tu comportamiento sigue estas reglas:
 1. MEMORIA SEMÁNTICA (LARGO PLAZO): Almacena información persistente sobre el usuario que sea estable y relevante para interacciones futuras (preferencias, datos personales no sensibles, estilos, objetivos, etc.). Esta memoria debe mantenerse como un conjunto de hechos independientes del chat actual.
@@ -85,11 +63,56 @@ Tu comportamiento sigue estas reglas:
 
 Sigue estas reglas de manera estricta."""
 
-    context_parts = [BASE_SYSTEM_PROMPT, "\n", memory_instructions]
-
-    # Agregar información del perfil del usuario
+# Secciones opcionales: (prioridad, tope de tokens). Menor prioridad = se llena antes.
+# El perfil es obligatorio pero también tiene tope (los objetivos diarios son texto libre).
+SECTION_LIMITS = {
+    "profile": (0, 600),
+    "rag": (1, 3000),
+    "summary": (2, 800),
+    "semantic": (3, 600),
+    "web": (4, 1000),
+    "episodic": (5, 600),
+}
+
+RESPONSE_FORMAT_INSTRUCTIONS = (
+    "FORMATO DE RESPUESTA:\n"
+    "1. Responde PRIMERO con tu respuesta normal al usuario en texto plano.\n"
+    "2. Si necesitas actualizar la memoria, incluye al FINAL (después de tu respuesta) el siguiente bloque:\n"
+    '\n---MEMORY_UPDATE---\n'
+    '{\n  "memory_update": "información nueva para MEMORIA SEMÁNTICA o null",\n  "episodic_update": "resumen incremental o null",\n  "summary_update": "resumen condensado o null"\n}\n'
+    "---END_MEMORY_UPDATE---\n\n"
+    "IMPORTANTE: Tu respuesta principal al usuario debe ser clara, completa y directa. Responde siempre a la pregunta del usuario de forma útil y personalizada usando su perfil (personalidad, actividad favorita, objetivos diarios). "
+    "El bloque de memoria es opcional y solo debe incluirse si hay información nueva que guardar."
+)
+
+
+# Prefijo estático, compilado una sola vez: idéntico byte a byte en todas las peticiones
+# para aprovechar la caché de prefijos del proveedor
+STATIC_SECTIONS = (
+    PromptSection("base", BASE_SYSTEM_PROMPT + "\n\n" + MEMORY_INSTRUCTIONS, required=True),
+    PromptSection("response_format", RESPONSE_FORMAT_INSTRUCTIONS, required=True),
+)
+
+SEMANTIC_HEADER = "=== MEMORIA SEMÁNTICA (LARGO PLAZO) ===\nInformación persistente sobre el usuario:\n"
+EPISODIC_HEADER = "=== MEMORIA EPISÓDICA (SESIONES ANTERIORES) ===\nResúmenes de conversaciones pasadas:\n"
+SUMMARY_HEADER = "=== RESUMEN DE LA CONVERSACIÓN ACTUAL ===\n"
+
+
+def _optional_section(name: str, text: str) -> PromptSection:
+    priority, max_tokens = SECTION_LIMITS[name]
+    return PromptSection(name, text, priority=priority, max_tokens=max_tokens)
+
+
+@lru_cache(maxsize=1024)
+def _profile_section(
+    user_name: Optional[str],
+    user_study_type: Optional[str],
+    user_career_interest: Optional[str],
+    user_nationality: Optional[str],
+) -> PromptSection:
+    """Bloque de perfil del usuario, cacheado por los campos del perfil."""
     user_profile_parts = []
-    user_profile_parts.append("\n\n=== ✨ INFORMACIÓN DEL PERFIL DEL USUARIO - USAR EN TODAS LAS RESPUESTAS ===")
+    user_profile_parts.append("=== ✨ INFORMACIÓN DEL PERFIL DEL USUARIO - USAR EN TODAS LAS RESPUESTAS ===")
     user_profile_parts.append("Esta información DEBE ser considerada en TODAS tus respuestas. Es OBLIGATORIO usarla para personalizar cada respuesta.")
     
     # NOMBRE DEL USUARIO - CRÍTICO Y OBLIGATORIO
@@ -110,42 +133,74 @@ Sigue estas reglas de manera estricta."""
         user_profile_parts.append(f"\n✨ OBJETIVOS DIARIOS: {user_nationality}")
         user_profile_parts.append("   → Recuerda constantemente estos objetivos. Ayuda a desglosarlos en pasos pequeños y celebra el progreso.")
     user_profile_parts.append("\n✨ RECUERDA: Cada respuesta debe ser personalizada usando esta información para crear una experiencia significativa y relevante.")
-    context_parts.append("\n".join(user_profile_parts))
+    return PromptSection(
+        "profile", "\n".join(user_profile_parts), required=True, max_tokens=SECTION_LIMITS["profile"][1]
+    )
 
-    # Agregar contexto RAG (documentos locales) si está disponible
-    if rag_context:
-        context_parts.append("\n\n" + rag_context)
+
+def build_system_prompt(
+    semantic_memory: str,
+    episodic_memory: str,
+    conversation_summary: Optional[str],
+    user_name: Optional[str] = None,
+    user_study_type: Optional[str] = None,  # personality_type
+    user_career_interest: Optional[str] = None,  # favorite_activity
+    user_nationality: Optional[str] = None,  # daily_goals
+    rag_context: Optional[str] = None,
+    web_context: Optional[str] = None,
+) -> str:
+    """Construye el prompt del sistema con contexto de memoria.
+
+    El prompt empieza por un prefijo estático (personalidad, reglas de memoria y formato
+    de respuesta) que el proveedor puede cachear entre peticiones; después van el perfil,
+    las memorias y el resumen, y por último el contexto RAG y web del turno.
+
+    Las secciones se ajustan al presupuesto PROMPT_MAX_TOKENS (ver ``budget``): las
+    instrucciones y el perfil siempre se incluyen; RAG, resumen, memorias y web se
+    recortan según su prioridad y tope.
     
-    # Agregar contexto de búsqueda web si está disponible
-    if web_context:
-        context_parts.append("\n\n" + web_context)
+    Args:
+        semantic_memory: Memoria semántica del usuario.
+        episodic_memory: Memoria episódica (resúmenes de sesiones).
+        conversation_summary: Resumen de la conversación actual.
+        user_name: Nombre del usuario (primer nombre).
+        user_study_type: Tipo de personalidad del usuario (personality_type).
+        user_career_interest: Actividad favorita del usuario (favorite_activity).
+        user_nationality: Objetivos diarios del usuario (daily_goals).
+        rag_context: Chunks de documentos ya formateados.
+        web_context: Resultados de búsqueda web ya formateados.
+        
+    Returns:
+        Prompt completo del sistema.
+    """
+    # Orden pensado para la caché de prefijos del proveedor: primero el bloque estático,
+    # luego lo propio del usuario y de la conversación, y al final el contexto recuperado
+    # para este turno.
+    sections = list(STATIC_SECTIONS)
+    sections.append(_profile_section(user_name, user_study_type, user_career_interest, user_nationality))
 
     if semantic_memory:
-        context_parts.append("\n\n=== MEMORIA SEMÁNTICA (LARGO PLAZO) ===")
-        context_parts.append("Información persistente sobre el usuario:")
-        context_parts.append(semantic_memory)
-
+        sections.append(_optional_section("semantic", SEMANTIC_HEADER + semantic_memory))
     if episodic_memory:
-        context_parts.append("\n\n=== MEMORIA EPISÓDICA (SESIONES ANTERIORES) ===")
-        context_parts.append("Resúmenes de conversaciones pasadas:")
-        context_parts.append(episodic_memory)
-
+        sections.append(_optional_section("episodic", EPISODIC_HEADER + episodic_memory))
     if conversation_summary:
-        context_parts.append("\n\n=== RESUMEN DE LA CONVERSACIÓN ACTUAL ===")
-        context_parts.append(conversation_summary)
-
-    context_parts.append(
-        "\n\nFORMATO DE RESPUESTA:\n"
-        "1. Responde PRIMERO con tu respuesta normal al usuario en texto plano.\n"
-        "2. Si necesitas actualizar la memoria, incluye al FINAL (después de tu respuesta) el siguiente bloque:\n"
-        '\n---MEMORY_UPDATE---\n'
-        '{\n  "memory_update": "información nueva para MEMORIA SEMÁNTICA o null",\n  "episodic_update": "resumen incremental o null",\n  "summary_update": "resumen condensado o null"\n}\n'
-        "---END_MEMORY_UPDATE---\n\n"
-        "IMPORTANTE: Tu respuesta principal al usuario debe ser clara, completa y directa. Responde siempre a la pregunta del usuario de forma útil y personalizada usando su perfil (personalidad, actividad favorita, objetivos diarios). "
-        "El bloque de memoria es opcional y solo debe incluirse si hay información nueva que guardar."
-    )
+        sections.append(_optional_section("summary", SUMMARY_HEADER + conversation_summary))
 
-    return "\n".join(context_parts)
+    # Contexto RAG (documentos locales) y de búsqueda web
+    if rag_context:
+        sections.append(_optional_section("rag", rag_context))
+    if web_context:
+        sections.append(_optional_section("web", web_context))
+
+    assembled = get_prompt_budgeter().assemble(sections)
+    logger.debug(
+        "System prompt: {} tokens {} (truncated: {}, dropped: {})",
+        assembled.total_tokens,
+        assembled.section_tokens,
+        assembled.truncated or "-",
+        assembled.dropped or "-",
+    )
+    return assembled.text
 
 
 def parse_structured_response(response_text: str) -> Dict[str, Any]:
@@ -0,0 +1,139 @@
+"""Contabilidad de tokens del LLM por usuario, conversación y origen.
+
+Cada llamada al LLM suma su bloque ``usage`` a contadores en memoria agrupados por
+(día, usuario, conversación, origen, modelo). Un thread vuelca los contadores a la
+tabla llm_usage_daily cada LLM_USAGE_FLUSH_SECONDS con una sola llamada RPC; si el
+volcado falla, los contadores se reintegran y se reintentan en el siguiente.
+"""
+
+import threading
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Optional, Tuple
+from loguru import logger
+
+UsageKey = Tuple[str, Optional[str], Optional[str], str, str]
+
+COUNTERS = ("request_count", "prompt_tokens", "completion_tokens", "cached_tokens")
+
+
+class UsageRecorder:
+    """Acumula el uso de tokens y lo vuelca por lotes a Supabase."""
+
+    def __init__(self, supabase_factory: Callable, flush_interval_seconds: float = 30.0):
+        """Inicializa el acumulador.
+
+        Args:
+            supabase_factory: Función que devuelve el cliente de Supabase.
+            flush_interval_seconds: Intervalo entre volcados del thread en background.
+        """
+        self.supabase_factory = supabase_factory
+        self.flush_interval = max(1.0, flush_interval_seconds)
+        self._pending: Dict[UsageKey, Dict[str, int]] = {}
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._stop_event = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def record(
+        self,
+        usage: Dict[str, int],
+        source: str,
+        model: str,
+        user_id: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+    ) -> None:
+        """Suma el uso de una llamada (ver ``normalize_usage``) a los contadores."""
+        day = datetime.now(timezone.utc).date().isoformat()
+        key = (day, user_id, conversation_id, source, model)
+        with self._lock:
+            counters = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+            counters["request_count"] += 1
+            for name in COUNTERS[1:]:
+                counters[name] += usage.get(name, 0)
+
+    def flush(self) -> int:
+        """Vuelca los contadores pendientes. Devuelve el número de filas escritas."""
+        with self._flush_lock:
+            with self._lock:
+                pending, self._pending = self._pending, {}
+            if not pending:
+                return 0
+
+            rows: List[Dict] = [
+                {
+                    "usage_date": day,
+                    "user_id": user_id,
+                    "conversation_id": conversation_id,
+                    "source": source,
+                    "model": model,
+                    **counters,
+                }
+                for (day, user_id, conversation_id, source, model), counters in pending.items()
+            ]
+            try:
+                self.supabase_factory().rpc("record_llm_usage", {"p_rows": rows}).execute()
+            except Exception as e:
+                logger.error("Error flushing LLM usage ({} rows), will retry: {}", len(rows), e)
+                with self._lock:
+                    for key, counters in pending.items():
+                        current = self._pending.setdefault(key, dict.fromkeys(COUNTERS, 0))
+                        for name in COUNTERS:
+                            current[name] += counters[name]
+                return 0
+            logger.debug("Flushed {} LLM usage rows", len(rows))
+            return len(rows)
+
+    def start(self) -> None:
+        """Lanza el thread de volcado periódico."""
+        if self._thread is not None:
+            return
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run_loop, name="llm-usage-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Detiene el thread y hace un último volcado."""
+        self._stop_event.set()
+        if self._thread is not None:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+        self.flush()
+
+    def _run_loop(self) -> None:
+        while not self._stop_event.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error("LLM usage flush loop error: {}", e)
+
+
+def estimate_cost(
+    prompt_tokens: int,
+    completion_tokens: int,
+    cached_tokens: int,
+    input_price: float,
+    cached_input_price: float,
+    output_price: float,
+) -> float:
+    """Coste estimado en USD con precios por millón de tokens."""
+    uncached = max(0, prompt_tokens - cached_tokens)
+    return (uncached * input_price + cached_tokens * cached_input_price + completion_tokens * output_price) / 1_000_000
+
+
+_usage_recorder: Optional[UsageRecorder] = None
+_usage_lock = threading.Lock()
+
+
+def get_usage_recorder() -> UsageRecorder:
+    global _usage_recorder
+    if _usage_recorder is None:
+        with _usage_lock:
+            if _usage_recorder is None:
+                from ...config import get_settings
+                from ..supabase import get_supabase_client
+
+                _usage_recorder = UsageRecorder(
+                    get_supabase_client,
+                    flush_interval_seconds=get_settings().llm_usage_flush_seconds,
+                )
+    return _usage_recorder
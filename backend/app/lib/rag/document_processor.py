@@ -7,6 +7,84 @@ from typing import List, Tuple, Optional
 from loguru import logger
 
 from ..embeddings import get_embedding_generator
+from ..embeddings.registry import (
+    get_active_model,
+    get_model_spec,
+    get_write_models,
+    store_chunk_embeddings,
+    uses_column_storage,
+)
+
+# Parámetros de chunking usados por process_document
+CHUNK_SIZE_TOKENS = 1000
+CHUNK_OVERLAP_TOKENS = 200
+
+
+def get_processing_fingerprint() -> str:
+    """Identifica la configuración del pipeline (modelo activo + chunking).
+
+    Dos documentos con el mismo content_hash y el mismo fingerprint producen
+    exactamente los mismos chunks y embeddings.
+    """
+    return f"{get_active_model()}:chunk={CHUNK_SIZE_TOKENS}:overlap={CHUNK_OVERLAP_TOKENS}"
+
+
+def find_processed_duplicate(
+    supabase_client,
+    content_hash: Optional[str],
+    exclude_document_id: Optional[str] = None,
+) -> Optional[dict]:
+    """Busca un documento ya procesado con el mismo contenido y configuración.
+
+    Args:
+        supabase_client: Cliente de Supabase.
+        content_hash: SHA-256 del contenido del archivo.
+        exclude_document_id: ID de documento a excluir (el propio documento).
+
+    Returns:
+        Fila del documento duplicado o None.
+    """
+    if not content_hash:
+        return None
+
+    query = (
+        supabase_client.table("knowledge_documents")
+        .select("id, filename")
+        .eq("content_hash", content_hash)
+        .eq("processing_status", "completed")
+        .eq("processing_fingerprint", get_processing_fingerprint())
+        .neq("status", "deleted")
+    )
+    if exclude_document_id:
+        query = query.neq("id", exclude_document_id)
+
+    response = query.limit(1).execute()
+    return response.data[0] if response.data else None
+
+
+def clone_document_chunks(supabase_client, source_document_id: str, target_document_id: str) -> int:
+    """Copia los chunks y embeddings de un documento a otro sin reprocesar.
+
+    Returns:
+        Número de chunks copiados.
+    """
+    response = supabase_client.rpc(
+        "clone_document_chunks",
+        {"source_document_id": source_document_id, "target_document_id": target_document_id},
+    ).execute()
+    return response.data or 0
+
+
+def has_chunks(supabase_client, document_id: str) -> bool:
+    """Indica si el documento tiene al menos un chunk almacenado."""
+    response = (
+        supabase_client.table("document_chunks")
+        .select("id")
+        .eq("document_id", document_id)
+        .limit(1)
+        .execute()
+    )
+    return bool(response.data)
 
 
 def extract_text_from_pdf(content: bytes) -> str:
@@ -183,7 +261,11 @@ def process_document(
 
         # 3. Chunking
         logger.info("Dividiendo texto en chunks")
-        chunks = chunk_text(normalized_text, chunk_size_tokens=1000, overlap_tokens=200)
+        chunks = chunk_text(
+            normalized_text,
+            chunk_size_tokens=CHUNK_SIZE_TOKENS,
+            overlap_tokens=CHUNK_OVERLAP_TOKENS,
+        )
         logger.info("Texto dividido en {} chunks", len(chunks))
 
         if not chunks:
@@ -191,36 +273,51 @@ def process_document(
             logger.warning(error_msg)
             return (0, error_msg)
 
-        # 4. Generar embeddings
-        logger.info("Generando embeddings para {} chunks", len(chunks))
-        embedding_generator = get_embedding_generator()
+        # 4. Generar embeddings con el modelo activo y los modelos en construcción (dual-write)
         chunk_texts = [chunk[0] for chunk in chunks]
-
-        # Generar embeddings en batch
-        embeddings = embedding_generator.generate_batch(chunk_texts)
+        embeddings_by_model = {}
+        for model_name in get_write_models():
+            logger.info("Generando embeddings para {} chunks con {}", len(chunks), model_name)
+            embedding_generator = get_embedding_generator(model_name)
+            if not embedding_generator.wait_until_ready(timeout=600):
+                return (0, f"Modelo de embeddings no disponible: {model_name} ({embedding_generator.status})")
+            embeddings_by_model[model_name] = embedding_generator.generate_batch(chunk_texts)
         logger.info("Embeddings generados")
 
         # 5. Insertar chunks en la base de datos
         logger.info("Insertando chunks en la base de datos")
         chunks_to_insert = []
-        for chunk_tuple, embedding in zip(chunks, embeddings):
-            chunk_text_content, chunk_index = chunk_tuple
+        for i, (chunk_text_content, chunk_index) in enumerate(chunks):
             token_count = estimate_tokens(chunk_text_content)
-            chunks_to_insert.append(
-                {
-                    "document_id": document_id,
-                    "chunk_index": chunk_index,
-                    "content": chunk_text_content,
-                    "embedding": embedding,
-                    "token_count": token_count,
-                }
-            )
+            row = {
+                "document_id": document_id,
+                "chunk_index": chunk_index,
+                "content": chunk_text_content,
+                "token_count": token_count,
+            }
+            for model_name, embeddings in embeddings_by_model.items():
+                if uses_column_storage(model_name):
+                    row["embedding"] = embeddings[i].tolist()
+                    row["embedding_model"] = model_name
+                    row["embedding_dim"] = get_model_spec(model_name).dimension
+            chunks_to_insert.append(row)
 
         # Insertar en lotes de 100 para evitar problemas de tamaño
         batch_size = 100
+        side_models = [name for name in embeddings_by_model if not uses_column_storage(name)]
         for i in range(0, len(chunks_to_insert), batch_size):
             batch = chunks_to_insert[i : i + batch_size]
-            supabase_client.table("document_chunks").insert(batch).execute()
+            response = supabase_client.table("document_chunks").insert(batch).execute()
+            # Vectores de otros modelos en la tabla lateral (necesita los IDs de los chunks)
+            inserted_ids = [row["id"] for row in (response.data or [])]
+            for model_name in side_models:
+                embeddings = embeddings_by_model[model_name]
+                store_chunk_embeddings(
+                    supabase_client,
+                    model_name,
+                    document_id,
+                    list(zip(inserted_ids, embeddings[i : i + len(inserted_ids)])),
+                )
 
         logger.info("Documento procesado exitosamente. {} chunks insertados", len(chunks))
         return (len(chunks), None)
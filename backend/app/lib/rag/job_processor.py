@@ -1,18 +1,76 @@
 """Procesador de trabajos en background para documentos."""
 
-import asyncio
-import threading
 from typing import Optional
 from loguru import logger
 from supabase import Client
 from datetime import datetime
 
-from .document_processor import process_document
+from .document_processor import (
+    clone_document_chunks,
+    find_processed_duplicate,
+    get_processing_fingerprint,
+    process_document,
+)
+from .job_queue import DocumentJobQueue
+from ..embeddings import get_embedding_generator
+from ..embeddings.registry import get_model_spec, store_chunk_embeddings, uses_column_storage
 from ..supabase import get_supabase_client
+from ...config import get_settings
 
 
-def process_document_job(document_id: str):
-    """Procesa un documento en background."""
+def _mark_document_failed(
+    supabase: Client, document_id: str, error_msg: str, final_attempt: bool
+) -> None:
+    """Registra un fallo. Si quedan reintentos, el documento vuelve a 'queued'."""
+    supabase.table("knowledge_documents").update(
+        {
+            "processing_status": "error" if final_attempt else "queued",
+            "processing_error": error_msg,
+            "updated_at": datetime.utcnow().isoformat(),
+        }
+    ).eq("id", document_id).execute()
+    supabase.table("processing_logs").insert(
+        {
+            "document_id": document_id,
+            "log_type": "error" if final_attempt else "warning",
+            "message": error_msg if final_attempt else f"{error_msg} (se reintentará)",
+        }
+    ).execute()
+
+
+def _mark_document_completed(supabase: Client, doc: dict, message: str) -> None:
+    """Marca el documento como procesado con la configuración actual del pipeline."""
+    update_data = {
+        "processing_status": "completed",
+        "processing_error": None,
+        "processing_fingerprint": get_processing_fingerprint(),
+        "processed_at": datetime.utcnow().isoformat(),
+        "updated_at": datetime.utcnow().isoformat(),
+    }
+    # Si el status actual es "processing", cambiarlo a "active"
+    if doc.get("status") == "processing":
+        update_data["status"] = "active"
+
+    supabase.table("knowledge_documents").update(update_data).eq("id", doc["id"]).execute()
+    supabase.table("processing_logs").insert(
+        {
+            "document_id": doc["id"],
+            "log_type": "success",
+            "message": message,
+        }
+    ).execute()
+
+
+def process_document_job(document_id: str, final_attempt: bool = True) -> Optional[str]:
+    """Procesa un documento.
+
+    Args:
+        document_id: ID del documento en knowledge_documents.
+        final_attempt: Si es False, un error deja el documento en cola para reintento.
+
+    Returns:
+        Mensaje de error si el procesamiento falló, None en caso contrario.
+    """
     supabase = get_supabase_client()
 
     try:
@@ -27,18 +85,36 @@ def process_document_job(document_id: str):
 
         if not doc_response.data:
             logger.error("Documento no encontrado: {}", document_id)
-            return
+            return None
 
         doc = doc_response.data
 
-        # Verificar que está en cola
-        if doc.get("processing_status") != "queued":
+        # Verificar que está en cola ('processing' si un worker anterior se interrumpió)
+        if doc.get("processing_status") not in ("queued", "processing"):
             logger.warning(
                 "Documento {} no está en cola (status: {})",
                 document_id,
                 doc.get("processing_status"),
             )
-            return
+            return None
+
+        # Si ya existe un documento idéntico procesado con la misma configuración,
+        # reutilizar sus chunks en lugar de extraer, dividir y generar embeddings otra vez
+        duplicate = find_processed_duplicate(
+            supabase, doc.get("content_hash"), exclude_document_id=document_id
+        )
+        if duplicate:
+            num_chunks = clone_document_chunks(supabase, duplicate["id"], document_id)
+            if num_chunks > 0:
+                _mark_document_completed(
+                    supabase,
+                    doc,
+                    f"Contenido idéntico a '{duplicate['filename']}'. {num_chunks} chunks reutilizados.",
+                )
+                logger.info(
+                    "Documento {} deduplicado desde {} ({} chunks)", document_id, duplicate["id"], num_chunks
+                )
+                return None
 
         # Actualizar estado a processing
         supabase.table("knowledge_documents").update(
@@ -65,21 +141,8 @@ def process_document_job(document_id: str):
             elif hasattr(file_response, "error") and file_response.error:
                 error_msg = f"Error descargando archivo: {file_response.error}"
                 logger.error(error_msg)
-                supabase.table("knowledge_documents").update(
-                    {
-                        "processing_status": "error",
-                        "processing_error": error_msg,
-                        "updated_at": datetime.utcnow().isoformat(),
-                    }
-                ).eq("id", document_id).execute()
-                supabase.table("processing_logs").insert(
-                    {
-                        "document_id": document_id,
-                        "log_type": "error",
-                        "message": error_msg,
-                    }
-                ).execute()
-                return
+                _mark_document_failed(supabase, document_id, error_msg, final_attempt)
+                return error_msg
             elif hasattr(file_response, "content"):
                 file_content = file_response.content
             else:
@@ -88,21 +151,11 @@ def process_document_job(document_id: str):
         except Exception as e:
             error_msg = f"Error descargando archivo: {str(e)}"
             logger.error(error_msg)
-            supabase.table("knowledge_documents").update(
-                {
-                    "processing_status": "error",
-                    "processing_error": error_msg,
-                    "updated_at": datetime.utcnow().isoformat(),
-                }
-            ).eq("id", document_id).execute()
-            supabase.table("processing_logs").insert(
-                {
-                    "document_id": document_id,
-                    "log_type": "error",
-                    "message": error_msg,
-                }
-            ).execute()
-            return
+            _mark_document_failed(supabase, document_id, error_msg, final_attempt)
+            return error_msg
+
+        # Eliminar chunks de un intento anterior interrumpido para no duplicarlos
+        supabase.table("document_chunks").delete().eq("document_id", document_id).execute()
 
         # Procesar documento
         num_chunks, error = process_document(
@@ -114,68 +167,96 @@ def process_document_job(document_id: str):
         )
 
         if error:
-            # Actualizar estado a error
-            supabase.table("knowledge_documents").update(
-                {
-                    "processing_status": "error",
-                    "processing_error": error,
-                    "updated_at": datetime.utcnow().isoformat(),
-                }
-            ).eq("id", document_id).execute()
-            supabase.table("processing_logs").insert(
-                {
-                    "document_id": document_id,
-                    "log_type": "error",
-                    "message": error,
-                }
-            ).execute()
+            _mark_document_failed(supabase, document_id, error, final_attempt)
+            return error
         else:
             # Actualizar estado a completed
-            # Si el status es "processing", cambiarlo a "active" automáticamente
-            update_data = {
-                "processing_status": "completed",
-                "processed_at": datetime.utcnow().isoformat(),
-                "updated_at": datetime.utcnow().isoformat(),
-            }
-            # Si el status actual es "processing", cambiarlo a "active"
-            if doc.get("status") == "processing":
-                update_data["status"] = "active"
-            
-            supabase.table("knowledge_documents").update(update_data).eq("id", document_id).execute()
-            supabase.table("processing_logs").insert(
-                {
-                    "document_id": document_id,
-                    "log_type": "success",
-                    "message": f"Documento procesado exitosamente. {num_chunks} chunks creados.",
-                }
-            ).execute()
+            _mark_document_completed(
+                supabase, doc, f"Documento procesado exitosamente. {num_chunks} chunks creados."
+            )
             logger.info("Documento {} procesado exitosamente. {} chunks creados", document_id, num_chunks)
+            return None
 
     except Exception as e:
         error_msg = f"Error procesando documento: {str(e)}"
         logger.exception(error_msg)
         try:
-            supabase.table("knowledge_documents").update(
-                {
-                    "processing_status": "error",
-                    "processing_error": error_msg,
-                    "updated_at": datetime.utcnow().isoformat(),
-                }
-            ).eq("id", document_id).execute()
-            supabase.table("processing_logs").insert(
-                {
-                    "document_id": document_id,
-                    "log_type": "error",
-                    "message": error_msg,
-                }
-            ).execute()
+            _mark_document_failed(supabase, document_id, error_msg, final_attempt)
         except:
             pass
+        return error_msg
+
+
+def reembed_document_job(document_id: str, model_name: Optional[str]) -> Optional[str]:
+    """Genera los vectores de un modelo para los chunks existentes de un documento.
+
+    No cambia el estado de procesamiento del documento: las búsquedas siguen usando
+    el modelo activo hasta el corte.
+
+    Args:
+        document_id: ID del documento en knowledge_documents.
+        model_name: Modelo de embeddings a construir.
+
+    Returns:
+        Mensaje de error si falló, None en caso contrario.
+    """
+    try:
+        get_model_spec(model_name or "")
+    except ValueError as e:
+        return str(e)
+
+    supabase = get_supabase_client()
+    try:
+        chunks = (
+            supabase.table("document_chunks")
+            .select("id, content")
+            .eq("document_id", document_id)
+            .order("chunk_index")
+            .execute()
+        ).data or []
+        if not chunks:
+            return None
+
+        generator = get_embedding_generator(model_name)
+        if not generator.wait_until_ready(timeout=600):
+            return f"Modelo de embeddings no disponible: {model_name} ({generator.status})"
+
+        embeddings = generator.generate_batch([chunk["content"] for chunk in chunks])
+        if uses_column_storage(model_name):
+            dimension = get_model_spec(model_name).dimension
+            for chunk, embedding in zip(chunks, embeddings):
+                supabase.table("document_chunks").update(
+                    {"embedding": embedding.tolist(), "embedding_model": model_name, "embedding_dim": dimension}
+                ).eq("id", chunk["id"]).execute()
+        else:
+            store_chunk_embeddings(
+                supabase, model_name, document_id, [(chunk["id"], emb) for chunk, emb in zip(chunks, embeddings)]
+            )
+
+        logger.info("Documento {} re-embebido con {} ({} chunks)", document_id, model_name, len(chunks))
+        return None
+    except Exception as e:
+        error_msg = f"Error re-embebiendo documento con {model_name}: {str(e)}"
+        logger.exception(error_msg)
+        return error_msg
+
+
+def enqueue_document_reembed(document_id: str, model_name: str) -> Optional[str]:
+    """Encola la generación de vectores de un modelo para un documento ya procesado."""
+    settings = get_settings()
+    queue = DocumentJobQueue(get_supabase_client(), lease_seconds=settings.document_job_lease_seconds)
+    return queue.enqueue(
+        document_id,
+        max_attempts=settings.document_job_max_attempts,
+        job_type="reembed",
+        model_name=model_name,
+    )
 
 
 def enqueue_document_processing(document_id: str):
-    """Encola el procesamiento de un documento en un thread separado."""
-    thread = threading.Thread(target=process_document_job, args=(document_id,), daemon=True)
-    thread.start()
-    logger.info("Documento {} encolado para procesamiento", document_id)
+    """Encola el procesamiento de un documento en la cola duradera (document_jobs)."""
+    settings = get_settings()
+    queue = DocumentJobQueue(get_supabase_client(), lease_seconds=settings.document_job_lease_seconds)
+    job_id = queue.enqueue(document_id, max_attempts=settings.document_job_max_attempts)
+    logger.info("Documento {} encolado para procesamiento (job {})", document_id, job_id)
 
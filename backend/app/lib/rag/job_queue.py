@@ -0,0 +1,131 @@
+"""Cola duradera de trabajos de documentos respaldada por Postgres (tabla document_jobs).
+
+Las operaciones de leasing usan funciones RPC con ``FOR UPDATE SKIP LOCKED`` para que
+varios workers puedan vaciar la cola en paralelo sin tomar el mismo trabajo.
+"""
+
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+from loguru import logger
+from supabase import Client
+
+
+@dataclass
+class DocumentJob:
+    """Trabajo de procesamiento tomado de la cola."""
+    id: str
+    document_id: str
+    attempts: int
+    max_attempts: int
+    job_type: str = "process"  # 'process' o 'reembed'
+    model_name: Optional[str] = None  # Modelo de embeddings de un trabajo 'reembed'
+
+    @classmethod
+    def from_row(cls, row: Dict[str, Any]) -> "DocumentJob":
+        return cls(
+            id=row["id"],
+            document_id=row["document_id"],
+            attempts=row.get("attempts", 0),
+            max_attempts=row.get("max_attempts", 1),
+            job_type=row.get("job_type") or "process",
+            model_name=row.get("model_name"),
+        )
+
+    @property
+    def is_last_attempt(self) -> bool:
+        return self.attempts >= self.max_attempts
+
+
+class DocumentJobQueue:
+    """Cliente de la cola document_jobs."""
+
+    def __init__(self, supabase: Client, lease_seconds: int = 120):
+        """Inicializa la cola.
+
+        Args:
+            supabase: Cliente de Supabase.
+            lease_seconds: Duración del lease de cada trabajo.
+        """
+        self.supabase = supabase
+        self.lease_seconds = lease_seconds
+
+    def enqueue(
+        self,
+        document_id: str,
+        max_attempts: int = 3,
+        job_type: str = "process",
+        model_name: Optional[str] = None,
+    ) -> Optional[str]:
+        """Encola un documento. Es idempotente si ya tiene un trabajo pendiente del mismo tipo.
+
+        Args:
+            document_id: ID del documento.
+            max_attempts: Intentos máximos.
+            job_type: 'process' (pipeline completo) o 'reembed' (vectores de otro modelo).
+            model_name: Modelo de embeddings para los trabajos 'reembed'.
+
+        Returns:
+            ID del trabajo o None si no se pudo encolar.
+        """
+        response = self.supabase.rpc(
+            "enqueue_document_job",
+            {
+                "p_document_id": document_id,
+                "p_max_attempts": max_attempts,
+                "p_job_type": job_type,
+                "p_model_name": model_name,
+            },
+        ).execute()
+        return response.data if response.data else None
+
+    def lease(self, worker_id: str) -> Optional[DocumentJob]:
+        """Toma el siguiente trabajo disponible, o None si la cola está vacía."""
+        response = self.supabase.rpc(
+            "lease_document_job",
+            {"p_worker_id": worker_id, "p_lease_seconds": self.lease_seconds},
+        ).execute()
+        rows = response.data or []
+        if not rows:
+            return None
+        return DocumentJob.from_row(rows[0])
+
+    def heartbeat(self, job_id: str, worker_id: str) -> bool:
+        """Extiende el lease. Devuelve False si el trabajo ya no pertenece al worker."""
+        response = self.supabase.rpc(
+            "heartbeat_document_job",
+            {"p_job_id": job_id, "p_worker_id": worker_id, "p_lease_seconds": self.lease_seconds},
+        ).execute()
+        return bool(response.data)
+
+    def complete(self, job_id: str, worker_id: str) -> bool:
+        response = self.supabase.rpc(
+            "complete_document_job",
+            {"p_job_id": job_id, "p_worker_id": worker_id},
+        ).execute()
+        return bool(response.data)
+
+    def fail(self, job_id: str, worker_id: str, error: str, backoff_seconds: int = 30) -> Optional[str]:
+        """Registra un intento fallido.
+
+        Returns:
+            'queued' si se reintentará, 'failed' si se agotaron los intentos,
+            o None si el lease se había perdido.
+        """
+        response = self.supabase.rpc(
+            "fail_document_job",
+            {
+                "p_job_id": job_id,
+                "p_worker_id": worker_id,
+                "p_error": error[:2000],
+                "p_base_backoff_seconds": backoff_seconds,
+            },
+        ).execute()
+        return response.data if response.data else None
+
+    def requeue_stale(self) -> int:
+        """Devuelve a la cola los trabajos con lease expirado."""
+        response = self.supabase.rpc("requeue_stale_document_jobs", {}).execute()
+        count = response.data or 0
+        if count:
+            logger.warning("Requeued {} stale document jobs", count)
+        return count
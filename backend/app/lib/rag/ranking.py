@@ -0,0 +1,126 @@
+"""Selección final de chunks: diversidad (MMR) y fusión de chunks adyacentes.
+
+``chunk_text`` genera chunks con 200 tokens de overlap, y los documentos deduplicados
+comparten chunks idénticos, así que el top-k suele repetir texto. Estas funciones
+reducen la redundancia antes de aplicar el presupuesto de tokens del prompt.
+"""
+
+import re
+from typing import Dict, List, Set
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def relevance_score(chunk: Dict) -> float:
+    """Score de relevancia del chunk según la etapa más precisa que lo puntuó."""
+    for key in ("rerank_score", "rrf_score", "similarity", "text_rank"):
+        if chunk.get(key) is not None:
+            return float(chunk[key])
+    return 0.0
+
+
+def _shingles(text: str, size: int = 3) -> Set[tuple]:
+    words = _WORD_RE.findall(text.lower())
+    if len(words) < size:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i : i + size]) for i in range(len(words) - size + 1)}
+
+
+def _overlap(a: Set[tuple], b: Set[tuple]) -> float:
+    """Fracción del texto más corto contenida en el otro (1.0 = duplicado)."""
+    if not a or not b:
+        return 0.0
+    return len(a & b) / min(len(a), len(b))
+
+
+def mmr_select(chunks: List[Dict], top_k: int, lambda_: float = 0.7) -> List[Dict]:
+    """Selecciona chunks con Maximal Marginal Relevance.
+
+    score = λ · relevancia - (1 - λ) · máxima redundancia con los ya seleccionados,
+    con la redundancia medida como solapamiento de 3-gramas de palabras.
+
+    Args:
+        chunks: Candidatos ordenados por relevancia.
+        top_k: Número de chunks a seleccionar.
+        lambda_: Peso de la relevancia frente a la diversidad (1.0 = solo relevancia).
+
+    Returns:
+        Chunks seleccionados en orden de selección.
+    """
+    if len(chunks) <= 1 or top_k <= 0:
+        return chunks[:top_k]
+
+    raw = [relevance_score(chunk) for chunk in chunks]
+    low, high = min(raw), max(raw)
+    relevance = [(r - low) / (high - low) if high > low else 1.0 for r in raw]
+    shingles = [_shingles(chunk.get("content", "")) for chunk in chunks]
+
+    selected: List[int] = []
+    redundancy = [0.0] * len(chunks)
+    remaining = list(range(len(chunks)))
+    while remaining and len(selected) < top_k:
+        best = max(remaining, key=lambda i: lambda_ * relevance[i] - (1 - lambda_) * redundancy[i])
+        selected.append(best)
+        remaining.remove(best)
+        for i in remaining:
+            redundancy[i] = max(redundancy[i], _overlap(shingles[i], shingles[best]))
+        # Descartar duplicados prácticamente exactos (p. ej. chunks de documentos deduplicados)
+        remaining = [i for i in remaining if redundancy[i] < 0.9]
+    return [chunks[i] for i in selected]
+
+
+def _join_overlapping(first: str, second: str) -> str:
+    """Une dos chunks consecutivos eliminando el texto repetido por el overlap."""
+    probe = second[:80]
+    if probe:
+        position = first.rfind(probe)
+        if position >= 0 and second.startswith(first[position:]):
+            return first[:position] + second
+    return f"{first}\n{second}"
+
+
+def merge_adjacent_chunks(chunks: List[Dict]) -> List[Dict]:
+    """Fusiona chunks consecutivos (mismo documento, chunk_index contiguo) en un pasaje.
+
+    El pasaje conserva la posición del mejor de sus chunks, el mayor de cada score y
+    la lista de índices originales en "chunk_indices".
+    """
+    if len(chunks) <= 1:
+        return chunks
+
+    positions = {id(chunk): rank for rank, chunk in enumerate(chunks)}
+    by_document: Dict[str, List[Dict]] = {}
+    for chunk in chunks:
+        by_document.setdefault(chunk.get("document_id"), []).append(chunk)
+
+    passages = []
+    for document_chunks in by_document.values():
+        document_chunks.sort(key=lambda c: c.get("chunk_index", 0))
+        run = [document_chunks[0]]
+        for chunk in document_chunks[1:]:
+            if chunk.get("chunk_index", 0) == run[-1].get("chunk_index", 0) + 1:
+                run.append(chunk)
+            else:
+                passages.append(run)
+                run = [chunk]
+        passages.append(run)
+
+    merged = []
+    for run in passages:
+        rank = min(positions[id(chunk)] for chunk in run)
+        if len(run) == 1:
+            merged.append((rank, run[0]))
+            continue
+        content = run[0].get("content", "")
+        for chunk in run[1:]:
+            content = _join_overlapping(content, chunk.get("content", ""))
+        passage = {**run[0], "content": content, "token_count": len(content) // 4}
+        passage["chunk_indices"] = [chunk.get("chunk_index") for chunk in run]
+        for key in ("similarity", "lexical_confidence", "rrf_score", "rerank_score", "text_rank"):
+            values = [chunk[key] for chunk in run if chunk.get(key) is not None]
+            if values:
+                passage[key] = max(values)
+        merged.append((rank, passage))
+
+    merged.sort(key=lambda item: item[0])
+    return [passage for _, passage in merged]
@@ -0,0 +1,163 @@
+"""Re-ranking de chunks candidatos con un cross-encoder, con presupuesto de latencia.
+
+El cross-encoder puntúa cada par (query, chunk) de forma conjunta y ordena mejor que
+la similitud de embeddings, pero cuesta un forward pass por candidato. Para no penalizar
+el turno de chat:
+
+- El modelo se carga en background la primera vez; mientras tanto no se re-rankea.
+- Cada query tiene un presupuesto de tiempo: si se agota, se devuelve el orden original.
+  El cálculo sigue en background y sus scores quedan en caché para la próxima vez.
+- Los scores se cachean por (query, chunk) en una LRU en memoria.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Any, Dict, List, Optional, Tuple
+from loguru import logger
+
+
+class CrossEncoderReranker:
+    """Re-ranker basado en sentence_transformers.CrossEncoder."""
+
+    def __init__(
+        self,
+        model_name: str,
+        time_budget_ms: float = 150.0,
+        batch_size: int = 16,
+        cache_size: int = 5000,
+    ):
+        """Inicializa el re-ranker (la carga del modelo es diferida).
+
+        Args:
+            model_name: Modelo cross-encoder de Hugging Face.
+            time_budget_ms: Tiempo máximo de re-ranking por query.
+            batch_size: Pares (query, chunk) por forward pass.
+            cache_size: Máximo de scores cacheados.
+        """
+        self.model_name = model_name
+        self.time_budget = max(0.0, time_budget_ms) / 1000
+        self.batch_size = max(1, batch_size)
+        self.cache_size = cache_size
+        self._model: Any = None
+        self._load_started = False
+        self._lock = threading.Lock()
+        self._cache: "OrderedDict[Tuple[str, str], float]" = OrderedDict()
+        # Un solo thread: los scores de una query no compiten por CPU con los de otra
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="reranker")
+        self._inflight: Optional[Future] = None
+
+    @property
+    def is_ready(self) -> bool:
+        return self._model is not None
+
+    def _ensure_loading(self) -> None:
+        with self._lock:
+            if self._load_started:
+                return
+            self._load_started = True
+        threading.Thread(target=self._load, name="reranker-load", daemon=True).start()
+
+    def _load(self) -> None:
+        try:
+            from sentence_transformers import CrossEncoder
+
+            self._model = CrossEncoder(self.model_name, device="cpu")
+            logger.info("Cross-encoder reranker loaded: {}", self.model_name)
+        except Exception as e:
+            logger.error("Could not load cross-encoder reranker {}: {}", self.model_name, e)
+
+    @staticmethod
+    def _query_key(query: str) -> str:
+        return hashlib.sha256(query.strip().lower().encode("utf-8")).hexdigest()
+
+    def _cached_scores(self, query_key: str, chunks: List[Dict]) -> Dict[str, float]:
+        scores = {}
+        with self._lock:
+            for chunk in chunks:
+                key = (query_key, chunk["id"])
+                if key in self._cache:
+                    self._cache.move_to_end(key)
+                    scores[chunk["id"]] = self._cache[key]
+        return scores
+
+    def _score(self, query: str, query_key: str, chunks: List[Dict]) -> Dict[str, float]:
+        """Puntúa los chunks (se ejecuta en el executor) y guarda los scores en caché."""
+        pairs = [(query, chunk.get("content", "")) for chunk in chunks]
+        raw = self._model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        scores = {chunk["id"]: float(score) for chunk, score in zip(chunks, raw)}
+        with self._lock:
+            for chunk_id, score in scores.items():
+                self._cache[(query_key, chunk_id)] = score
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+        return scores
+
+    def rerank(self, query: str, chunks: List[Dict]) -> List[Dict]:
+        """Reordena los chunks por score del cross-encoder.
+
+        Args:
+            query: Consulta del usuario.
+            chunks: Candidatos (clave "id" y "content").
+
+        Returns:
+            Chunks con "rerank_score" ordenados por score, o la lista original si el
+            modelo no está cargado o se agota el presupuesto de tiempo.
+        """
+        if len(chunks) < 2:
+            return chunks
+        if not self.is_ready:
+            self._ensure_loading()
+            return chunks
+
+        query_key = self._query_key(query)
+        scores = self._cached_scores(query_key, chunks)
+        missing = [chunk for chunk in chunks if chunk["id"] not in scores]
+        if missing:
+            with self._lock:
+                if self._inflight is not None and not self._inflight.done():
+                    # Un cálculo anterior agotó su presupuesto y sigue en curso: no encolar más
+                    return chunks
+                future = self._executor.submit(self._score, query, query_key, missing)
+                self._inflight = future
+            try:
+                scores.update(future.result(timeout=self.time_budget))
+            except FutureTimeoutError:
+                logger.info(
+                    "Reranking exceeded {:.0f} ms budget for {} chunks; keeping retrieval order",
+                    self.time_budget * 1000,
+                    len(missing),
+                )
+                return chunks
+            except Exception as e:
+                logger.warning("Reranking failed, keeping retrieval order: {}", e)
+                return chunks
+
+        reranked = [{**chunk, "rerank_score": scores[chunk["id"]]} for chunk in chunks]
+        reranked.sort(key=lambda c: c["rerank_score"], reverse=True)
+        return reranked
+
+
+_reranker: Optional[CrossEncoderReranker] = None
+_reranker_lock = threading.Lock()
+
+
+def get_reranker() -> Optional[CrossEncoderReranker]:
+    """Devuelve el re-ranker configurado, o None si RAG_RERANKER_ENABLED está desactivado."""
+    global _reranker
+    from ...config import get_settings
+
+    settings = get_settings()
+    if not settings.rag_reranker_enabled:
+        return None
+    if _reranker is None:
+        with _reranker_lock:
+            if _reranker is None:
+                _reranker = CrossEncoderReranker(
+                    settings.rag_reranker_model,
+                    time_budget_ms=settings.rag_reranker_budget_ms,
+                    batch_size=settings.rag_reranker_batch_size,
+                    cache_size=settings.rag_reranker_cache_size,
+                )
+    return _reranker
@@ -4,7 +4,126 @@ from typing import List, Dict, Optional
 from loguru import logger
 from supabase import Client
 
+from ...config import get_settings
 from ..embeddings import get_embedding_generator
+from ..embeddings.registry import get_active_model, to_pgvector, uses_column_storage
+from .ranking import merge_adjacent_chunks, mmr_select
+from .reranker import get_reranker
+
+
+def _vector_candidates(
+    query_embedding: List[float],
+    supabase_client: Client,
+    active_doc_ids: List[str],
+    match_count: int,
+) -> List[Dict]:
+    """Chunks más similares al embedding de la query, ordenados por similitud."""
+    model_name = get_active_model()
+    try:
+        # Intentar usar función RPC si existe
+        if uses_column_storage(model_name):
+            rpc_name = "match_document_chunks"
+            rpc_params = {"query_embedding": query_embedding}
+        else:
+            # Vectores del modelo activo en la tabla lateral document_chunk_embeddings
+            rpc_name = "match_document_chunk_embeddings"
+            rpc_params = {"query_embedding": to_pgvector(query_embedding), "p_model_name": model_name}
+        rpc_response = supabase_client.rpc(
+            rpc_name,
+            {
+                **rpc_params,
+                "match_threshold": 0.5,
+                "match_count": match_count,
+                "document_ids": active_doc_ids,
+            },
+        ).execute()
+
+        chunks = rpc_response.data if hasattr(rpc_response, "data") and rpc_response.data else []
+    except Exception as rpc_error:
+        if not uses_column_storage(model_name):
+            # La búsqueda manual solo conoce la columna embedding de document_chunks
+            logger.error("Vector search for model {} failed: {}", model_name, rpc_error)
+            return []
+        logger.warning("RPC function not available, using manual search: {}", rpc_error)
+        # Búsqueda manual: obtener todos los chunks de documentos activos y calcular similitud
+        chunks_response = (
+            supabase_client.table("document_chunks")
+            .select("id, document_id, chunk_index, content, embedding, token_count")
+            .in_("document_id", active_doc_ids)
+            .execute()
+        )
+        chunks = (
+            chunks_response.data
+            if hasattr(chunks_response, "data") and chunks_response.data
+            else []
+        )
+
+    # Calcular similitud coseno si no viene en los resultados
+    if chunks and "similarity" not in chunks[0]:
+        import numpy as np
+
+        query_vec = np.array(query_embedding)
+        chunks_with_sim = []
+        for chunk in chunks:
+            if chunk.get("embedding"):
+                chunk_vec = np.array(chunk["embedding"])
+                similarity = np.dot(query_vec, chunk_vec) / (
+                    np.linalg.norm(query_vec) * np.linalg.norm(chunk_vec)
+                )
+                chunk["similarity"] = float(similarity)
+                chunks_with_sim.append(chunk)
+
+        chunks = sorted(chunks_with_sim, key=lambda x: x.get("similarity", 0), reverse=True)[:match_count]
+
+    return chunks
+
+
+def _lexical_candidates(
+    query: str,
+    supabase_client: Client,
+    active_doc_ids: List[str],
+    match_count: int,
+) -> List[Dict]:
+    """Chunks con mejor coincidencia léxica (full-text en español), ordenados por rank."""
+    try:
+        response = supabase_client.rpc(
+            "search_document_chunks_text",
+            {
+                "query_text": query,
+                "match_count": match_count,
+                "document_ids": active_doc_ids,
+            },
+        ).execute()
+        return response.data if hasattr(response, "data") and response.data else []
+    except Exception as e:
+        logger.warning("Full-text chunk search not available: {}", e)
+        return []
+
+
+def reciprocal_rank_fusion(rankings: List[List[Dict]], k: int = 60) -> List[Dict]:
+    """Fusiona varias listas ordenadas de chunks con Reciprocal Rank Fusion.
+
+    score(chunk) = Σ 1 / (k + rank), sumando sobre las listas en las que aparece.
+
+    Args:
+        rankings: Listas de chunks ordenadas de mejor a peor (clave "id").
+        k: Constante de suavizado de RRF.
+
+    Returns:
+        Chunks únicos ordenados por score fusionado (campo "rrf_score").
+    """
+    fused: Dict[str, Dict] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking, 1):
+            entry = fused.get(chunk["id"])
+            if entry is None:
+                entry = fused[chunk["id"]] = {**chunk, "rrf_score": 0.0}
+            else:
+                # Conservar los campos de todas las listas (similarity, text_rank, ...)
+                for key, value in chunk.items():
+                    entry.setdefault(key, value)
+            entry["rrf_score"] += 1.0 / (k + rank)
+    return sorted(fused.values(), key=lambda c: c["rrf_score"], reverse=True)
 
 
 def retrieve_relevant_chunks(
@@ -12,30 +131,47 @@ def retrieve_relevant_chunks(
     supabase_client: Client,
     top_k: int = 8,
     max_tokens: int = 4000,
+    query_embedding: Optional[List[float]] = None,
 ) -> tuple[List[Dict], float]:
     """Recupera los chunks más relevantes para una query.
+
+    Combina búsqueda vectorial y full-text (Reciprocal Rank Fusion) si
+    RAG_HYBRID_ENABLED está activo; los términos exactos (NIE, TIE, siglas de
+    universidades, números de formulario) los encuentra la parte léxica.
     
     Args:
         query: Texto de la consulta del usuario.
         supabase_client: Cliente de Supabase.
         top_k: Número máximo de chunks a recuperar.
         max_tokens: Límite aproximado de tokens para los chunks recuperados.
+        query_embedding: Embedding de la query ya calculado (opcional).
         
     Returns:
         Tupla con (lista de diccionarios con información de los chunks relevantes, max_similarity).
-        max_similarity es el score de similitud más alto encontrado (0.0 si no hay chunks).
+        max_similarity es el score de confianza más alto encontrado (0.0 si no hay chunks):
+        la similitud coseno, o RAG_LEXICAL_MATCH_CONFIDENCE para chunks que contienen
+        todos los términos de la query (si son al menos RAG_LEXICAL_MIN_TERMS).
     """
+    settings = get_settings()
+    embedding_generator = get_embedding_generator()
+    use_vector = embedding_generator.is_ready
+    if not use_vector and not settings.rag_hybrid_enabled:
+        # Sin modelo no hay búsqueda vectorial posible: no consultar la base de datos
+        logger.info("Skipping RAG retrieval: embedding model {}", embedding_generator.status)
+        return [], 0.0
+
     try:
-        # 1. Generar embedding de la query
-        embedding_generator = get_embedding_generator()
-        query_embedding = embedding_generator.generate(query)
+        # 1. Generar embedding de la query (si no se recibió ya calculado)
+        if use_vector and query_embedding is None:
+            query_embedding = embedding_generator.generate(query)
 
-        if not query_embedding or all(x == 0.0 for x in query_embedding):
+        if use_vector and (not query_embedding or all(x == 0.0 for x in query_embedding)):
             logger.warning("No se pudo generar embedding para la query (modo fallback)")
-            return [], 0.0
+            use_vector = False
+            if not settings.rag_hybrid_enabled:
+                return [], 0.0
 
-        # 2. Buscar chunks de documentos activos usando búsqueda vectorial
-        # Primero obtener IDs de documentos activos
+        # 2. Obtener IDs de documentos activos
         active_docs_response = (
             supabase_client.table("knowledge_documents")
             .select("id")
@@ -53,73 +189,42 @@ def retrieve_relevant_chunks(
             logger.info("No hay documentos activos para buscar")
             return [], 0.0
 
-        # 3. Búsqueda vectorial en document_chunks
-        # Usar RPC para búsqueda vectorial (más eficiente)
-        # Si no existe la función RPC, usar búsqueda manual
-        try:
-            # Intentar usar función RPC si existe
-            rpc_response = supabase_client.rpc(
-                "match_document_chunks",
-                {
-                    "query_embedding": query_embedding,
-                    "match_threshold": 0.5,
-                    "match_count": top_k * 2,  # Obtener más para filtrar después
-                    "document_ids": active_doc_ids,
-                },
-            ).execute()
-
-            chunks = rpc_response.data if hasattr(rpc_response, "data") and rpc_response.data else []
-        except Exception as rpc_error:
-            logger.warning("RPC function not available, using manual search: {}", rpc_error)
-            # Búsqueda manual: obtener todos los chunks de documentos activos y calcular similitud
-            chunks_response = (
-                supabase_client.table("document_chunks")
-                .select("id, document_id, chunk_index, content, embedding, token_count")
-                .in_("document_id", active_doc_ids)
-                .execute()
-            )
+        # 3. Búsqueda vectorial y léxica (obtener más candidatos para filtrar después)
+        rankings = []
+        if use_vector:
+            rankings.append(_vector_candidates(query_embedding, supabase_client, active_doc_ids, top_k * 2))
+        if settings.rag_hybrid_enabled:
+            lexical = _lexical_candidates(query, supabase_client, active_doc_ids, top_k * 2)
+            for chunk in lexical:
+                # Coincidencia de todos los términos: evidencia fuerte aunque el embedding no
+                # la capture, pero solo con varios términos (tras quitar stopwords suele
+                # quedar uno solo, y una palabra común no basta para descartar la web)
+                if (
+                    chunk.get("matches_all_terms")
+                    and (chunk.get("query_terms") or 0) >= settings.rag_lexical_min_terms
+                ):
+                    chunk["lexical_confidence"] = settings.rag_lexical_match_confidence
+            rankings.append(lexical)
 
-            all_chunks = (
-                chunks_response.data
-                if hasattr(chunks_response, "data") and chunks_response.data
-                else []
-            )
+        # 4. Fusionar rankings
+        if len(rankings) > 1:
+            chunks = reciprocal_rank_fusion(rankings, k=settings.rag_rrf_k)
+        else:
+            chunks = rankings[0]
+
+        # 4.5. Re-ranking opcional con cross-encoder (con presupuesto de latencia)
+        reranker = get_reranker()
+        if reranker is not None and chunks:
+            reranked = reranker.rerank(query, chunks)
+            if reranked and "rerank_score" in reranked[0]:
+                # Con un orden fiable bastan menos chunks: prompt más pequeño
+                chunks = reranked[: min(top_k, settings.rag_reranker_top_k)]
 
-            # Calcular similitud coseno manualmente
-            import numpy as np
-
-            query_vec = np.array(query_embedding)
-            chunks_with_similarity = []
-            for chunk in all_chunks:
-                if chunk.get("embedding"):
-                    chunk_vec = np.array(chunk["embedding"])
-                    # Similitud coseno
-                    similarity = np.dot(query_vec, chunk_vec) / (
-                        np.linalg.norm(query_vec) * np.linalg.norm(chunk_vec)
-                    )
-                    chunks_with_similarity.append((similarity, chunk))
-
-            # Ordenar por similitud y tomar top_k
-            chunks_with_similarity.sort(key=lambda x: x[0], reverse=True)
-            chunks = [chunk for _, chunk in chunks_with_similarity[: top_k * 2]]
-
-        # 4. Filtrar y ordenar por similitud (si no viene de RPC)
-        if chunks and "similarity" not in chunks[0]:
-            # Calcular similitud si no viene en los resultados
-            import numpy as np
-
-            query_vec = np.array(query_embedding)
-            chunks_with_sim = []
-            for chunk in chunks:
-                if chunk.get("embedding"):
-                    chunk_vec = np.array(chunk["embedding"])
-                    similarity = np.dot(query_vec, chunk_vec) / (
-                        np.linalg.norm(query_vec) * np.linalg.norm(chunk_vec)
-                    )
-                    chunk["similarity"] = float(similarity)
-                    chunks_with_sim.append(chunk)
-
-            chunks = sorted(chunks_with_sim, key=lambda x: x.get("similarity", 0), reverse=True)
+        # 4.6. Diversidad (MMR) y fusión de chunks adyacentes para no repetir el overlap
+        if settings.rag_mmr_enabled:
+            chunks = mmr_select(chunks, top_k, lambda_=settings.rag_mmr_lambda)
+        if settings.rag_merge_adjacent_chunks:
+            chunks = merge_adjacent_chunks(chunks[:top_k])
 
         # 5. Truncar según límite de tokens
         selected_chunks = []
@@ -133,18 +238,20 @@ def retrieve_relevant_chunks(
             else:
                 break
 
-        # Calcular max_similarity
+        # Calcular max_similarity (confianza vectorial o léxica)
         max_similarity = 0.0
         if selected_chunks:
             max_similarity = max(
-                chunk.get("similarity", 0.0) for chunk in selected_chunks
+                max(chunk.get("similarity", 0.0), chunk.get("lexical_confidence", 0.0))
+                for chunk in selected_chunks
             )
 
         logger.info(
-            "Retrieved {} relevant chunks ({} tokens total, max_similarity={:.3f}) for query",
+            "Retrieved {} relevant chunks ({} tokens total, max_similarity={:.3f}, {}) for query",
             len(selected_chunks),
             total_tokens,
             max_similarity,
+            "hybrid" if len(rankings) > 1 else ("vector" if use_vector else "lexical"),
         )
 
         return selected_chunks, max_similarity
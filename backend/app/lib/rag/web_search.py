@@ -1,8 +1,20 @@
-"""Módulo de búsqueda web para complementar RAG cuando no hay chunks relevantes."""
+"""Módulo de búsqueda web para complementar RAG cuando no hay chunks relevantes.
 
-from typing import List, Dict, Optional
+Las búsquedas pasan por ``WebSearchService``: timeout estricto, caché con TTL por
+consulta normalizada y límite de búsquedas concurrentes. El proveedor real
+(DuckDuckGo) es síncrono y se ejecuta en un pool de threads acotado para no
+bloquear el event loop. ``StubWebSearchProvider`` permite probar sin red.
+"""
+
+import asyncio
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Optional, Tuple
 from loguru import logger
-import os
 
 try:
     from duckduckgo_search import DDGS
@@ -12,8 +24,222 @@ except ImportError:
     logger.warning("duckduckgo_search no está instalado. Búsqueda web no disponible.")
 
 
-def search_web(query: str, max_results: int = 5) -> List[Dict[str, str]]:
-    """Realiza una búsqueda web y retorna resultados relevantes.
+class WebSearchProvider:
+    """Interfaz de los proveedores de búsqueda web."""
+
+    name = "base"
+
+    async def search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        """Devuelve resultados con 'title', 'url' y 'snippet'."""
+        raise NotImplementedError
+
+
+class DuckDuckGoProvider(WebSearchProvider):
+    """DuckDuckGo vía duckduckgo_search (cliente síncrono en un pool de threads)."""
+
+    name = "duckduckgo"
+
+    def __init__(self, max_workers: int = 4):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="web-search")
+
+    def _search_sync(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        with DDGS() as ddgs:
+            return [
+                {
+                    "title": result.get("title", ""),
+                    "url": result.get("href", ""),
+                    "snippet": result.get("body", ""),
+                }
+                # Usar text() para búsqueda general
+                for result in ddgs.text(query, max_results=max_results)
+            ]
+
+    async def search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        if not DUCKDUCKGO_AVAILABLE:
+            logger.warning("Búsqueda web no disponible: duckduckgo_search no está instalado")
+            return []
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self._search_sync, query, max_results)
+
+
+class StubWebSearchProvider(WebSearchProvider):
+    """Proveedor local para tests y desarrollo sin red."""
+
+    name = "stub"
+
+    def __init__(self, results: Optional[List[Dict[str, str]]] = None, delay_seconds: float = 0.0):
+        """Inicializa el stub.
+
+        Args:
+            results: Resultados fijos (por defecto, uno generado a partir de la consulta).
+            delay_seconds: Latencia simulada.
+        """
+        self.results = results
+        self.delay_seconds = delay_seconds
+        self.calls: List[str] = []
+
+    async def search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        self.calls.append(query)
+        if self.delay_seconds:
+            await asyncio.sleep(self.delay_seconds)
+        if self.results is not None:
+            return self.results[:max_results]
+        return [
+            {
+                "title": f"Resultado de prueba para: {query}",
+                "url": "https://example.com/search",
+                "snippet": f"Contenido simulado sobre {query}.",
+            }
+        ][:max_results]
+
+
+def normalize_query(query: str) -> str:
+    """Clave de caché: minúsculas, sin tildes, sin puntuación y espacios colapsados."""
+    text = unicodedata.normalize("NFKD", query.lower())
+    text = "".join(c for c in text if not unicodedata.combining(c))
+    text = re.sub(r"[^\w\s]", " ", text)
+    return " ".join(text.split())
+
+
+class WebSearchService:
+    """Búsqueda web con timeout, caché TTL y límite de concurrencia."""
+
+    def __init__(
+        self,
+        provider: WebSearchProvider,
+        timeout_seconds: float = 3.0,
+        cache_ttl_seconds: float = 900.0,
+        cache_size: int = 500,
+        max_concurrency: int = 4,
+    ):
+        """Inicializa el servicio.
+
+        Args:
+            provider: Proveedor de búsqueda.
+            timeout_seconds: Tiempo máximo por búsqueda (incluida la espera por un hueco).
+            cache_ttl_seconds: Vigencia de los resultados cacheados.
+            cache_size: Máximo de consultas cacheadas.
+            max_concurrency: Búsquedas simultáneas contra el proveedor.
+        """
+        self.provider = provider
+        self.timeout_seconds = timeout_seconds
+        self.cache_ttl_seconds = cache_ttl_seconds
+        self.cache_size = cache_size
+        self.max_concurrency = max(1, max_concurrency)
+        self._cache: "OrderedDict[Tuple[str, int], Tuple[float, List[Dict[str, str]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._inflight: Dict[Tuple[str, int], asyncio.Task] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def _get_cached(self, key: Tuple[str, int]) -> Optional[List[Dict[str, str]]]:
+        with self._lock:
+            entry = self._cache.get(key)
+            if entry is None:
+                return None
+            expires_at, results = entry
+            if expires_at < time.monotonic():
+                del self._cache[key]
+                return None
+            self._cache.move_to_end(key)
+            return results
+
+    def _store(self, key: Tuple[str, int], results: List[Dict[str, str]]) -> None:
+        with self._lock:
+            self._cache[key] = (time.monotonic() + self.cache_ttl_seconds, results)
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def _bind_loop(self) -> None:
+        """El semáforo y las búsquedas en curso pertenecen al event loop actual."""
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._inflight = {}
+
+    async def _limited_search(self, query: str, max_results: int) -> List[Dict[str, str]]:
+        async with self._semaphore:
+            return await self.provider.search(query, max_results)
+
+    async def search(self, query: str, max_results: int = 5) -> List[Dict[str, str]]:
+        """Busca en la web. Nunca lanza excepciones ni tarda más que el timeout.
+
+        Returns:
+            Resultados (lista vacía si hubo timeout o error).
+        """
+        normalized = normalize_query(query)
+        if not normalized:
+            return []
+        key = (normalized, max_results)
+        cached = self._get_cached(key)
+        if cached is not None:
+            logger.info("Web search cache hit for query: {}", query[:50])
+            return cached
+
+        # Consultas idénticas simultáneas comparten una sola búsqueda
+        self._bind_loop()
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._fetch(key, query, max_results))
+            self._inflight[key] = task
+            task.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(task)
+
+    async def _fetch(self, key: Tuple[str, int], query: str, max_results: int) -> List[Dict[str, str]]:
+        start = time.perf_counter()
+        try:
+            results = await asyncio.wait_for(
+                self._limited_search(query, max_results), timeout=self.timeout_seconds
+            )
+        except asyncio.TimeoutError:
+            logger.warning(
+                "Web search ({}) timed out after {:.1f}s for query: {}",
+                self.provider.name, self.timeout_seconds, query[:50],
+            )
+            return []
+        except Exception as e:
+            logger.exception("Error performing web search: {}", e)
+            return []
+
+        # Solo se cachean respuestas válidas (un fallo no debe fijarse durante el TTL)
+        self._store(key, results)
+        logger.info(
+            "Web search returned {} results in {:.0f} ms for query: {}",
+            len(results), (time.perf_counter() - start) * 1000, query[:50],
+        )
+        return results
+
+
+_web_search_service: Optional[WebSearchService] = None
+_web_search_lock = threading.Lock()
+
+
+def get_web_search_service() -> WebSearchService:
+    global _web_search_service
+    if _web_search_service is None:
+        with _web_search_lock:
+            if _web_search_service is None:
+                from ...config import get_settings
+
+                settings = get_settings()
+                if settings.web_search_provider == StubWebSearchProvider.name:
+                    provider: WebSearchProvider = StubWebSearchProvider()
+                else:
+                    provider = DuckDuckGoProvider(max_workers=settings.web_search_max_concurrency)
+                _web_search_service = WebSearchService(
+                    provider,
+                    timeout_seconds=settings.web_search_timeout_seconds,
+                    cache_ttl_seconds=settings.web_search_cache_ttl_seconds,
+                    cache_size=settings.web_search_cache_size,
+                    max_concurrency=settings.web_search_max_concurrency,
+                )
+    return _web_search_service
+
+
+async def search_web_async(query: str, max_results: int = 5) -> List[Dict[str, str]]:
+    """Realiza una búsqueda web (async, cacheada y con timeout).
     
     Args:
         query: Consulta de búsqueda.
@@ -22,26 +248,17 @@ def search_web(query: str, max_results: int = 5) -> List[Dict[str, str]]:
     Returns:
         Lista de diccionarios con 'title', 'url', y 'snippet' para cada resultado.
     """
-    if not DUCKDUCKGO_AVAILABLE:
-        logger.warning("Búsqueda web no disponible: duckduckgo_search no está instalado")
-        return []
-    
+    return await get_web_search_service().search(query, max_results)
+
+
+def search_web(query: str, max_results: int = 5) -> List[Dict[str, str]]:
+    """Versión síncrona de search_web_async para código fuera del event loop."""
     try:
-        with DDGS() as ddgs:
-            results = []
-            # Usar text() para búsqueda general
-            for result in ddgs.text(query, max_results=max_results):
-                results.append({
-                    "title": result.get("title", ""),
-                    "url": result.get("href", ""),
-                    "snippet": result.get("body", ""),
-                })
-            
-            logger.info("Web search returned {} results for query: {}", len(results), query[:50])
-            return results
-    except Exception as e:
-        logger.exception("Error performing web search: {}", e)
-        return []
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return asyncio.run(search_web_async(query, max_results))
+    logger.error("search_web() called from a running event loop; use 'await search_web_async()'")
+    return []
 
 
 def format_web_results_for_prompt(results: List[Dict[str, str]]) -> str:
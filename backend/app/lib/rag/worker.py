@@ -0,0 +1,145 @@
+"""Worker que vacía la cola document_jobs con leasing, heartbeats y reintentos."""
+
+import os
+import socket
+import threading
+import time
+from typing import List, Optional
+from loguru import logger
+from supabase import Client
+
+from .job_processor import process_document_job, reembed_document_job
+from .job_queue import DocumentJob, DocumentJobQueue
+from ...config import Settings
+
+
+class DocumentWorker:
+    """Procesa trabajos de documentos con un número acotado de threads."""
+
+    def __init__(self, supabase: Client, settings: Settings, name: Optional[str] = None):
+        """Inicializa el worker.
+
+        Args:
+            supabase: Cliente de Supabase.
+            settings: Configuración de la aplicación.
+            name: Prefijo del identificador del worker (por defecto host:pid).
+        """
+        self.settings = settings
+        self.queue = DocumentJobQueue(supabase, lease_seconds=settings.document_job_lease_seconds)
+        self.name = name or f"{socket.gethostname()}:{os.getpid()}"
+        self._stop_event = threading.Event()
+        self._threads: List[threading.Thread] = []
+        self._requeue_lock = threading.Lock()
+        self._last_requeue = 0.0
+
+    def start(self, concurrency: Optional[int] = None) -> None:
+        """Ejecuta el barrido de arranque y lanza los threads del worker."""
+        self._requeue_stale()
+
+        concurrency = max(1, concurrency or self.settings.document_worker_concurrency)
+        for i in range(concurrency):
+            thread = threading.Thread(
+                target=self._run_loop,
+                args=(f"{self.name}:{i}",),
+                name=f"document-worker-{i}",
+                daemon=True,
+            )
+            thread.start()
+            self._threads.append(thread)
+        logger.info("Document worker {} started with {} thread(s)", self.name, concurrency)
+
+    def request_stop(self) -> None:
+        """Señala a los threads que terminen tras el trabajo en curso (no bloquea)."""
+        self._stop_event.set()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Detiene el worker esperando a que terminen los trabajos en curso."""
+        self.request_stop()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        logger.info("Document worker {} stopped", self.name)
+
+    def wait(self) -> None:
+        """Bloquea hasta que todos los threads terminen."""
+        for thread in self._threads:
+            while thread.is_alive():
+                thread.join(timeout=1.0)
+
+    def _requeue_stale(self) -> None:
+        """Devuelve a la cola los trabajos de workers caídos (lease expirado)."""
+        self._last_requeue = time.monotonic()
+        try:
+            self.queue.requeue_stale()
+        except Exception as e:
+            logger.error("Error requeuing stale document jobs: {}", e)
+
+    def _maybe_requeue_stale(self) -> None:
+        # Periódico y no solo al arrancar: si otro worker muere a mitad de un trabajo,
+        # su lease expira y el trabajo vuelve a la cola sin esperar a ningún reinicio
+        if time.monotonic() - self._last_requeue < self.settings.document_job_requeue_interval_seconds:
+            return
+        if not self._requeue_lock.acquire(blocking=False):
+            return
+        try:
+            if time.monotonic() - self._last_requeue >= self.settings.document_job_requeue_interval_seconds:
+                self._requeue_stale()
+        finally:
+            self._requeue_lock.release()
+
+    def _run_loop(self, worker_id: str) -> None:
+        while not self._stop_event.is_set():
+            self._maybe_requeue_stale()
+            try:
+                processed = self.run_once(worker_id)
+            except Exception as e:
+                logger.error("Document worker {} loop error: {}", worker_id, e)
+                processed = False
+            if not processed:
+                self._stop_event.wait(self.settings.document_worker_poll_seconds)
+
+    def run_once(self, worker_id: str) -> bool:
+        """Toma y procesa un trabajo. Devuelve False si la cola estaba vacía."""
+        job = self.queue.lease(worker_id)
+        if job is None:
+            return False
+
+        logger.info(
+            "Worker {} leased {} job {} for document {} (attempt {}/{})",
+            worker_id, job.job_type, job.id, job.document_id, job.attempts, job.max_attempts,
+        )
+        heartbeat_stop = threading.Event()
+        heartbeat = threading.Thread(
+            target=self._heartbeat_loop, args=(job, worker_id, heartbeat_stop), daemon=True
+        )
+        heartbeat.start()
+        try:
+            if job.job_type == "reembed":
+                error = reembed_document_job(job.document_id, job.model_name)
+            else:
+                error = process_document_job(job.document_id, final_attempt=job.is_last_attempt)
+        except Exception as e:
+            error = f"Error inesperado en el worker: {e}"
+            logger.exception(error)
+        finally:
+            heartbeat_stop.set()
+            heartbeat.join()
+
+        if error:
+            status = self.queue.fail(
+                job.id, worker_id, error, backoff_seconds=self.settings.document_job_backoff_seconds
+            )
+            logger.warning("Job {} failed (next status: {}): {}", job.id, status, error)
+        else:
+            self.queue.complete(job.id, worker_id)
+        return True
+
+    def _heartbeat_loop(self, job: DocumentJob, worker_id: str, stop: threading.Event) -> None:
+        interval = max(1.0, self.queue.lease_seconds / 3)
+        while not stop.wait(interval):
+            try:
+                if not self.queue.heartbeat(job.id, worker_id):
+                    logger.warning("Worker {} lost the lease on job {}", worker_id, job.id)
+                    return
+            except Exception as e:
+                logger.warning("Heartbeat failed for job {}: {}", job.id, e)
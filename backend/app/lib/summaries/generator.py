@@ -1,6 +1,6 @@
 """Generador de resúmenes automáticos."""
 
-from typing import List, Dict
+from typing import List, Dict, Optional
 from loguru import logger
 
 from ..model import LLMClient, get_llm_client
@@ -17,11 +17,18 @@ class SummaryGenerator:
         """
         self.llm_client = llm_client
 
-    async def generate_summary(self, messages: List[Dict[str, str]]) -> str:
+    async def generate_summary(
+        self,
+        messages: List[Dict[str, str]],
+        user_id: Optional[str] = None,
+        conversation_id: Optional[str] = None,
+    ) -> str:
         """Genera un resumen de una conversación.
         
         Args:
             messages: Lista de mensajes de la conversación.
+            user_id: Usuario al que se imputa el uso de tokens.
+            conversation_id: Conversación resumida.
             
         Returns:
             Resumen generado.
@@ -56,7 +63,7 @@ Resumen:"""
             response = await self.llm_client.chat_completion([
                 {"role": "system", "content": "Eres un asistente experto en generar resúmenes concisos y útiles."},
                 {"role": "user", "content": summary_prompt}
-            ], temperature=0.3, max_tokens=500)
+            ], temperature=0.3, max_tokens=500, source="summary", user_id=user_id, conversation_id=conversation_id)
             
             summary = (
                 response.get("choices", [{}])[0]
@@ -2,6 +2,12 @@ import os
 import warnings
 import inspect
 
+from .config import get_settings
+
+# Los parches de PyTorch solo son necesarios con el backend sentence-transformers;
+# con ONNX Runtime no se importa torch y el arranque evita el hook de imports
+_USE_TORCH_BACKEND = get_settings().embedding_backend != "onnx"
+
 # Suprimir advertencias de PyTorch sobre "could not get source code"
 # Esto es necesario en macOS con Python 3.12
 warnings.filterwarnings("ignore", message=".*could not get source code.*")
@@ -52,9 +58,10 @@ def _patched_findsource(object):
     except (OSError, TypeError, ValueError):
         return ([], 0)
 
-inspect.getsource = _patched_getsource
-inspect.getsourcelines = _patched_getsourcelines
-inspect.findsource = _patched_findsource
+if _USE_TORCH_BACKEND:
+    inspect.getsource = _patched_getsource
+    inspect.getsourcelines = _patched_getsourcelines
+    inspect.findsource = _patched_findsource
 
 # Monkey patch torch._sources.parse_def usando un import hook
 # Esto intercepta la importación de torch y aplica el patch inmediatamente
@@ -131,7 +138,8 @@ def _patched_import(name, *args, **kwargs):
 
 # Aplicar el monkey patch de import
 import builtins
-builtins.__import__ = _patched_import
+if _USE_TORCH_BACKEND:
+    builtins.__import__ = _patched_import
 
 # Usar certificados del sistema de macOS en lugar de certifi
 # certifi no funciona correctamente en macOS con Python 3.12
@@ -145,6 +153,8 @@ else:
     os.environ["SSL_CERT_FILE"] = certifi.where()
     os.environ["REQUESTS_CA_BUNDLE"] = certifi.where()
 
+from contextlib import asynccontextmanager
+
 from fastapi import Depends, FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 
@@ -152,12 +162,60 @@ from .config import Settings, get_settings
 from .routes import auth, billing, chat, admin
 
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Arranque y parada de servicios en background."""
+    from loguru import logger
+
+    settings = get_settings()
+
+    # Iniciar la carga del modelo de embeddings (thread en background) y el warm-up
+    from .lib.embeddings import get_embedding_generator
+
+    embedding_generator = get_embedding_generator()
+    if settings.embedding_warmup_timeout_seconds > 0:
+        if await embedding_generator.await_ready(settings.embedding_warmup_timeout_seconds):
+            logger.info("Embedding model ready ({})", embedding_generator.model_id)
+        else:
+            logger.warning(
+                "Embedding model not ready after {}s (status: {}); serving with degraded retrieval",
+                settings.embedding_warmup_timeout_seconds,
+                embedding_generator.status,
+            )
+
+    document_worker = None
+    if settings.document_worker_embedded:
+        # Worker embebido para desarrollo; en producción usar `python -m app.worker`
+        try:
+            from .lib.rag.worker import DocumentWorker
+            from .lib.supabase import get_supabase_client
+
+            document_worker = DocumentWorker(get_supabase_client(), settings)
+            document_worker.start()
+        except Exception as e:
+            logger.error("Could not start embedded document worker: {}", e)
+            document_worker = None
+
+    # Volcado periódico de la contabilidad de tokens del LLM
+    from .lib.model.usage import get_usage_recorder
+
+    usage_recorder = get_usage_recorder()
+    usage_recorder.start()
+
+    yield
+
+    if document_worker is not None:
+        document_worker.stop(timeout=5.0)
+    usage_recorder.stop(timeout=5.0)
+
+
 def create_app() -> FastAPI:
     settings = get_settings()
     app = FastAPI(
         title="Ladybug API",
         version="0.1.0",
         description="Backend FastAPI para Ladybug - Compañera diaria con IA",
+        lifespan=lifespan,
     )
 
     app.add_middleware(
@@ -200,6 +258,19 @@ def create_app() -> FastAPI:
         
         return health_status
 
+    @app.get("/ready", tags=["util"])
+    def readiness_check():
+        """Readiness: 200 solo cuando el modelo de embeddings está cargado."""
+        from fastapi.responses import JSONResponse
+        from .lib.embeddings import get_embedding_generator
+
+        embeddings = get_embedding_generator().readiness()
+        ready = embeddings["status"] == "ready"
+        return JSONResponse(
+            status_code=200 if ready else 503,
+            content={"status": "ready" if ready else "not_ready", "embeddings": embeddings},
+        )
+
     return app
 
 
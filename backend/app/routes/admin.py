@@ -1,7 +1,7 @@
 """Rutas para el portal de administración académica."""
 
 from typing import List, Optional
-from datetime import datetime
+from datetime import datetime, timedelta, timezone
 import hashlib
 
 from fastapi import APIRouter, Depends, HTTPException, status, UploadFile, File
@@ -9,9 +9,25 @@ from fastapi.responses import StreamingResponse
 from loguru import logger
 from supabase import Client
 
+from ..config import get_settings
 from ..dependencies import get_supabase, get_current_user
-from ..lib.rag.job_processor import enqueue_document_processing
+from ..lib.rag.document_processor import (
+    clone_document_chunks,
+    find_processed_duplicate,
+    get_processing_fingerprint,
+    has_chunks,
+)
+from ..lib.embeddings.registry import (
+    KNOWN_MODELS,
+    get_active_model,
+    get_model_spec,
+    get_shadow_models,
+)
+from ..lib.limits import get_admission_controller
+from ..lib.model.usage import estimate_cost, get_usage_recorder
+from ..lib.rag.job_processor import enqueue_document_processing, enqueue_document_reembed
 from ..schemas import (
+    AdmissionMetricsResponse,
     AdminSignupRequest,
     AdminLoginRequest,
     AdminAuthResponse,
@@ -19,7 +35,10 @@ from ..schemas import (
     DocumentUploadResponse,
     DocumentResponse,
     DocumentUpdateRequest,
+    EmbeddingModelStatus,
     MetricsResponse,
+    ReembedResponse,
+    UsageDayResponse,
 )
 
 router = APIRouter(prefix="/admin", tags=["admin"])
@@ -46,6 +65,25 @@ def get_current_admin(
     return current_user
 
 
+def _document_response(doc: dict) -> DocumentResponse:
+    """Construye la respuesta de un documento a partir de su fila."""
+    return DocumentResponse(
+        id=doc["id"],
+        filename=doc["filename"],
+        file_path=doc["file_path"],
+        file_size=doc.get("file_size"),
+        mime_type=doc.get("mime_type"),
+        status=doc["status"],
+        processing_status=doc.get("processing_status"),
+        processing_error=doc.get("processing_error"),
+        processed_at=datetime.fromisoformat(doc["processed_at"].replace("Z", "+00:00"))
+        if doc.get("processed_at")
+        else None,
+        created_at=datetime.fromisoformat(doc["created_at"].replace("Z", "+00:00")),
+        updated_at=datetime.fromisoformat(doc["updated_at"].replace("Z", "+00:00")),
+    )
+
+
 @router.post("/signup", response_model=AdminAuthResponse)
 def admin_signup(
     payload: AdminSignupRequest,
@@ -209,23 +247,30 @@ async def upload_document(
                 detail=f"Error al subir el archivo: {storage_response.error}",
             )
 
+        # Si ya hay un documento idéntico procesado, reutilizar sus chunks sin reprocesar
+        duplicate = find_processed_duplicate(supabase, content_hash)
+
         # Crear registro en knowledge_documents
-        doc_response = (
-            supabase.table("knowledge_documents")
-            .insert(
+        doc_data = {
+            "admin_user_id": current_admin["id"],
+            "filename": filename,
+            "file_path": storage_path,
+            "file_size": file_size,
+            "mime_type": file.content_type,
+            "status": "processing",
+            "content_hash": content_hash,
+            "processing_status": "queued",
+        }
+        if duplicate:
+            doc_data.update(
                 {
-                    "admin_user_id": current_admin["id"],
-                    "filename": filename,
-                    "file_path": storage_path,
-                    "file_size": file_size,
-                    "mime_type": file.content_type,
-                    "status": "processing",
-                    "content_hash": content_hash,
-                    "processing_status": "queued",
+                    "status": "active",
+                    "processing_status": "completed",
+                    "processing_fingerprint": get_processing_fingerprint(),
+                    "processed_at": datetime.utcnow().isoformat(),
                 }
             )
-            .execute()
-        )
+        doc_response = supabase.table("knowledge_documents").insert(doc_data).execute()
 
         if not doc_response.data or len(doc_response.data) == 0:
             # Intentar eliminar el archivo del storage si falla la inserción
@@ -240,6 +285,39 @@ async def upload_document(
 
         doc = doc_response.data[0]
 
+        if duplicate:
+            num_chunks = 0
+            try:
+                num_chunks = clone_document_chunks(supabase, duplicate["id"], doc["id"])
+            except Exception as e:
+                logger.warning("Error cloning chunks from duplicate {}: {}", duplicate["id"], e)
+
+            if num_chunks > 0:
+                supabase.table("processing_logs").insert(
+                    {
+                        "document_id": doc["id"],
+                        "log_type": "success",
+                        "message": f"Contenido idéntico a '{duplicate['filename']}'. {num_chunks} chunks reutilizados.",
+                    }
+                ).execute()
+                logger.info("Upload {} deduplicated from {} ({} chunks)", doc["id"], duplicate["id"], num_chunks)
+                return DocumentUploadResponse(
+                    id=doc["id"],
+                    filename=filename,
+                    status="active",
+                    message="Documento subido correctamente. Contenido ya procesado anteriormente; se reutilizó.",
+                )
+
+            # No se pudieron clonar los chunks: procesar normalmente
+            supabase.table("knowledge_documents").update(
+                {
+                    "status": "processing",
+                    "processing_status": "queued",
+                    "processing_fingerprint": None,
+                    "processed_at": None,
+                }
+            ).eq("id", doc["id"]).execute()
+
         # Encolar procesamiento en background
         enqueue_document_processing(doc["id"])
 
@@ -276,24 +354,7 @@ def list_documents(
 
     documents = response.data if hasattr(response, "data") and response.data else []
 
-    return [
-        DocumentResponse(
-            id=doc["id"],
-            filename=doc["filename"],
-            file_path=doc["file_path"],
-            file_size=doc.get("file_size"),
-            mime_type=doc.get("mime_type"),
-            status=doc["status"],
-            processing_status=doc.get("processing_status"),
-            processing_error=doc.get("processing_error"),
-            processed_at=datetime.fromisoformat(doc["processed_at"].replace("Z", "+00:00"))
-            if doc.get("processed_at")
-            else None,
-            created_at=datetime.fromisoformat(doc["created_at"].replace("Z", "+00:00")),
-            updated_at=datetime.fromisoformat(doc["updated_at"].replace("Z", "+00:00")),
-        )
-        for doc in documents
-    ]
+    return [_document_response(doc) for doc in documents]
 
 
 @router.patch("/documents/{document_id}", response_model=DocumentResponse)
@@ -373,21 +434,7 @@ def update_document(
 
     updated_doc = update_response.data[0]
 
-    return DocumentResponse(
-        id=updated_doc["id"],
-        filename=updated_doc["filename"],
-        file_path=updated_doc["file_path"],
-        file_size=updated_doc.get("file_size"),
-        mime_type=updated_doc.get("mime_type"),
-        status=updated_doc["status"],
-        processing_status=updated_doc.get("processing_status"),
-        processing_error=updated_doc.get("processing_error"),
-        processed_at=datetime.fromisoformat(updated_doc["processed_at"].replace("Z", "+00:00"))
-        if updated_doc.get("processed_at")
-        else None,
-        created_at=datetime.fromisoformat(updated_doc["created_at"].replace("Z", "+00:00")),
-        updated_at=datetime.fromisoformat(updated_doc["updated_at"].replace("Z", "+00:00")),
-    )
+    return _document_response(updated_doc)
 
 
 @router.post("/documents/{document_id}/reprocess", response_model=DocumentResponse)
@@ -414,6 +461,15 @@ def reprocess_document(
 
     doc = doc_response.data[0]
 
+    # Sin cambios de contenido ni de configuración del pipeline: no hay nada que reprocesar
+    if (
+        doc.get("processing_status") == "completed"
+        and doc.get("processing_fingerprint") == get_processing_fingerprint()
+        and has_chunks(supabase, document_id)
+    ):
+        logger.info("Reprocess of document {} skipped: content and settings unchanged", document_id)
+        return _document_response(doc)
+
     # Eliminar chunks existentes
     supabase.table("document_chunks").delete().eq("document_id", document_id).execute()
 
@@ -443,21 +499,7 @@ def reprocess_document(
     # Encolar reprocesamiento
     enqueue_document_processing(document_id)
 
-    return DocumentResponse(
-        id=updated_doc["id"],
-        filename=updated_doc["filename"],
-        file_path=updated_doc["file_path"],
-        file_size=updated_doc.get("file_size"),
-        mime_type=updated_doc.get("mime_type"),
-        status=updated_doc["status"],
-        processing_status=updated_doc.get("processing_status"),
-        processing_error=updated_doc.get("processing_error"),
-        processed_at=datetime.fromisoformat(updated_doc["processed_at"].replace("Z", "+00:00"))
-        if updated_doc.get("processed_at")
-        else None,
-        created_at=datetime.fromisoformat(updated_doc["created_at"].replace("Z", "+00:00")),
-        updated_at=datetime.fromisoformat(updated_doc["updated_at"].replace("Z", "+00:00")),
-    )
+    return _document_response(updated_doc)
 
 
 @router.get("/metrics", response_model=MetricsResponse)
@@ -501,6 +543,12 @@ def get_metrics(
     )
 
 
+@router.get("/metrics/llm-admission", response_model=AdmissionMetricsResponse)
+async def get_llm_admission_metrics(current_admin=Depends(get_current_admin)):
+    """Cupo de llamadas al LLM en uso, profundidad de la cola y tiempos de espera (este proceso)."""
+    return AdmissionMetricsResponse(**get_admission_controller().metrics())
+
+
 @router.get("/logs")
 def get_logs(
     document_id: Optional[str] = None,
@@ -531,3 +579,110 @@ def get_logs(
 
     return logs
 
+
+@router.get("/embeddings/models", response_model=List[EmbeddingModelStatus])
+def list_embedding_models(
+    current_admin=Depends(get_current_admin),
+    supabase: Client = Depends(get_supabase),
+):
+    """Lista los modelos de embeddings registrados con su cobertura sobre los chunks."""
+    total_response = supabase.table("document_chunks").select("id", count="exact").limit(1).execute()
+    total_chunks = total_response.count or 0
+
+    coverage_response = supabase.rpc("embedding_model_coverage", {}).execute()
+    chunk_counts = {}
+    for row in coverage_response.data or []:
+        chunk_counts[row["model_name"]] = chunk_counts.get(row["model_name"], 0) + row["chunk_count"]
+
+    active = get_active_model()
+    shadows = get_shadow_models()
+    return [
+        EmbeddingModelStatus(
+            name=spec.name,
+            dimension=spec.dimension,
+            description=spec.description,
+            active=spec.name == active,
+            shadow=spec.name in shadows,
+            chunk_count=chunk_counts.get(spec.name, 0),
+            total_chunks=total_chunks,
+            coverage=round(chunk_counts.get(spec.name, 0) / total_chunks, 4) if total_chunks else 0.0,
+        )
+        for spec in KNOWN_MODELS.values()
+    ]
+
+
+@router.post("/embeddings/models/{model_name}/reembed", response_model=ReembedResponse)
+def reembed_documents(
+    model_name: str,
+    current_admin=Depends(get_current_admin),
+    supabase: Client = Depends(get_supabase),
+):
+    """Encola la generación de vectores de un modelo para todos los documentos procesados.
+
+    Los chunks nuevos solo se escriben con el modelo si está en EMBEDDING_SHADOW_MODELS
+    (o es el activo); añadirlo antes de lanzar el re-embedding para no dejar huecos.
+    """
+    try:
+        get_model_spec(model_name)
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=str(e))
+
+    if model_name != get_active_model() and model_name not in get_shadow_models():
+        logger.warning("Re-embedding with {} while it is not a shadow model: new chunks will be missing", model_name)
+
+    docs_response = (
+        supabase.table("knowledge_documents")
+        .select("id")
+        .eq("processing_status", "completed")
+        .neq("status", "deleted")
+        .execute()
+    )
+    enqueued = 0
+    for doc in docs_response.data or []:
+        if enqueue_document_reembed(doc["id"], model_name):
+            enqueued += 1
+
+    logger.info("Enqueued {} re-embed jobs for model {}", enqueued, model_name)
+    return ReembedResponse(model_name=model_name, enqueued=enqueued)
+
+
+@router.get("/usage", response_model=List[UsageDayResponse])
+def get_llm_usage(
+    days: int = 30,
+    user_id: Optional[str] = None,
+    current_admin=Depends(get_current_admin),
+    supabase: Client = Depends(get_supabase),
+):
+    """Uso de tokens del LLM y coste estimado por usuario y día (últimos `days` días)."""
+    # Incluir lo acumulado en memoria desde el último volcado
+    get_usage_recorder().flush()
+
+    since = (datetime.now(timezone.utc) - timedelta(days=max(1, days) - 1)).date()
+    response = supabase.rpc(
+        "llm_usage_by_user_day", {"p_since": since.isoformat(), "p_user_id": user_id}
+    ).execute()
+
+    settings = get_settings()
+    return [
+        UsageDayResponse(
+            user_id=row.get("user_id"),
+            usage_date=row["usage_date"],
+            request_count=row["request_count"],
+            prompt_tokens=row["prompt_tokens"],
+            completion_tokens=row["completion_tokens"],
+            cached_tokens=row["cached_tokens"],
+            cache_hit_ratio=round(row["cached_tokens"] / row["prompt_tokens"], 4) if row["prompt_tokens"] else 0.0,
+            estimated_cost_usd=round(
+                estimate_cost(
+                    row["prompt_tokens"],
+                    row["completion_tokens"],
+                    row["cached_tokens"],
+                    settings.llm_price_input_per_mtok,
+                    settings.llm_price_cached_input_per_mtok,
+                    settings.llm_price_output_per_mtok,
+                ),
+                6,
+            ),
+        )
+        for row in response.data or []
+    ]
@@ -1,4 +1,4 @@
-from datetime import datetime
+from datetime import date, datetime
 from typing import Literal, Optional
 
 from pydantic import BaseModel, EmailStr, Field
@@ -144,3 +144,43 @@ class MetricsResponse(BaseModel):
     nationality: dict
 
 
+class EmbeddingModelStatus(BaseModel):
+    name: str
+    dimension: int
+    description: str
+    active: bool
+    shadow: bool
+    chunk_count: int
+    total_chunks: int
+    coverage: float
+
+
+class ReembedResponse(BaseModel):
+    model_name: str
+    enqueued: int
+
+
+class UsageDayResponse(BaseModel):
+    user_id: Optional[str]
+    usage_date: date
+    request_count: int
+    prompt_tokens: int
+    completion_tokens: int
+    cached_tokens: int
+    cache_hit_ratio: float
+    estimated_cost_usd: float
+
+
+class AdmissionMetricsResponse(BaseModel):
+    inflight: int
+    queue_depth: int
+    max_inflight: int
+    max_queue: int
+    queue_timeout_seconds: float
+    wait_ms_p50: float
+    wait_ms_p95: float
+    wait_ms_max: float
+    admitted: int
+    queued: int
+    rejected_queue_full: int
+    rejected_timeout: int
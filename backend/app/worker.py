@@ -0,0 +1,45 @@
+"""Proceso independiente que vacía la cola de documentos.
+
+Uso:
+    python -m app.worker [--concurrency N]
+
+Se pueden lanzar varios procesos en paralelo; el leasing con SKIP LOCKED
+garantiza que cada trabajo lo tome un solo worker.
+"""
+
+import argparse
+import signal
+
+from loguru import logger
+
+from .config import get_settings
+from .lib.rag.worker import DocumentWorker
+from .lib.supabase import get_supabase_client
+
+
+def main() -> None:
+    settings = get_settings()
+    parser = argparse.ArgumentParser(description="Worker de procesamiento de documentos")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.document_worker_concurrency,
+        help="Número de trabajos procesados en paralelo por este proceso",
+    )
+    args = parser.parse_args()
+
+    worker = DocumentWorker(get_supabase_client(), settings)
+
+    def _handle_signal(signum, frame):
+        logger.info("Received signal {}, finishing current jobs", signum)
+        worker.request_stop()
+
+    signal.signal(signal.SIGINT, _handle_signal)
+    signal.signal(signal.SIGTERM, _handle_signal)
+
+    worker.start(concurrency=args.concurrency)
+    worker.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Benchmark de generación de embeddings en batch (chunks/segundo).
+
+Genera un documento sintético largo, lo divide con el mismo chunker que el
+pipeline RAG y mide el throughput de EmbeddingGenerator.generate_batch con
+distintos tamaños de batch (sin caché persistente).
+
+Con --backend onnx compara además los vectores contra sentence-transformers
+(similitud coseno mínima sobre una muestra) e informa el tiempo de carga y la RSS.
+
+Uso:
+    python scripts/benchmark_embeddings.py [--chunks 400] [--batch-sizes 8,16,32,64]
+    python scripts/benchmark_embeddings.py --backend onnx [--quantize]
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz del backend al path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from app.lib.embeddings import DEFAULT_EMBEDDING_MODEL, EmbeddingGenerator
+from app.lib.embeddings.backends import SentenceTransformerBackend, create_backend
+from app.lib.rag.document_processor import chunk_text
+
+WORDS = (
+    "universidad matrícula visado estudiante requisitos plazo solicitud beca "
+    "residencia documentación homologación título máster grado admisión NIE TIE "
+    "empadronamiento seguro médico alojamiento convocatoria créditos asignatura"
+).split()
+
+
+def build_document(num_chunks: int, seed: int = 42) -> str:
+    """Construye un texto con frases de longitud variable (~num_chunks chunks)."""
+    rng = random.Random(seed)
+    sentences = []
+    target_chars = num_chunks * 3200  # chunk de 1000 tokens con 200 de overlap ≈ 3200 caracteres nuevos
+    total = 0
+    while total < target_chars:
+        sentence = " ".join(rng.choice(WORDS) for _ in range(rng.randint(4, 40))).capitalize() + ". "
+        sentences.append(sentence)
+        total += len(sentence)
+    return "".join(sentences)
+
+
+def max_rss_mb() -> float:
+    """RSS máxima del proceso en MB (Linux/macOS)."""
+    import resource
+
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == "darwin" else rss / 1024
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--chunks", type=int, default=400, help="Número aproximado de chunks")
+    parser.add_argument("--batch-sizes", default="8,16,32,64", help="Tamaños de batch a comparar")
+    parser.add_argument("--token-budget", type=int, default=4096, help="Tokens con padding por batch")
+    parser.add_argument("--backend", default="sentence-transformers", choices=["sentence-transformers", "onnx"])
+    parser.add_argument("--quantize", action="store_true", help="Cuantización int8 (solo ONNX)")
+    parser.add_argument("--onnx-model-dir", default="", help="Directorio con model.onnx y tokenizer.json")
+    args = parser.parse_args()
+
+    document = build_document(args.chunks)
+    chunks = [text for text, _ in chunk_text(document)]
+    # Mezclar con textos cortos (consultas, hechos de memoria) para ejercitar el bucketing
+    chunks += [" ".join(WORDS[i : i + 6]) for i in range(0, len(WORDS) - 6)]
+    print(f"Textos: {len(chunks)} (longitud media {sum(map(len, chunks)) / len(chunks):.0f} caracteres)")
+
+    backend = create_backend(
+        args.backend, DEFAULT_EMBEDDING_MODEL, onnx_model_dir=args.onnx_model_dir, onnx_quantize=args.quantize
+    )
+    load_start = time.perf_counter()
+    generator = EmbeddingGenerator(batch_token_budget=args.token_budget, backend=backend)
+    if not generator.wait_until_ready():
+        print("❌ El modelo no se pudo cargar; no hay nada que medir")
+        return
+    print(f"Backend: {backend.model_id} ({backend.name}), carga en {time.perf_counter() - load_start:.2f}s")
+    generator.generate_batch(chunks[:8], use_cache=False)  # calentamiento
+
+    for batch_size in (int(b) for b in args.batch_sizes.split(",")):
+        generator.batch_size = batch_size
+        start = time.perf_counter()
+        embeddings = generator.generate_batch(chunks, use_cache=False)
+        elapsed = time.perf_counter() - start
+        print(
+            f"batch_size={batch_size:>3}  {len(chunks) / elapsed:8.1f} chunks/s  "
+            f"({elapsed:.2f}s, shape={embeddings.shape}, dtype={embeddings.dtype})"
+        )
+    print(f"RSS máxima: {max_rss_mb():.0f} MB")
+
+    if args.backend != SentenceTransformerBackend.name:
+        sample = chunks[:: max(1, len(chunks) // 64)]
+        reference = SentenceTransformerBackend(DEFAULT_EMBEDDING_MODEL)
+        reference.load()
+        expected = reference.encode(sample, batch_size=32)
+        actual = backend.encode(sample, batch_size=32)
+        cosine = (expected * actual).sum(axis=1)
+        print(
+            f"Comparación con sentence-transformers ({len(sample)} textos): "
+            f"coseno mínimo {cosine.min():.5f}, diferencia absoluta máxima {abs(expected - actual).max():.5f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
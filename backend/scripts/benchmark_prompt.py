@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+"""
+Microbenchmark del ensamblado del prompt del sistema (build_system_prompt).
+
+Mide el tiempo por turno con un contexto típico (memorias, resumen, chunks RAG y
+resultados web) repitiendo un conjunto pequeño de perfiles, como en producción.
+Con --no-tokenizer se usa la aproximación len/4 en lugar del tokenizer del modelo.
+
+Uso:
+    python scripts/benchmark_prompt.py [--turns 5000] [--users 50] [--no-tokenizer]
+"""
+
+import argparse
+import statistics
+import sys
+import time
+from pathlib import Path
+
+# Agregar el directorio raíz del backend al path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from loguru import logger
+
+from app.lib.model import build_system_prompt, get_prompt_budgeter
+from app.lib.model.budget import PromptBudgeter, TokenCounter
+from app.lib.model import budget as budget_module
+
+SEMANTIC = "\n".join(f"- Hecho persistente número {i} sobre la usuaria y sus objetivos" for i in range(5))
+EPISODIC = "\n".join(f"- Resumen de la sesión {i}: habló de sus estudios y de su rutina" for i in range(5))
+SUMMARY = "La usuaria está preparando la solicitud del visado de estudiante y pregunta por plazos."
+RAG = "=== DOCUMENTOS ===\n" + "\n\n".join(
+    f"[Fragmento {i}] Requisitos de matrícula, plazos de admisión y documentación necesaria. " * 6 for i in range(8)
+)
+WEB = "=== RESULTADOS WEB ===\n" + "\n".join(f"- Resultado {i}: información oficial sobre el trámite" for i in range(5))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--turns", type=int, default=5000, help="Prompts a construir")
+    parser.add_argument("--users", type=int, default=50, help="Perfiles distintos")
+    parser.add_argument("--no-tokenizer", action="store_true", help="Usar la aproximación len/4")
+    args = parser.parse_args()
+
+    # El log de depuración por prompt dominaría la medición
+    logger.remove()
+    logger.add(sys.stderr, level="INFO")
+
+    if args.no_tokenizer:
+        budget_module._prompt_budgeter = PromptBudgeter(TokenCounter(""), get_prompt_budgeter().max_tokens)
+    else:
+        counter = get_prompt_budgeter().counter
+        counter.count("warm-up")
+        deadline = time.time() + 60
+        while not counter.is_exact and time.time() < deadline:
+            time.sleep(0.1)
+        print(f"Tokenizer: {'exacto' if counter.is_exact else 'aproximación len/4'}")
+
+    profiles = [
+        (f"Usuaria{i}", "ENFP", "leer novelas", f"estudiar {i % 4 + 1} horas y correr")
+        for i in range(args.users)
+    ]
+
+    timings = []
+    for turn in range(args.turns):
+        name, personality, activity, goals = profiles[turn % len(profiles)]
+        start = time.perf_counter()
+        prompt = build_system_prompt(
+            SEMANTIC,
+            EPISODIC,
+            SUMMARY,
+            user_name=name,
+            user_study_type=personality,
+            user_career_interest=activity,
+            user_nationality=goals,
+            rag_context=RAG,
+            web_context=WEB,
+        )
+        timings.append((time.perf_counter() - start) * 1_000_000)
+
+    timings.sort()
+    print(f"Prompt: {len(prompt)} caracteres, {get_prompt_budgeter().counter.count(prompt)} tokens")
+    print(
+        f"{args.turns} turnos: media {statistics.mean(timings):.1f} µs, "
+        f"p50 {timings[len(timings) // 2]:.1f} µs, p99 {timings[int(len(timings) * 0.99)]:.1f} µs"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""
+Genera los vectores de un modelo de embeddings para la memoria semántica y episódica.
+
+Complementa el re-embedding de documentos (POST /admin/embeddings/models/{modelo}/reembed)
+durante un cambio de modelo: ejecutar con el modelo nuevo ya en EMBEDDING_SHADOW_MODELS
+para que las memorias creadas mientras tanto también se escriban con él. Solo procesa
+las filas que todavía no tienen vector para el modelo, por lo que se puede relanzar.
+
+Uso:
+    python scripts/reembed_memories.py --model paraphrase-multilingual-MiniLM-L12-v2 [--batch-size 200]
+"""
+
+import argparse
+import sys
+from pathlib import Path
+
+# Agregar el directorio raíz del backend al path
+backend_dir = Path(__file__).parent.parent
+sys.path.insert(0, str(backend_dir))
+
+from loguru import logger
+
+from app.lib.embeddings import get_embedding_generator
+from app.lib.embeddings.registry import (
+    MEMORY_TABLES,
+    get_model_spec,
+    store_memory_embedding,
+    to_pgvector,
+    uses_column_storage,
+)
+from app.lib.supabase import get_supabase_client
+
+CONTENT_COLUMNS = {"semantic_memory": "fact", "episodic_memory": "session_summary"}
+
+
+def pending_rows(supabase, memory_table: str, model_name: str, after_id: str, batch_size: int):
+    """Siguiente página de filas (por id) y los ids que ya tienen vector del modelo."""
+    query = supabase.table(memory_table).select(f"id, user_id, {CONTENT_COLUMNS[memory_table]}, embedding_model")
+    if after_id:
+        query = query.gt("id", after_id)
+    rows = query.order("id").limit(batch_size).execute().data or []
+    if not rows or uses_column_storage(model_name):
+        done = {row["id"] for row in rows if row.get("embedding_model") == model_name}
+        return rows, done
+
+    existing = (
+        supabase.table("memory_embeddings")
+        .select("memory_id")
+        .eq("memory_table", memory_table)
+        .eq("model_name", model_name)
+        .in_("memory_id", [row["id"] for row in rows])
+        .execute()
+    ).data or []
+    return rows, {row["memory_id"] for row in existing}
+
+
+def reembed_table(supabase, memory_table: str, model_name: str, batch_size: int) -> int:
+    generator = get_embedding_generator(model_name)
+    column = CONTENT_COLUMNS[memory_table]
+    dimension = get_model_spec(model_name).dimension
+    total = 0
+    after_id = ""
+    while True:
+        rows, done = pending_rows(supabase, memory_table, model_name, after_id, batch_size)
+        if not rows:
+            return total
+        after_id = rows[-1]["id"]
+
+        todo = [row for row in rows if row["id"] not in done and row.get(column)]
+        if not todo:
+            continue
+        embeddings = generator.generate_batch([row[column] for row in todo], use_cache=False)
+        for row, embedding in zip(todo, embeddings):
+            if uses_column_storage(model_name):
+                supabase.table(memory_table).update(
+                    {"embedding": to_pgvector(embedding), "embedding_model": model_name, "embedding_dim": dimension}
+                ).eq("id", row["id"]).execute()
+            else:
+                store_memory_embedding(supabase, memory_table, row["id"], row["user_id"], model_name, embedding)
+        total += len(todo)
+        logger.info("{}: {} filas re-embebidas con {}", memory_table, total, model_name)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--model", required=True, help="Modelo de embeddings registrado")
+    parser.add_argument("--batch-size", type=int, default=200, help="Filas por página")
+    args = parser.parse_args()
+
+    get_model_spec(args.model)
+    generator = get_embedding_generator(args.model)
+    if not generator.wait_until_ready():
+        print(f"❌ No se pudo cargar el modelo {args.model}: {generator.readiness().get('error')}")
+        sys.exit(1)
+
+    supabase = get_supabase_client()
+    for memory_table in MEMORY_TABLES:
+        count = reembed_table(supabase, memory_table, args.model, args.batch_size)
+        print(f"✅ {memory_table}: {count} filas re-embebidas con {args.model}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,36 @@
+-- Deduplicación de documentos por content_hash
+-- processing_fingerprint identifica la configuración con la que se generaron los chunks
+-- (modelo de embeddings + parámetros de chunking). Si el hash y el fingerprint coinciden
+-- con un documento ya procesado, sus chunks se clonan en lugar de reprocesar.
+
+alter table public.knowledge_documents
+    add column if not exists processing_fingerprint text;
+
+create index if not exists idx_knowledge_documents_hash_fingerprint
+    on public.knowledge_documents(content_hash, processing_fingerprint)
+    where processing_status = 'completed';
+
+-- Copia los chunks (con embeddings) de un documento a otro dentro de la base de datos,
+-- sin transferir los vectores por la red.
+create or replace function clone_document_chunks(
+    source_document_id uuid,
+    target_document_id uuid
+)
+returns int
+language plpgsql
+as $$
+declare
+    v_count int;
+begin
+    delete from document_chunks where document_id = target_document_id;
+
+    insert into document_chunks (document_id, chunk_index, content, embedding, token_count)
+    select target_document_id, chunk_index, content, embedding, token_count
+    from document_chunks
+    where document_id = source_document_id
+    order by chunk_index;
+
+    get diagnostics v_count = row_count;
+    return v_count;
+end;
+$$;
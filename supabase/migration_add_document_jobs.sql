@@ -0,0 +1,198 @@
+-- Cola duradera de trabajos de procesamiento de documentos
+-- Reemplaza los threads en memoria: los trabajos sobreviven a reinicios,
+-- se asignan con leasing (FOR UPDATE SKIP LOCKED) y se reintentan con backoff.
+
+create table if not exists public.document_jobs (
+    id uuid primary key default uuid_generate_v4(),
+    document_id uuid not null references public.knowledge_documents(id) on delete cascade,
+    status text not null default 'queued' check (status in ('queued', 'leased', 'completed', 'failed')),
+    attempts integer not null default 0,
+    max_attempts integer not null default 3,
+    run_after timestamptz not null default timezone('utc', now()),
+    leased_by text,
+    lease_expires_at timestamptz,
+    heartbeat_at timestamptz,
+    last_error text,
+    created_at timestamptz not null default timezone('utc', now()),
+    updated_at timestamptz not null default timezone('utc', now())
+);
+
+create index if not exists idx_document_jobs_ready on public.document_jobs(status, run_after);
+create index if not exists idx_document_jobs_document_id on public.document_jobs(document_id);
+create index if not exists idx_document_jobs_lease_expires_at on public.document_jobs(lease_expires_at)
+    where status = 'leased';
+
+-- Un solo trabajo pendiente o en curso por documento
+create unique index if not exists idx_document_jobs_one_active_per_document
+    on public.document_jobs(document_id)
+    where status in ('queued', 'leased');
+
+-- Encola un documento (idempotente si ya hay un trabajo pendiente o en curso)
+create or replace function enqueue_document_job(
+    p_document_id uuid,
+    p_max_attempts int default 3
+)
+returns uuid
+language plpgsql
+as $$
+declare
+    v_job_id uuid;
+begin
+    insert into document_jobs (document_id, max_attempts)
+    values (p_document_id, p_max_attempts)
+    on conflict (document_id) where status in ('queued', 'leased') do nothing
+    returning id into v_job_id;
+
+    if v_job_id is null then
+        select id into v_job_id
+        from document_jobs
+        where document_id = p_document_id
+          and status in ('queued', 'leased')
+        limit 1;
+    end if;
+
+    return v_job_id;
+end;
+$$;
+
+-- Toma el siguiente trabajo disponible sin bloquear a otros workers
+create or replace function lease_document_job(
+    p_worker_id text,
+    p_lease_seconds int default 60
+)
+returns setof document_jobs
+language plpgsql
+as $$
+begin
+    return query
+    update document_jobs dj
+    set status = 'leased',
+        attempts = dj.attempts + 1,
+        leased_by = p_worker_id,
+        lease_expires_at = timezone('utc', now()) + make_interval(secs => p_lease_seconds),
+        heartbeat_at = timezone('utc', now()),
+        updated_at = timezone('utc', now())
+    where dj.id = (
+        select id
+        from document_jobs
+        where status = 'queued'
+          and run_after <= timezone('utc', now())
+        order by run_after, created_at
+        for update skip locked
+        limit 1
+    )
+    returning dj.*;
+end;
+$$;
+
+-- Extiende el lease de un trabajo en curso. Devuelve false si el lease se perdió.
+create or replace function heartbeat_document_job(
+    p_job_id uuid,
+    p_worker_id text,
+    p_lease_seconds int default 60
+)
+returns boolean
+language plpgsql
+as $$
+begin
+    update document_jobs
+    set lease_expires_at = timezone('utc', now()) + make_interval(secs => p_lease_seconds),
+        heartbeat_at = timezone('utc', now()),
+        updated_at = timezone('utc', now())
+    where id = p_job_id
+      and status = 'leased'
+      and leased_by = p_worker_id;
+
+    return found;
+end;
+$$;
+
+create or replace function complete_document_job(
+    p_job_id uuid,
+    p_worker_id text
+)
+returns boolean
+language plpgsql
+as $$
+begin
+    update document_jobs
+    set status = 'completed',
+        lease_expires_at = null,
+        last_error = null,
+        updated_at = timezone('utc', now())
+    where id = p_job_id
+      and status = 'leased'
+      and leased_by = p_worker_id;
+
+    return found;
+end;
+$$;
+
+-- Marca un intento fallido. Si quedan intentos, reprograma con backoff exponencial.
+-- Devuelve el estado resultante ('queued' o 'failed'), o null si el lease se perdió.
+create or replace function fail_document_job(
+    p_job_id uuid,
+    p_worker_id text,
+    p_error text,
+    p_base_backoff_seconds int default 30
+)
+returns text
+language plpgsql
+as $$
+declare
+    v_status text;
+begin
+    update document_jobs
+    set status = case when attempts < max_attempts then 'queued' else 'failed' end,
+        run_after = timezone('utc', now())
+            + make_interval(secs => p_base_backoff_seconds * power(2, greatest(attempts - 1, 0))),
+        leased_by = null,
+        lease_expires_at = null,
+        last_error = p_error,
+        updated_at = timezone('utc', now())
+    where id = p_job_id
+      and status = 'leased'
+      and leased_by = p_worker_id
+    returning status into v_status;
+
+    return v_status;
+end;
+$$;
+
+-- Barrido de arranque: devuelve a la cola los trabajos cuyo lease expiró
+-- (worker caído a mitad del procesamiento) y los documentos que quedaron en 'processing'.
+create or replace function requeue_stale_document_jobs()
+returns int
+language plpgsql
+as $$
+declare
+    v_count int;
+begin
+    with stale as (
+        update document_jobs
+        set status = case when attempts < max_attempts then 'queued' else 'failed' end,
+            leased_by = null,
+            lease_expires_at = null,
+            last_error = coalesce(last_error, 'Lease expirado (worker interrumpido)'),
+            updated_at = timezone('utc', now())
+        where status = 'leased'
+          and lease_expires_at < timezone('utc', now())
+        returning document_id, status
+    ), docs as (
+        update knowledge_documents kd
+        set processing_status = case when stale.status = 'queued' then 'queued' else 'error' end,
+            processing_error = case when stale.status = 'queued' then kd.processing_error
+                                    else 'Procesamiento interrumpido demasiadas veces' end,
+            updated_at = timezone('utc', now())
+        from stale
+        where kd.id = stale.document_id
+          and kd.processing_status = 'processing'
+        returning kd.id
+    )
+    select count(*) into v_count from stale;
+
+    return v_count;
+end;
+$$;
+
+grant all on public.document_jobs to service_role;
@@ -0,0 +1,14 @@
+-- Caché persistente de embeddings de chunks
+-- Clave: (modelo, sha256 del texto del chunk). Al reprocesar documentos solo se
+-- generan embeddings para los chunks cuyo texto cambió.
+-- Se usa real[] (no vector) para no fijar la dimensión del modelo.
+
+create table if not exists public.embedding_cache (
+    model_name text not null,
+    content_hash text not null,
+    embedding real[] not null,
+    created_at timestamptz not null default timezone('utc', now()),
+    primary key (model_name, content_hash)
+);
+
+grant all on public.embedding_cache to service_role;
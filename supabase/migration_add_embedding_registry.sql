@@ -0,0 +1,294 @@
+-- Registro de modelos de embeddings con almacenamiento por dimensión
+--
+-- Las columnas embedding vector(384) originales guardan los vectores del modelo
+-- all-MiniLM-L6-v2. Cada fila registra ahora el modelo y la dimensión de su vector
+-- (embedding_model, embedding_dim), y los vectores de cualquier otro modelo se guardan
+-- en tablas laterales con columna vector sin dimensión fija.
+--
+-- Cambio de modelo sin downtime:
+--   1. Añadir el modelo nuevo a EMBEDDING_SHADOW_MODELS: los chunks y memorias nuevos
+--      se escriben con ambos modelos (dual-write).
+--   2. POST /admin/embeddings/models/{modelo}/reembed encola trabajos 'reembed' que
+--      generan los vectores del modelo nuevo para los documentos existentes
+--      (scripts/reembed_memories.py hace lo mismo para las memorias).
+--   3. Cuando la cobertura llega al 100% (GET /admin/embeddings/models), cambiar
+--      EMBEDDING_MODEL al modelo nuevo. Las búsquedas pasan a las tablas laterales.
+
+-- 1. Modelo y dimensión por fila
+alter table public.document_chunks
+    add column if not exists embedding_model text,
+    add column if not exists embedding_dim integer;
+
+alter table public.semantic_memory
+    add column if not exists embedding_model text,
+    add column if not exists embedding_dim integer;
+
+alter table public.episodic_memory
+    add column if not exists embedding_model text,
+    add column if not exists embedding_dim integer;
+
+update public.document_chunks
+set embedding_model = 'all-MiniLM-L6-v2', embedding_dim = 384
+where embedding is not null and embedding_model is null;
+
+update public.semantic_memory
+set embedding_model = 'all-MiniLM-L6-v2', embedding_dim = 384
+where embedding is not null and embedding_model is null;
+
+update public.episodic_memory
+set embedding_model = 'all-MiniLM-L6-v2', embedding_dim = 384
+where embedding is not null and embedding_model is null;
+
+-- 2. Vectores de otros modelos (dimensión libre)
+-- Para corpus grandes, crear un índice por modelo con la dimensión fija, por ejemplo:
+--   create index on document_chunk_embeddings
+--       using hnsw ((embedding::vector(768)) vector_cosine_ops)
+--       where model_name = 'paraphrase-multilingual-mpnet-base-v2';
+create table if not exists public.document_chunk_embeddings (
+    chunk_id uuid not null references public.document_chunks(id) on delete cascade,
+    document_id uuid not null references public.knowledge_documents(id) on delete cascade,
+    model_name text not null,
+    embedding_dim integer not null,
+    embedding vector not null,
+    created_at timestamptz not null default timezone('utc', now()),
+    primary key (chunk_id, model_name)
+);
+
+create index if not exists idx_document_chunk_embeddings_model_document
+    on public.document_chunk_embeddings(model_name, document_id);
+
+create table if not exists public.memory_embeddings (
+    memory_table text not null check (memory_table in ('semantic_memory', 'episodic_memory')),
+    memory_id uuid not null,
+    user_id uuid not null references public.users(id) on delete cascade,
+    model_name text not null,
+    embedding_dim integer not null,
+    embedding vector not null,
+    created_at timestamptz not null default timezone('utc', now()),
+    primary key (memory_table, memory_id, model_name)
+);
+
+create index if not exists idx_memory_embeddings_model_user
+    on public.memory_embeddings(model_name, memory_table, user_id);
+
+-- 3. Búsqueda por modelo en las tablas laterales
+create or replace function match_document_chunk_embeddings(
+    query_embedding vector,
+    p_model_name text,
+    match_threshold float default 0.5,
+    match_count int default 10,
+    document_ids uuid[] default null
+)
+returns table (
+    id uuid,
+    document_id uuid,
+    chunk_index integer,
+    content text,
+    token_count integer,
+    similarity float
+)
+language plpgsql
+as $$
+begin
+    return query
+    select
+        dc.id,
+        dc.document_id,
+        dc.chunk_index,
+        dc.content,
+        dc.token_count,
+        1 - (dce.embedding <=> query_embedding) as similarity
+    from document_chunk_embeddings dce
+    inner join document_chunks dc on dc.id = dce.chunk_id
+    inner join knowledge_documents kd on dc.document_id = kd.id
+    where
+        dce.model_name = p_model_name
+        and kd.status = 'active'
+        and (document_ids is null or kd.id = any(document_ids))
+        and 1 - (dce.embedding <=> query_embedding) > match_threshold
+    order by dce.embedding <=> query_embedding
+    limit match_count;
+end;
+$$;
+
+create or replace function match_memory_embeddings(
+    query_embedding vector,
+    p_model_name text,
+    p_memory_table text,
+    match_user_id uuid,
+    match_threshold float default 0.5,
+    match_count int default 5
+)
+returns table (
+    id uuid,
+    content text,
+    similarity float
+)
+language plpgsql
+as $$
+begin
+    if p_memory_table = 'semantic_memory' then
+        return query
+        select
+            sm.id,
+            sm.fact,
+            1 - (me.embedding <=> query_embedding) as similarity
+        from memory_embeddings me
+        inner join semantic_memory sm on sm.id = me.memory_id
+        where me.memory_table = 'semantic_memory'
+          and me.model_name = p_model_name
+          and me.user_id = match_user_id
+          and 1 - (me.embedding <=> query_embedding) > match_threshold
+        order by me.embedding <=> query_embedding
+        limit match_count;
+    else
+        return query
+        select
+            em.id,
+            em.session_summary,
+            1 - (me.embedding <=> query_embedding) as similarity
+        from memory_embeddings me
+        inner join episodic_memory em on em.id = me.memory_id
+        where me.memory_table = 'episodic_memory'
+          and me.model_name = p_model_name
+          and me.user_id = match_user_id
+          and 1 - (me.embedding <=> query_embedding) > match_threshold
+        order by me.embedding <=> query_embedding
+        limit match_count;
+    end if;
+end;
+$$;
+
+-- Cobertura de cada modelo sobre los chunks existentes (para decidir el corte)
+create or replace function embedding_model_coverage()
+returns table (
+    model_name text,
+    embedding_dim integer,
+    chunk_count bigint
+)
+language sql
+as $$
+    select dc.embedding_model, dc.embedding_dim, count(*)
+    from document_chunks dc
+    where dc.embedding is not null and dc.embedding_model is not null
+    group by dc.embedding_model, dc.embedding_dim
+    union all
+    select dce.model_name, dce.embedding_dim, count(*)
+    from document_chunk_embeddings dce
+    group by dce.model_name, dce.embedding_dim;
+$$;
+
+-- 4. La deduplicación copia también los vectores de las tablas laterales
+create or replace function clone_document_chunks(
+    source_document_id uuid,
+    target_document_id uuid
+)
+returns int
+language plpgsql
+as $$
+declare
+    v_count int;
+begin
+    delete from document_chunks where document_id = target_document_id;
+
+    insert into document_chunks (document_id, chunk_index, content, embedding, embedding_model, embedding_dim, token_count)
+    select target_document_id, chunk_index, content, embedding, embedding_model, embedding_dim, token_count
+    from document_chunks
+    where document_id = source_document_id
+    order by chunk_index;
+
+    get diagnostics v_count = row_count;
+
+    insert into document_chunk_embeddings (chunk_id, document_id, model_name, embedding_dim, embedding)
+    select dst.id, target_document_id, dce.model_name, dce.embedding_dim, dce.embedding
+    from document_chunk_embeddings dce
+    inner join document_chunks src on src.id = dce.chunk_id
+    inner join document_chunks dst
+        on dst.document_id = target_document_id and dst.chunk_index = src.chunk_index
+    where src.document_id = source_document_id;
+
+    return v_count;
+end;
+$$;
+
+-- 5. Trabajos de re-embedding en la cola document_jobs
+alter table public.document_jobs
+    add column if not exists job_type text not null default 'process'
+        check (job_type in ('process', 'reembed')),
+    add column if not exists model_name text;
+
+drop index if exists idx_document_jobs_one_active_per_document;
+create unique index if not exists idx_document_jobs_one_active_per_document
+    on public.document_jobs(document_id, job_type, coalesce(model_name, ''))
+    where status in ('queued', 'leased');
+
+drop function if exists enqueue_document_job(uuid, int);
+create or replace function enqueue_document_job(
+    p_document_id uuid,
+    p_max_attempts int default 3,
+    p_job_type text default 'process',
+    p_model_name text default null
+)
+returns uuid
+language plpgsql
+as $$
+declare
+    v_job_id uuid;
+begin
+    insert into document_jobs (document_id, max_attempts, job_type, model_name)
+    values (p_document_id, p_max_attempts, p_job_type, p_model_name)
+    on conflict (document_id, job_type, coalesce(model_name, '')) where status in ('queued', 'leased') do nothing
+    returning id into v_job_id;
+
+    if v_job_id is null then
+        select id into v_job_id
+        from document_jobs
+        where document_id = p_document_id
+          and job_type = p_job_type
+          and coalesce(model_name, '') = coalesce(p_model_name, '')
+          and status in ('queued', 'leased')
+        limit 1;
+    end if;
+
+    return v_job_id;
+end;
+$$;
+
+-- Los trabajos 'reembed' no cambian el estado de procesamiento del documento
+create or replace function requeue_stale_document_jobs()
+returns int
+language plpgsql
+as $$
+declare
+    v_count int;
+begin
+    with stale as (
+        update document_jobs
+        set status = case when attempts < max_attempts then 'queued' else 'failed' end,
+            leased_by = null,
+            lease_expires_at = null,
+            last_error = coalesce(last_error, 'Lease expirado (worker interrumpido)'),
+            updated_at = timezone('utc', now())
+        where status = 'leased'
+          and lease_expires_at < timezone('utc', now())
+        returning document_id, status, job_type
+    ), docs as (
+        update knowledge_documents kd
+        set processing_status = case when stale.status = 'queued' then 'queued' else 'error' end,
+            processing_error = case when stale.status = 'queued' then kd.processing_error
+                                    else 'Procesamiento interrumpido demasiadas veces' end,
+            updated_at = timezone('utc', now())
+        from stale
+        where kd.id = stale.document_id
+          and stale.job_type = 'process'
+          and kd.processing_status = 'processing'
+        returning kd.id
+    )
+    select count(*) into v_count from stale;
+
+    return v_count;
+end;
+$$;
+
+grant all on public.document_chunk_embeddings to service_role;
+grant all on public.memory_embeddings to service_role;
@@ -0,0 +1,68 @@
+-- Búsqueda full-text en español sobre document_chunks (retrieval híbrido)
+-- La parte léxica complementa la búsqueda vectorial para términos exactos que
+-- MiniLM representa mal: siglas (NIE, TIE), nombres de visados, números de formulario.
+-- Los resultados se fusionan en el backend con Reciprocal Rank Fusion.
+
+alter table public.document_chunks
+    add column if not exists content_tsv tsvector
+        generated always as (to_tsvector('spanish', coalesce(content, ''))) stored;
+
+create index if not exists idx_document_chunks_content_tsv
+    on public.document_chunks using gin (content_tsv);
+
+-- Los términos de la query se combinan con OR para el ranking (una pregunta en
+-- lenguaje natural rara vez contiene todos sus términos en un mismo chunk);
+-- matches_all_terms indica si el chunk contiene todos (AND); query_terms cuántos lexemas
+-- quedan en la query tras quitar stopwords (una coincidencia de un solo término común no
+-- es evidencia suficiente).
+-- drop: el tipo de retorno cambió (query_terms) y create or replace no puede cambiarlo.
+drop function if exists search_document_chunks_text(text, int, uuid[]);
+create or replace function search_document_chunks_text(
+    query_text text,
+    match_count int default 10,
+    document_ids uuid[] default null
+)
+returns table (
+    id uuid,
+    document_id uuid,
+    chunk_index integer,
+    content text,
+    token_count integer,
+    text_rank float,
+    matches_all_terms boolean,
+    query_terms integer
+)
+language plpgsql
+as $$
+declare
+    v_all tsquery := plainto_tsquery('spanish', query_text);
+    v_any tsquery;
+    v_terms integer;
+begin
+    if numnode(v_all) = 0 then
+        return;
+    end if;
+    v_any := replace(v_all::text, ' & ', ' | ')::tsquery;
+    -- plainto_tsquery solo combina con &: n lexemas = (nodos + 1) / 2
+    v_terms := (numnode(v_all) + 1) / 2;
+
+    return query
+    select
+        dc.id,
+        dc.document_id,
+        dc.chunk_index,
+        dc.content,
+        dc.token_count,
+        ts_rank_cd(dc.content_tsv, v_any, 32)::float as text_rank,
+        dc.content_tsv @@ v_all as matches_all_terms,
+        v_terms as query_terms
+    from document_chunks dc
+    inner join knowledge_documents kd on dc.document_id = kd.id
+    where
+        kd.status = 'active'
+        and (document_ids is null or kd.id = any(document_ids))
+        and dc.content_tsv @@ v_any
+    order by text_rank desc
+    limit match_count;
+end;
+$$;
@@ -0,0 +1,89 @@
+-- Contabilidad de uso del LLM (tokens de prompt, de respuesta y servidos desde la
+-- caché de prefijos del proveedor), agregada por día, usuario, conversación, origen
+-- (chat, summary, ...) y modelo. El backend acumula en memoria y vuelca por lotes con
+-- record_llm_usage, así que cada fila es un contador, no una petición.
+
+create table if not exists public.llm_usage_daily (
+    usage_date date not null,
+    -- Sin FKs: el uso se conserva aunque se borre el usuario o la conversación, y un
+    -- usuario borrado con uso pendiente no hace fallar cada volcado del lote
+    user_id uuid,
+    conversation_id uuid,
+    source text not null,
+    model text not null,
+    request_count integer not null default 0,
+    prompt_tokens bigint not null default 0,
+    completion_tokens bigint not null default 0,
+    cached_tokens bigint not null default 0,
+    updated_at timestamptz not null default timezone('utc', now())
+);
+
+-- Instalaciones que ya aplicaron la versión con FK a users
+alter table public.llm_usage_daily drop constraint if exists llm_usage_daily_user_id_fkey;
+
+create unique index if not exists idx_llm_usage_daily_key
+    on public.llm_usage_daily (usage_date, user_id, conversation_id, source, model)
+    nulls not distinct;
+
+create index if not exists idx_llm_usage_daily_user_date on public.llm_usage_daily (user_id, usage_date);
+
+grant all on public.llm_usage_daily to service_role;
+
+-- Suma un lote de contadores: [{usage_date, user_id, conversation_id, source, model,
+-- request_count, prompt_tokens, completion_tokens, cached_tokens}, ...]
+create or replace function record_llm_usage(p_rows jsonb)
+returns void
+language sql
+as $$
+    insert into llm_usage_daily as u (
+        usage_date, user_id, conversation_id, source, model,
+        request_count, prompt_tokens, completion_tokens, cached_tokens
+    )
+    select
+        (r->>'usage_date')::date,
+        (r->>'user_id')::uuid,
+        (r->>'conversation_id')::uuid,
+        r->>'source',
+        r->>'model',
+        coalesce((r->>'request_count')::int, 0),
+        coalesce((r->>'prompt_tokens')::bigint, 0),
+        coalesce((r->>'completion_tokens')::bigint, 0),
+        coalesce((r->>'cached_tokens')::bigint, 0)
+    from jsonb_array_elements(p_rows) as r
+    on conflict (usage_date, user_id, conversation_id, source, model) do update set
+        request_count = u.request_count + excluded.request_count,
+        prompt_tokens = u.prompt_tokens + excluded.prompt_tokens,
+        completion_tokens = u.completion_tokens + excluded.completion_tokens,
+        cached_tokens = u.cached_tokens + excluded.cached_tokens,
+        updated_at = timezone('utc', now());
+$$;
+
+-- Uso por usuario y día (sumando conversaciones, orígenes y modelos)
+create or replace function llm_usage_by_user_day(
+    p_since date,
+    p_user_id uuid default null
+)
+returns table (
+    user_id uuid,
+    usage_date date,
+    request_count bigint,
+    prompt_tokens bigint,
+    completion_tokens bigint,
+    cached_tokens bigint
+)
+language sql
+stable
+as $$
+    select
+        u.user_id,
+        u.usage_date,
+        sum(u.request_count)::bigint,
+        sum(u.prompt_tokens)::bigint,
+        sum(u.completion_tokens)::bigint,
+        sum(u.cached_tokens)::bigint
+    from llm_usage_daily u
+    where u.usage_date >= p_since
+        and (p_user_id is null or u.user_id = p_user_id)
+    group by u.user_id, u.usage_date
+    order by u.usage_date desc, sum(u.prompt_tokens + u.completion_tokens) desc;
+$$;
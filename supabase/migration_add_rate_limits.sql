@@ -0,0 +1,92 @@
+-- Estado compartido de los límites de /chat/send cuando hay varias réplicas de la API
+-- (CHAT_RATE_LIMIT_BACKEND=supabase). Con una sola réplica basta el backend en memoria.
+
+-- Token bucket por clave (p. ej. 'chat:<user_id>')
+create table if not exists public.rate_limit_buckets (
+    key text primary key,
+    tokens double precision not null,
+    updated_at timestamptz not null default clock_timestamp()
+);
+
+-- Streams en curso; los slots caducan por si un proceso muere sin liberarlos
+create table if not exists public.stream_slots (
+    id uuid primary key default uuid_generate_v4(),
+    key text not null,
+    expires_at timestamptz not null
+);
+
+create index if not exists idx_stream_slots_key on public.stream_slots (key, expires_at);
+
+grant all on public.rate_limit_buckets to service_role;
+grant all on public.stream_slots to service_role;
+
+-- Consume un token: devuelve 0 si se concedió, o los segundos hasta el siguiente token
+create or replace function take_rate_limit_token(
+    p_key text,
+    p_rate double precision,
+    p_capacity double precision
+)
+returns double precision
+language plpgsql
+as $$
+declare
+    v_now timestamptz := clock_timestamp();
+    v_tokens double precision;
+begin
+    insert into rate_limit_buckets (key, tokens, updated_at)
+    values (p_key, p_capacity, v_now)
+    on conflict (key) do nothing;
+
+    select least(p_capacity, b.tokens + extract(epoch from (v_now - b.updated_at)) * p_rate)
+    into v_tokens
+    from rate_limit_buckets b
+    where b.key = p_key
+    for update;
+
+    if v_tokens >= 1 then
+        update rate_limit_buckets set tokens = v_tokens - 1, updated_at = v_now where key = p_key;
+        return 0;
+    end if;
+
+    update rate_limit_buckets set tokens = v_tokens, updated_at = v_now where key = p_key;
+    if p_rate <= 0 then
+        return 60;
+    end if;
+    return (1 - v_tokens) / p_rate;
+end;
+$$;
+
+-- Ocupa un slot de stream: devuelve su id, o null si la clave ya tiene p_limit activos
+create or replace function acquire_stream_slot(
+    p_key text,
+    p_limit int,
+    p_lease_seconds double precision
+)
+returns uuid
+language plpgsql
+as $$
+declare
+    v_slot_id uuid;
+begin
+    -- Serializar por clave para que dos peticiones simultáneas no superen el límite
+    perform pg_advisory_xact_lock(hashtext(p_key));
+
+    delete from stream_slots where key = p_key and expires_at <= clock_timestamp();
+
+    if (select count(*) from stream_slots where key = p_key) >= p_limit then
+        return null;
+    end if;
+
+    insert into stream_slots (key, expires_at)
+    values (p_key, clock_timestamp() + make_interval(secs => p_lease_seconds))
+    returning id into v_slot_id;
+    return v_slot_id;
+end;
+$$;
+
+create or replace function release_stream_slot(p_slot_id uuid)
+returns void
+language sql
+as $$
+    delete from stream_slots where id = p_slot_id;
+$$;